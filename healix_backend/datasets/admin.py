@@ -2,8 +2,9 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Patient, Condition, Observation
+from .models import Patient, Condition, Observation, IngestionJob
 
 admin.site.register(Patient)
 admin.site.register(Condition)
 admin.site.register(Observation)
+admin.site.register(IngestionJob)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DatasetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'datasets'
+
+    def ready(self):
+        from . import snapshot, versioning, vitals  # noqa: F401
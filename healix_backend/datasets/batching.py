@@ -0,0 +1,17 @@
+"""
+Batching of ``IN (...)`` lookups over long lists of values.
+
+Every value of an ``__in`` filter is a bound parameter, and SQLite caps the
+parameters of one statement (999 before 3.32), so code filtering on an
+unbounded list of patient IDs or descriptions queries it ``IN_BATCH_SIZE``
+values at a time with ``batched``.
+"""
+
+IN_BATCH_SIZE = 500
+
+
+def batched(values, size=IN_BATCH_SIZE):
+    """Consecutive lists of at most ``size`` items of ``values``."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
@@ -0,0 +1,210 @@
+"""
+Streaming table exports.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` (a
+server-side cursor on PostgreSQL) and encoded one chunk at a time, so an
+export holds at most ``HEALIX_EXPORT_CHUNK_SIZE`` rows in memory however large
+the table is. No model instances or serializers are involved.
+
+Supported formats are CSV, NDJSON (one JSON object per line), Parquet (one
+row group per chunk) and the Arrow IPC stream format.
+"""
+
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from healix_backend.lazy import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+DEFAULT_CHUNK_SIZE = 10000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Formats that compress their own contents
+COMPRESSED_FORMATS = {"parquet"}
+
+
+class ExportError(ValueError):
+    """Raised for export parameters that cannot be honoured."""
+
+
+def get_chunk_size():
+    return getattr(settings, "HEALIX_EXPORT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def export_columns(model):
+    """Column names of ``model`` as stored, e.g. ``patient_id`` for a foreign key."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def select_columns(model, fields=None):
+    """All export columns of ``model``, or the comma-separated subset ``fields``."""
+    columns = export_columns(model)
+    if not fields:
+        return columns
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(selected) - set(columns))
+    if unknown:
+        raise ExportError(
+            f"Unknown fields: {', '.join(unknown)}. "
+            f"Available fields: {', '.join(columns)}."
+        )
+    return selected
+
+
+def apply_filters(queryset, filters, params):
+    """
+    Narrow ``queryset`` with the query ``params`` named in ``filters``, a map
+    of parameter name to ORM lookup. ``__in`` lookups take comma-separated
+    values and date lookups ISO dates.
+    """
+    for param, lookup in filters.items():
+        value = params.get(param)
+        if value in (None, ""):
+            continue
+        if lookup.endswith("__in"):
+            value = [item for item in value.split(",") if item]
+        elif lookup.endswith(("__gte", "__lte")):
+            try:
+                parsed = parse_date(value)
+            except ValueError:  # Well-formed but invalid, e.g. 2020-02-30
+                parsed = None
+            if parsed is None:
+                raise ExportError(f"'{param}' must be a date (YYYY-MM-DD).")
+            value = parsed
+        queryset = queryset.filter(**{lookup: value})
+    return queryset
+
+
+def iter_chunks(queryset, columns, chunk_size=None):
+    """Lists of up to ``chunk_size`` row tuples, read through one cursor."""
+    chunk_size = chunk_size or get_chunk_size()
+    rows = queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Header of an empty export
+        yield buffer.getvalue().encode()
+
+
+def stream_ndjson(chunks, columns):
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield "".join(
+            encoder.encode(dict(zip(columns, row))) + "\n" for row in chunk
+        ).encode()
+
+
+class _Drain:
+    """Write-only file object whose contents are handed out as they arrive."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def arrow_schema(model, columns):
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    types = {
+        "AutoField": pa.int64(),
+        "BigAutoField": pa.int64(),
+        "BigIntegerField": pa.int64(),
+        "IntegerField": pa.int64(),
+        "FloatField": pa.float64(),
+        "DateField": pa.date32(),
+        "DateTimeField": pa.timestamp("us", tz="UTC"),
+    }
+    schema = []
+    for name in columns:
+        field = fields[name]
+        if field.is_relation:
+            field = field.target_field
+        schema.append((name, types.get(field.get_internal_type(), pa.string())))
+    return pa.schema(schema)
+
+
+def record_batches(chunks, schema):
+    for chunk in chunks:
+        yield pa.record_batch(
+            [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*chunk), schema)
+            ],
+            schema=schema,
+        )
+
+
+def stream_parquet(chunks, schema):
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for batch in record_batches(chunks, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()  # Footer
+
+
+def stream_arrow(chunks, schema):
+    sink = _Drain()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in record_batches(chunks, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()  # End-of-stream marker
+
+
+def stream_export(queryset, columns, export_format, chunk_size=None):
+    """Encoded byte chunks of ``columns`` of ``queryset`` in ``export_format``."""
+    chunks = iter_chunks(queryset, columns, chunk_size)
+    if export_format == "csv":
+        return stream_csv(chunks, columns)
+    if export_format == "ndjson":
+        return stream_ndjson(chunks, columns)
+    schema = arrow_schema(queryset.model, columns)
+    if export_format == "parquet":
+        return stream_parquet(chunks, schema)
+    return stream_arrow(chunks, schema)
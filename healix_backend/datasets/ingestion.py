@@ -0,0 +1,745 @@
+"""
+Bulk ingestion engine for Synthea CSV datasets.
+
+Each loader turns a raw Synthea DataFrame into model-ready columns using
+whole-column pandas operations, validates the result batch by batch and writes
+it with ``bulk_create`` in chunks, one transaction per chunk.
+"""
+
+import io
+import re
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from healix_backend.lazy import lazy_import
+
+from .models import Patient, Condition, Observation
+from .signals import dataset_loaded, rows_written
+from .versioning import bump_dataset_version
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PATIENT_CACHE_SIZE = 100000
+MAX_BATCH_SIZE = 50000
+MISSING_VALUE_TOKENS = ["N/A", "NULL", "Missing", "Unknown", ""]
+FIRST_TOKEN_RE = re.compile(r"^(\S+)")  # Value without trailing units
+PREFIX_RE = re.compile(r"^[<>=]")  # Comparison prefix such as ">150"
+INGEST_MODES = ("insert", "upsert")
+MAX_REPORTED_ERRORS = 20  # Cap on row-level errors echoed back to the client
+
+
+class IngestionError(Exception):
+    """
+    Raised when an uploaded dataset fails validation.
+    ``detail`` is returned to the client as the body of a 400 response.
+    """
+
+    def __init__(self, detail):
+        super().__init__(str(detail))
+        self.detail = detail
+
+
+class IngestionStats:
+    """
+    Running totals for a single ingestion, reported back to the client.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.chunks = 0
+        self.skipped = 0  # Rows not written, duplicates included
+        # Rows repeating a natural key earlier in the upload, or in insert
+        # mode one that is already stored
+        self.duplicates = 0
+        self.unchanged = 0  # Upsert rows identical to what is stored
+        self.bytes_read = None  # Set by readers that track their file position
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add_chunk(self, rows, skipped=0, duplicates=0):
+        self.rows += rows
+        self.chunks += 1
+        self.skipped += skipped + duplicates
+        self.duplicates += duplicates
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def seconds(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "skipped_rows": self.skipped,
+            "duplicate_rows": self.duplicates,
+            "unchanged_rows": self.unchanged,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def get_batch_size(value=None):
+    """
+    Resolve the chunk size from an explicit value (e.g. a query parameter),
+    falling back to ``HEALIX_INGEST_BATCH_SIZE`` and clamping to a sane range.
+    """
+    if value in (None, ""):
+        value = getattr(settings, "HEALIX_INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    try:
+        batch_size = int(value)
+    except (TypeError, ValueError):
+        raise IngestionError({"error": f"Invalid batch_size: {value!r}."})
+    return max(1, min(batch_size, MAX_BATCH_SIZE))
+
+
+def get_mode(value=None):
+    """Validate the ingestion mode, defaulting to a plain ``insert``."""
+    mode = value or "insert"
+    if mode not in INGEST_MODES:
+        raise IngestionError(
+            {
+                "error": f"Invalid mode {mode!r}; expected one of {', '.join(INGEST_MODES)}."
+            }
+        )
+    return mode
+
+
+def parse_bool(value, default=None):
+    """Interpret a query-parameter style flag; ``None``/empty returns ``default``."""
+    if value in (None, ""):
+        return default
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def clean_observation_value(value_str):
+    """
+    Cleans and converts a string value from the observation dataset to a float or None.
+    Handles various formats including comma decimal separators, thousands separators,
+    units attached, non-numeric prefixes, and missing value representations.
+    """
+    if pd.isna(value_str) or value_str in MISSING_VALUE_TOKENS:
+        return None  # Handle missing values
+
+    value_text = str(
+        value_str
+    ).strip()  # Convert to string and remove leading/trailing whitespace
+
+    # Remove units if present (assuming unit is separated by space and at the end)
+    parts = value_text.split()
+    numeric_part_str = parts[0]
+
+    # Remove thousands separators (commas and spaces)
+    numeric_part_str = numeric_part_str.replace(",", "").replace(" ", "")
+
+    # Replace comma decimal separator with period
+    numeric_part_str = numeric_part_str.replace(",", ".")
+
+    # Remove non-numeric prefixes like ">" or "<" (simply take the number after)
+    if (
+        numeric_part_str.startswith(">")
+        or numeric_part_str.startswith("<")
+        or numeric_part_str.startswith("=")
+    ):
+        numeric_part_str = numeric_part_str[1:]  # Remove the first character
+
+    try:
+        return float(numeric_part_str)
+    except ValueError:
+        return None  # Return None if still cannot convert to float
+
+
+def clean_observation_values(series):
+    """
+    Column-level equivalent of ``clean_observation_value``.
+
+    The column is factorized so each distinct raw value is cleaned once, and the
+    cleaning itself runs as pandas string operations over those uniques: take
+    the first whitespace-separated token, drop commas, strip a single leading
+    ``<``, ``>`` or ``=``, then parse with ``pd.to_numeric``. The few tokens
+    ``pd.to_numeric`` rejects but ``float()`` accepts (e.g. ``1_000``) go
+    through ``float()`` so results match the scalar function exactly.
+    Returns a nullable ``Float64`` Series aligned with ``series``.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    raw = pd.Series(uniques, dtype=object)
+
+    token = raw.astype("string").str.strip().str.extract(FIRST_TOKEN_RE, expand=False)
+    token = token.str.replace(",", "", regex=False)
+    token = token.str.replace(PREFIX_RE, "", regex=True)
+    cleaned = pd.to_numeric(token, errors="coerce").astype("float64")
+
+    leftover = cleaned.isna() & token.notna()
+    if leftover.any():
+        cleaned[leftover] = [_to_float(t) for t in token[leftover]]
+    cleaned[raw.isin(MISSING_VALUE_TOKENS)] = np.nan
+
+    # Append the value for the NA sentinel (-1) so ``codes`` index it directly
+    values = np.append(cleaned.to_numpy(dtype="float64"), np.nan)
+    return pd.Series(values[codes], index=series.index, dtype="Float64")
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def parse_dates(series):
+    """Parse a column of ISO-8601 date/datetime strings into UTC timestamps."""
+    return pd.to_datetime(series, errors="coerce", utc=True, format="ISO8601")
+
+
+def to_records(frame, columns):
+    """Yield row tuples for ``columns`` with every missing value turned into None."""
+    subset = frame[columns].astype(object)
+    subset = subset.where(subset.notna(), None)
+    return subset.itertuples(index=False, name=None)
+
+
+class PatientResolver:
+    """
+    Resolves ``PATIENT`` references in bulk.
+
+    Each batch of distinct IDs not seen before is checked with a single
+    ``id__in`` query. Known IDs are kept in a bounded LRU so later chunks that
+    reuse the same patients issue no query at all, and IDs that do not exist
+    are collected in ``missing`` so they can be reported together at the end.
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = getattr(
+                settings, "HEALIX_PATIENT_CACHE_SIZE", DEFAULT_PATIENT_CACHE_SIZE
+            )
+        self.max_size = max_size
+        self.known = OrderedDict()
+        self.missing = set()
+        self.queries = 0
+
+    def resolve(self, patient_ids):
+        """Return the subset of ``patient_ids`` that do not exist."""
+        unknown = []
+        for patient_id in set(patient_ids):
+            if patient_id in self.known:
+                self.known.move_to_end(patient_id)
+            elif patient_id not in self.missing:
+                unknown.append(patient_id)
+        if unknown:
+            self.queries += 1
+            found = set(
+                Patient.objects.filter(id__in=unknown).values_list("id", flat=True)
+            )
+            for patient_id in found:
+                self.remember(patient_id)
+            # Not the LRU, which may already have evicted some of found
+            self.missing.update(set(unknown) - found)
+        return self.missing.intersection(patient_ids)
+
+    def remember(self, patient_id):
+        self.known[patient_id] = None
+        self.known.move_to_end(patient_id)
+        while len(self.known) > self.max_size:
+            self.known.popitem(last=False)
+
+
+class KeyHashes:
+    """
+    64-bit hashes of the natural keys written so far in an upload, kept as
+    sorted runs that are merged as they grow: 8 bytes per key and at most
+    about log2(keys) runs to search.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes):
+        run = np.unique(hashes)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.union1d(self.runs.pop(), run)
+        if len(run):
+            self.runs.append(run)
+
+
+class CSVLoader:
+    """
+    Base class for loading one Synthea CSV table into its model.
+
+    Subclasses declare the source columns they need and implement ``prepare``
+    (vectorized cleaning into model field columns) and ``build`` (model
+    instances for ``bulk_create``).
+    """
+
+    model = None
+    required_columns = ()
+    date_columns = {}  # model field -> source CSV column
+    label = "rows"
+    resolves_patients = False
+    natural_key = ()  # Columns identifying a row across re-imports
+    update_fields = ()  # Columns an upsert may change for an existing key
+
+    def __init__(self, batch_size=None, resolver=None, progress=None, mode=None):
+        self.batch_size = get_batch_size(batch_size)
+        self.mode = get_mode(mode)
+        self.resolver = resolver or PatientResolver()
+        self.progress = progress  # Called with IngestionStats after each chunk
+        self.written_keys = KeyHashes()  # Upsert mode; a loader per upload
+
+    def load(self, df):
+        """Validate and persist an in-memory ``df`` chunk by chunk."""
+        return self.load_chunks(
+            df.iloc[start : start + self.batch_size]
+            for start in range(0, max(len(df), 1), self.batch_size)
+        )
+
+    def load_csv(self, file_obj, streaming=None):
+        """
+        Ingest a CSV file object. In streaming mode (the default) the file is
+        read ``batch_size`` rows at a time and only the required columns are
+        kept, so peak memory is bounded by the chunk size, not the file size.
+        """
+        if streaming is None:
+            streaming = getattr(settings, "HEALIX_INGEST_STREAMING", True)
+        if not streaming:
+            return self.load(pd.read_csv(file_obj))
+        return self.load_chunks(self.read_chunks(file_obj))
+
+    def read_chunks(self, file_obj):
+        """Yield DataFrame chunks of the required columns from ``file_obj``."""
+        wanted = set(self.required_columns)
+        return pd.read_csv(
+            file_obj,
+            chunksize=self.batch_size,
+            usecols=lambda column: column in wanted,
+            dtype=str,
+        )
+
+    def load_chunks(self, chunks):
+        """
+        Validate and persist each chunk in its own transaction, returning
+        ``IngestionStats``. Chunks are consumed lazily and dropped once written.
+        """
+        stats = IngestionStats()
+        checked = False
+        for chunk in chunks:
+            if not checked:
+                self.check_columns(chunk)
+                checked = True
+            if chunk.empty:
+                continue
+            self.persist(self.clean(chunk), stats)
+        return self.finish(stats)
+
+    def clean(self, chunk):
+        """
+        Turn a raw CSV chunk into a validated frame of model columns. This step
+        touches no database, so it can run in worker processes.
+        """
+        frame = self.prepare(chunk)
+        self.validate(frame, chunk)
+        return frame
+
+    def persist(self, frame, stats):
+        """Write a cleaned frame in its own transaction and update ``stats``."""
+        frame, skipped = self.drop_unknown_patients(frame)
+        rows = len(frame)
+        previous = None
+        if self.mode == "upsert":
+            frame, duplicates = self.drop_repeated(frame)
+            frame, unchanged, previous = self.drop_unchanged(frame)
+            stats.unchanged += unchanged
+        else:
+            frame, duplicates = self.drop_existing(frame)
+        if not frame.empty:
+            try:
+                with transaction.atomic():
+                    self.write(frame)
+                    rows_written.send(
+                        sender=type(self),
+                        kind=self.label,
+                        mode=self.mode,
+                        frame=frame,
+                        previous=previous,
+                    )
+                    # Last, so the version row stays locked only until commit
+                    bump_dataset_version()
+            except IntegrityError as e:
+                # Stored keys were dropped above, so only a concurrent upload of
+                # the same rows gets here; the chunk is rolled back as a whole
+                raise IngestionError(
+                    {
+                        "error": f"Some {self.label} were written concurrently by "
+                        "another upload; re-upload with ?mode=upsert to merge them.",
+                        "detail": str(e),
+                    }
+                )
+        stats.add_chunk(rows, skipped, duplicates)
+        if self.progress is not None:
+            self.progress(stats)
+
+    def stored_rows(self, frame, columns=()):
+        """
+        Natural keys and ``columns`` of the stored rows whose key parts all
+        occur in ``frame`` (one query; a superset of the exact key matches).
+        """
+        key = list(self.natural_key)
+        lookup = Q()
+        for column in key:
+            values = frame[column]
+            condition = Q(**{f"{column}__in": values.dropna().unique().tolist()})
+            if values.isna().any():
+                condition |= Q(**{f"{column}__isnull": True})
+            lookup &= condition
+        return pd.DataFrame.from_records(
+            self.model.objects.filter(lookup).values_list(*key, *columns),
+            columns=key + list(columns),
+        )
+
+    def drop_existing(self, frame):
+        """
+        Insert mode: return ``frame`` without the rows whose natural key is
+        already stored or repeats an earlier row, plus how many were dropped.
+        The first row of a key wins whether or not a later duplicate falls in
+        the same chunk, so results do not depend on the batch size. Rows with
+        a missing key part are never duplicates, like in the unique constraint.
+        """
+        if not self.natural_key or frame.empty:
+            return frame, 0
+        key = list(self.natural_key)
+        complete = frame[key].notna().all(axis=1).to_numpy()
+        repeated = complete & frame.duplicated(key, keep="first").to_numpy()
+        positions = np.flatnonzero(complete & ~repeated)
+        if len(positions):
+            candidates = frame.iloc[positions]
+            stored = self.stored_rows(candidates).drop_duplicates()
+            found = candidates[key].merge(stored, on=key, how="left", indicator=True)
+            repeated[positions[found["_merge"].eq("both").to_numpy()]] = True
+        return frame[~repeated], int(repeated.sum())
+
+    def drop_repeated(self, frame):
+        """
+        Upsert mode: return ``frame`` without the rows whose natural key
+        repeats an earlier row of the upload, plus how many were dropped. As
+        in insert mode the first row of a key wins, in any chunk. Missing key
+        parts compare equal, as in ``drop_unchanged``.
+        """
+        if not self.natural_key or frame.empty:
+            return frame, 0
+        key = list(self.natural_key)
+        hashes = pd.util.hash_pandas_object(frame[key], index=False).to_numpy()
+        repeated = frame.duplicated(key, keep="first").to_numpy()
+        repeated |= self.written_keys.contains(hashes)
+        self.written_keys.add(hashes[~repeated])
+        return frame[~repeated], int(repeated.sum())
+
+    def drop_unchanged(self, frame):
+        """
+        Compare ``frame`` with the stored rows sharing its natural keys (one
+        query) and return only new or changed rows, the unchanged count, and
+        the stored natural keys and ``update_fields`` of the changed rows.
+        """
+        key = list(self.natural_key)
+        compare = list(self.update_fields)
+        existing = self.stored_rows(frame, compare)
+        if existing.empty:
+            return frame, 0, existing
+        # Match missing key parts (NaT/NA vs the database's None) as equal,
+        # since the unique constraint itself does not cover NULLs.
+        left = frame.copy()
+        left[key] = left[key].astype(object).where(left[key].notna(), None)
+        merged = left.merge(
+            existing, on=key, how="left", suffixes=("", "_stored"), indicator=True
+        )
+        unchanged = merged["_merge"].eq("both")
+        for column in compare:
+            new, old = merged[column], merged[f"{column}_stored"]
+            unchanged &= new.eq(old).fillna(False).astype(bool) | (
+                new.isna() & old.isna()
+            )
+        changed = frame[~unchanged.to_numpy()]
+        stored = {f"{column}_stored": column for column in compare}
+        previous = merged.loc[
+            ~unchanged & merged["_merge"].eq("both"), key + list(stored)
+        ].rename(columns=stored)
+        return changed, len(frame) - len(changed), previous.reset_index(drop=True)
+
+    def finish(self, stats):
+        stats.finish()
+        # Rows were committed chunk by chunk, so listeners are told even if
+        # the upload is about to be reported as partially failed
+        dataset_loaded.send(
+            sender=type(self), kind=self.label, mode=self.mode, stats=stats
+        )
+        self.report_missing_patients(stats)
+        return stats
+
+    def drop_unknown_patients(self, frame):
+        """
+        Remove rows whose patient does not exist, returning the remaining
+        frame and the number of rows dropped.
+        """
+        if not self.resolves_patients:
+            return frame, 0
+        patient_ids = frame["patient_id"]
+        missing = self.resolver.resolve(patient_ids.dropna().unique().tolist())
+        keep = patient_ids.notna() & ~patient_ids.isin(missing)
+        return frame[keep], int((~keep).sum())
+
+    def report_missing_patients(self, stats):
+        """Raise once, after every chunk is processed, if any patient was unknown."""
+        # Rows skipped for anything but a repeated key lacked a patient
+        unresolved = stats.skipped - stats.duplicates
+        if self.resolves_patients and (self.resolver.missing or unresolved):
+            raise IngestionError(
+                {
+                    "error": f"Patients not found for {self.label}; "
+                    "rows referencing them were skipped.",
+                    "missing_patient_ids": sorted(self.resolver.missing),
+                    **stats.as_dict(),
+                }
+            )
+
+    def write(self, frame):
+        """
+        Persist one prepared chunk. Inserts on PostgreSQL use a single ``COPY``
+        of the whole frame and other backends fall back to ``bulk_create``;
+        upserts use ``bulk_create`` with ``ON CONFLICT`` on the natural key.
+        """
+        if self.mode == "upsert":
+            self.upsert(frame)
+        elif connection.vendor == "postgresql" and getattr(
+            settings, "HEALIX_INGEST_USE_COPY", True
+        ):
+            self.copy(frame)
+        else:
+            self.model.objects.bulk_create(
+                self.build(frame), batch_size=self.batch_size
+            )
+
+    def upsert(self, frame):
+        """Insert new rows and overwrite ``update_fields`` of existing keys."""
+        options = {"ignore_conflicts": True}
+        if self.update_fields:
+            options = {
+                "update_conflicts": True,
+                "unique_fields": [
+                    field.removesuffix("_id") for field in self.natural_key
+                ],
+                "update_fields": list(self.update_fields),
+            }
+        self.model.objects.bulk_create(
+            self.build(frame), batch_size=self.batch_size, **options
+        )
+
+    def copy(self, frame):
+        """Stream ``frame`` into the model table with ``COPY ... FROM STDIN``."""
+        columns = list(frame.columns)
+        buffer = io.StringIO()
+        frame[columns].to_csv(buffer, index=False, header=False, na_rep="")
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+            quote(self.model._meta.db_table), ", ".join(quote(c) for c in columns)
+        )
+        # copy_expert bypasses the cursor wrapper, which turns driver errors
+        # into django.db ones (IntegrityError for a concurrent upload)
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.copy_expert(sql, buffer)
+
+    def check_columns(self, df):
+        missing = [col for col in self.required_columns if col not in df.columns]
+        if missing:
+            raise IngestionError(
+                {"error": f"Missing required columns: {', '.join(missing)}."}
+            )
+
+    def prepare(self, chunk):
+        raise NotImplementedError
+
+    def build(self, frame):
+        raise NotImplementedError
+
+    def validate(self, frame, chunk):
+        """
+        Batch equivalent of the per-row serializer checks: dates must parse and
+        strings must fit their column. All offending rows are reported at once.
+        """
+        errors = []
+        for column, source in self.date_columns.items():
+            raw = chunk[source]
+            bad = frame.index[frame[column].isna() & raw.notna()]
+            errors.extend(
+                f"Row {i + 2}: invalid date {raw.loc[i]!r} in {source}." for i in bad
+            )
+        for field in self.model._meta.concrete_fields:
+            max_length = getattr(field, "max_length", None)
+            column = field.attname
+            if not max_length or column not in frame.columns:
+                continue
+            lengths = frame[column].astype("string").str.len()
+            bad = frame.index[lengths.gt(max_length).fillna(False)]
+            errors.extend(
+                f"Row {i + 2}: {column} is longer than {max_length} characters."
+                for i in bad
+            )
+        if errors:
+            raise IngestionError(
+                {
+                    "error": "Invalid rows in upload.",
+                    "rows": errors[:MAX_REPORTED_ERRORS],
+                }
+            )
+
+
+class PatientLoader(CSVLoader):
+    model = Patient
+    required_columns = ("Id", "BIRTHDATE", "GENDER")
+    date_columns = {"birthdate": "BIRTHDATE"}
+    label = "patients"
+    natural_key = ("id",)
+    update_fields = ("gender", "birthdate", "age")
+
+    def prepare(self, chunk):
+        birth = parse_dates(chunk["BIRTHDATE"])
+        frame = pd.DataFrame(
+            {
+                "id": chunk["Id"],
+                "gender": chunk["GENDER"],
+                "birthdate": birth.dt.date,
+                "age": (pd.Timestamp.today().year - birth.dt.year).astype("Int64"),
+            },
+            index=chunk.index,
+        )
+        return frame
+
+    def validate(self, frame, chunk):
+        super().validate(frame, chunk)
+        ids = frame["id"]
+        if ids.isna().any():
+            raise IngestionError({"error": "Patient Id is required."})
+        duplicated = sorted(ids[ids.duplicated()].unique().tolist())
+        if duplicated:
+            raise IngestionError(
+                {
+                    "error": "Patient IDs are repeated in the upload.",
+                    "duplicate_patient_ids": duplicated[:MAX_REPORTED_ERRORS],
+                }
+            )
+
+    def drop_existing(self, frame):
+        # A patient ID is never skipped: re-imports must use upsert mode
+        existing = sorted(
+            Patient.objects.filter(id__in=frame["id"].tolist()).values_list(
+                "id", flat=True
+            )
+        )
+        if existing:
+            raise IngestionError(
+                {
+                    "error": "Patients with these IDs already exist.",
+                    "duplicate_patient_ids": existing[:MAX_REPORTED_ERRORS],
+                }
+            )
+        return frame, 0
+
+    def build(self, frame):
+        return [
+            Patient(id=id_, gender=gender, birthdate=birthdate, age=age)
+            for id_, gender, birthdate, age in to_records(
+                frame, ["id", "gender", "birthdate", "age"]
+            )
+        ]
+
+
+class ConditionLoader(CSVLoader):
+    model = Condition
+    required_columns = ("PATIENT", "START", "DESCRIPTION")
+    date_columns = {"start_date": "START"}
+    label = "conditions"
+    resolves_patients = True
+    natural_key = ("patient_id", "description", "start_date")
+
+    def prepare(self, chunk):
+        frame = pd.DataFrame(
+            {
+                "patient_id": chunk["PATIENT"],
+                "description": chunk["DESCRIPTION"],
+                "start_date": parse_dates(chunk["START"]).dt.date,
+            },
+            index=chunk.index,
+        )
+        return frame
+
+    def build(self, frame):
+        return [
+            Condition(patient_id=patient_id, description=description, start_date=start)
+            for patient_id, description, start in to_records(
+                frame, ["patient_id", "description", "start_date"]
+            )
+        ]
+
+
+class ObservationLoader(CSVLoader):
+    model = Observation
+    required_columns = ("PATIENT", "DATE", "DESCRIPTION", "VALUE", "UNITS")
+    date_columns = {"date": "DATE"}
+    label = "observations"
+    resolves_patients = True
+    natural_key = ("patient_id", "description", "date")
+    update_fields = ("value", "units")
+
+    def prepare(self, chunk):
+        frame = pd.DataFrame(
+            {
+                "patient_id": chunk["PATIENT"],
+                "description": chunk["DESCRIPTION"],
+                "value": clean_observation_values(chunk["VALUE"]),
+                "units": chunk["UNITS"],
+                "date": parse_dates(chunk["DATE"]).dt.date,
+            },
+            index=chunk.index,
+        )
+        return frame
+
+    def build(self, frame):
+        return [
+            Observation(
+                patient_id=patient_id,
+                description=description,
+                value=value,
+                units=units,
+                date=date,
+            )
+            for patient_id, description, value, units, date in to_records(
+                frame, ["patient_id", "description", "value", "units", "date"]
+            )
+        ]
+
+
+LOADERS = {
+    "patients": PatientLoader,
+    "conditions": ConditionLoader,
+    "observations": ObservationLoader,
+}
@@ -0,0 +1,230 @@
+"""
+Background execution of dataset uploads.
+
+Upload actions save the file under ``HEALIX_UPLOAD_DIR``, record an
+``IngestionJob`` and hand its ID to a local worker pool. The worker streams the
+file through the matching loader and writes progress back to the job row,
+which clients poll through the jobs endpoint.
+
+Each pool lives in the process that queued its jobs, so jobs left queued or
+running by a process that has exited will never finish. Starting a pool marks
+those of this host failed and removes their files (``fail_orphaned_jobs``);
+process IDs mean nothing across hosts or containers, whose jobs are left to
+their own pools. ``worker_pool_started`` lets other apps queuing work on the
+pool (scoring runs) do the same with ``owner`` and ``orphaned``.
+"""
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from healix_backend import metrics
+
+from .ingestion import LOADERS, IngestionError
+from .models import IngestionJob
+from .parallel import get_workers, ingest_parallel
+from .signals import worker_pool_started
+
+DEFAULT_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the process-wide worker pool, creating it on first use.
+
+    ``HEALIX_INGEST_EXECUTOR`` selects ``"process"`` (default), ``"thread"``
+    or ``"inline"`` (run in the request, mainly for tests), and
+    ``HEALIX_INGEST_WORKERS`` the number of uploads the pool runs at once.
+    """
+    global _executor
+    kind = getattr(settings, "HEALIX_INGEST_EXECUTOR", "process")
+    if kind == "inline":
+        return None
+    with _executor_lock:
+        if _executor is None:
+            fail_orphaned_jobs()
+            worker_pool_started.send(sender=get_executor)
+            workers = getattr(settings, "HEALIX_INGEST_WORKERS", DEFAULT_WORKERS)
+            if kind == "thread":
+                _executor = ThreadPoolExecutor(max_workers=workers)
+            else:
+                # Spawned workers start clean and set Django up themselves, so
+                # they never share the parent's database connections.
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=django.setup,
+                )
+        return _executor
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but owned by another user
+        return True
+    return True
+
+
+def owner():
+    """``owner_host`` and ``owner_pid`` of work queued by this process."""
+    return {"owner_host": socket.gethostname(), "owner_pid": os.getpid()}
+
+
+def orphaned(queryset):
+    """
+    The rows of ``queryset`` (with ``owner_host`` and ``owner_pid`` fields)
+    queued on this host by a process that has exited.
+    """
+    return [
+        row
+        for row in queryset.filter(owner_host=socket.gethostname())
+        if row.owner_pid is None or not _process_exists(row.owner_pid)
+    ]
+
+
+def fail_orphaned_jobs():
+    """
+    Mark queued or running jobs of this host whose owning process has exited
+    as failed and delete their files; returns how many there were.
+    """
+    jobs = orphaned(
+        IngestionJob.objects.filter(
+            status__in=[IngestionJob.QUEUED, IngestionJob.RUNNING]
+        )
+    )
+    for job in jobs:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        job.status = IngestionJob.FAILED
+        job.finished_at = timezone.now()
+        job.errors = {"error": "The server stopped before the upload finished."}
+        job.save(update_fields=["status", "finished_at", "errors"])
+    return len(jobs)
+
+
+def get_upload_dir():
+    upload_dir = Path(
+        getattr(settings, "HEALIX_UPLOAD_DIR", settings.BASE_DIR / "uploads")
+    )
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir
+
+
+def enqueue(kind, uploaded_file, **options):
+    """
+    Persist ``uploaded_file`` to disk and queue an ingestion job for it.
+    ``options`` (batch_size, streaming, mode, workers) are stored on the job
+    and applied by the worker; with ``workers`` > 1 the file is parsed in that
+    many processes.
+    """
+    job = IngestionJob(kind=kind, options=options, **owner())
+    path = get_upload_dir() / f"{job.id}.csv"
+    with open(path, "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    job.file_path = str(path)
+    job.file_size = path.stat().st_size
+    job.save()
+
+    executor = get_executor()
+    if executor is None:
+        record_job_metrics(run_job(str(job.id)))
+    else:
+        job_id = str(job.id)
+        transaction.on_commit(
+            lambda: executor.submit(run_job, job_id).add_done_callback(
+                lambda future: record_job_metrics(future.result())
+            )
+        )
+    return job
+
+
+def record_job_metrics(outcome):
+    """Record a finished job's ``run_job`` outcome in this process's metrics."""
+    kind, status, rows, seconds = outcome
+    metrics.observe_upload(kind, status, rows, seconds)
+
+
+def run_job(job_id):
+    """
+    Ingest the file of job ``job_id``; runs inside a pool worker. Returns the
+    job's kind, final status, rows ingested and seconds taken.
+    """
+    started = time.perf_counter()
+    job = IngestionJob.objects.get(pk=job_id)
+    job.status = IngestionJob.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+    try:
+        with open(job.file_path, "rb") as file_obj:
+
+            def progress(stats):
+                IngestionJob.objects.filter(pk=job.pk).update(
+                    rows_processed=stats.rows,
+                    skipped_rows=stats.skipped,
+                    bytes_processed=(
+                        stats.bytes_read
+                        if stats.bytes_read is not None
+                        else file_obj.tell()
+                    ),
+                )
+
+            options = job.options
+            loader_options = {
+                "batch_size": options.get("batch_size"),
+                "mode": options.get("mode"),
+                "progress": progress,
+            }
+            if get_workers(options.get("workers")) > 1:
+                stats = ingest_parallel(
+                    job.kind,
+                    job.file_path,
+                    workers=options.get("workers"),
+                    **loader_options,
+                )
+            else:
+                loader = LOADERS[job.kind](**loader_options)
+                stats = loader.load_csv(file_obj, streaming=options.get("streaming"))
+        finish_job(job, IngestionJob.SUCCEEDED, stats.as_dict())
+    except IngestionError as e:
+        finish_job(job, IngestionJob.FAILED, e.detail)
+    except Exception as e:
+        finish_job(job, IngestionJob.FAILED, {"error": str(e)})
+    finally:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        if getattr(settings, "HEALIX_INGEST_EXECUTOR", "process") != "inline":
+            connection.close()
+    return job.kind, job.status, job.rows_processed, time.perf_counter() - started
+
+
+def finish_job(job, status, detail):
+    """Record the outcome of ``job``; failures keep their detail in ``errors``."""
+    job.refresh_from_db()
+    job.status = status
+    job.finished_at = timezone.now()
+    if status == IngestionJob.SUCCEEDED:
+        job.bytes_processed = job.file_size
+    # Validation failures list the invalid rows under "rows" instead of a count
+    if isinstance(detail.get("rows"), int):
+        job.rows_processed = detail["rows"]
+        job.skipped_rows = detail.get("skipped_rows", 0)
+    job.errors = None if status == IngestionJob.SUCCEEDED else detail
+    job.save()
@@ -0,0 +1,92 @@
+"""
+Synthetic Synthea-shaped CSV data for the ingestion benchmarks.
+
+Condition and observation rows never repeat a natural key (patient,
+description, day), so every frame loads in the default insert mode.
+"""
+
+import numpy as np
+import pandas as pd
+
+OBSERVATION_TYPES = [
+    ("Body Mass Index", "kg/m2", 18.0, 40.0),
+    ("Systolic Blood Pressure", "mm[Hg]", 95.0, 190.0),
+    ("Diastolic Blood Pressure", "mm[Hg]", 55.0, 120.0),
+    ("Heart rate", "/min", 50.0, 120.0),
+    ("Body Weight", "kg", 40.0, 130.0),
+]
+CONDITIONS = [
+    "Hypertension",
+    "Hyperlipidemia",
+    "Prediabetes",
+    "Anemia (disorder)",
+    "Viral sinusitis (disorder)",
+    "Otitis media",
+]
+
+
+# Dates are drawn from this many days after 2000-01-01
+DAYS = 24 * 365
+
+
+def patient_ids(n_patients):
+    return [f"p-{i:08d}" for i in range(n_patients)]
+
+
+def unique_keys(rng, n_rows, n_patients, n_kinds):
+    """
+    Distinct (patient, day, kind) index triples, sampled uniformly without
+    replacement. Raises ValueError if there are fewer than ``n_rows``.
+    """
+    slots = rng.choice(n_patients * DAYS * n_kinds, n_rows, replace=False)
+    patients, slots = np.divmod(slots, DAYS * n_kinds)
+    days, kinds = np.divmod(slots, n_kinds)
+    return patients, days, kinds
+
+
+def patients_frame(n_patients, seed=0):
+    rng = np.random.default_rng(seed)
+    births = pd.Timestamp("1940-01-01") + pd.to_timedelta(
+        rng.integers(0, 80 * 365, n_patients), unit="D"
+    )
+    return pd.DataFrame(
+        {
+            "Id": patient_ids(n_patients),
+            "BIRTHDATE": births.strftime("%Y-%m-%d"),
+            "GENDER": rng.choice(["M", "F"], n_patients),
+        }
+    )
+
+
+def conditions_frame(n_rows, n_patients, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.array(patient_ids(n_patients))
+    patients, days, kinds = unique_keys(rng, n_rows, n_patients, len(CONDITIONS))
+    starts = pd.Timestamp("2000-01-01") + pd.to_timedelta(days, unit="D")
+    return pd.DataFrame(
+        {
+            "START": starts.strftime("%Y-%m-%d"),
+            "PATIENT": ids[patients],
+            "DESCRIPTION": np.array(CONDITIONS)[kinds],
+        }
+    )
+
+
+def observations_frame(n_rows, n_patients, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.array(patient_ids(n_patients))
+    patients, days, kinds = unique_keys(rng, n_rows, n_patients, len(OBSERVATION_TYPES))
+    low = np.array([t[2] for t in OBSERVATION_TYPES])[kinds]
+    high = np.array([t[3] for t in OBSERVATION_TYPES])[kinds]
+    dates = pd.Timestamp("2000-01-01") + pd.to_timedelta(
+        days * 24 + rng.integers(0, 24, n_rows), unit="h"
+    )
+    return pd.DataFrame(
+        {
+            "DATE": dates.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "PATIENT": ids[patients],
+            "DESCRIPTION": np.array([t[0] for t in OBSERVATION_TYPES])[kinds],
+            "VALUE": np.round(rng.uniform(low, high), 1).astype(str),
+            "UNITS": np.array([t[1] for t in OBSERVATION_TYPES])[kinds],
+        }
+    )
@@ -0,0 +1,71 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from datasets.export import COMPRESSED_FORMATS, FORMATS
+from datasets.ingestion import ObservationLoader, PatientLoader
+from datasets.management.commands._synthetic import observations_frame, patients_frame
+from datasets.views import ObservationViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream the observations table through export/ in every output format "
+        "and report throughput, output size and peak Python memory (which "
+        "should not grow with the table). The "
+        "synthetic rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[50_000, 200_000])
+        parser.add_argument("--patients", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        view = ObservationViewSet.as_view({"get": "export"})
+        factory = APIRequestFactory()
+
+        for rows in options["rows"]:
+            with transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = observations_frame(rows, options["patients"])
+                # Observations are stored per day
+                frame = frame[
+                    ~frame.assign(DAY=frame["DATE"].str[:10]).duplicated(
+                        ["PATIENT", "DESCRIPTION", "DAY"]
+                    )
+                ]
+                ObservationLoader().load(frame)
+                self.stdout.write(f"{len(frame):,} observations")
+
+                for export_format in FORMATS:
+                    encodings = ["identity"]
+                    if export_format not in COMPRESSED_FORMATS:
+                        encodings.append("gzip")
+                    for encoding in encodings:
+                        request = factory.get(
+                            "/",
+                            {"output": export_format},
+                            HTTP_ACCEPT_ENCODING=encoding,
+                        )
+                        started = time.perf_counter()
+                        response = view(request)
+                        size = sum(len(chunk) for chunk in response.streaming_content)
+                        seconds = time.perf_counter() - started
+                        # tracemalloc slows Python code down severalfold, so
+                        # memory is measured in a second, untimed pass
+                        tracemalloc.start()
+                        for _ in view(request).streaming_content:
+                            pass
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        encoded = response.get("Content-Encoding", "identity")
+                        self.stdout.write(
+                            f"    {export_format:<8} {encoded:<9}"
+                            f"{len(frame) / seconds:>10,.0f} rows/s  "
+                            f"{size / 2**20:7.1f} MB  "
+                            f"peak {peak / 2**20:6.1f} MB"
+                        )
+                transaction.set_rollback(True)
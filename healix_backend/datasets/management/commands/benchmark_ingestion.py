@@ -0,0 +1,65 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from datasets.ingestion import ObservationLoader, PatientLoader, clean_observation_value
+from datasets.models import Patient
+from datasets.serializers import ObservationSerializer
+
+from ._synthetic import observations_frame, patients_frame
+
+
+def legacy_observation_upload(df):
+    """The original per-row path: one SELECT and one INSERT per CSV row."""
+    for _, row in df.iterrows():
+        date = pd.to_datetime(row["DATE"]).date() if pd.notnull(row["DATE"]) else None
+        patient = Patient.objects.get(id=row["PATIENT"])
+        serializer = ObservationSerializer(
+            data={
+                "patient": patient.id,
+                "description": row["DESCRIPTION"],
+                "value": clean_observation_value(row["VALUE"]),
+                "units": row["UNITS"] if pd.notnull(row["UNITS"]) else None,
+                "date": date,
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-row and bulk observation ingestion throughput on synthetic "
+        "Synthea data. All writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--legacy-rows", type=int, default=2_000)
+        parser.add_argument("--patients", type=int, default=5_000)
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            PatientLoader().load(patients_frame(options["patients"]))
+
+            legacy_df = observations_frame(options["legacy_rows"], options["patients"])
+            started = time.perf_counter()
+            legacy_observation_upload(legacy_df)
+            legacy_rate = len(legacy_df) / (time.perf_counter() - started)
+
+            bulk_df = observations_frame(options["rows"], options["patients"], seed=1)
+            stats = ObservationLoader(batch_size=options["batch_size"]).load(bulk_df)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"per-row: {legacy_rate:,.0f} rows/s ({len(legacy_df):,} rows)"
+        )
+        self.stdout.write(
+            f"bulk:    {stats.rows_per_second:,.0f} rows/s ({stats.rows:,} rows, "
+            f"{stats.chunks} chunks, {stats.seconds:.1f}s)"
+        )
+        self.stdout.write(f"speedup: {stats.rows_per_second / legacy_rate:.1f}x")
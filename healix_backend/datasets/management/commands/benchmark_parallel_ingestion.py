@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from datasets.ingestion import PatientLoader
+from datasets.parallel import ingest_parallel
+
+from ._synthetic import observations_frame, patients_frame
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure sharded multi-process observation ingestion throughput for "
+        "several worker counts. All writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000)
+        parser.add_argument("--patients", type=int, default=5_000)
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--shard-bytes", type=int, default=None)
+
+    def handle(self, *args, **options):
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as tmp:
+            observations_frame(options["rows"], options["patients"]).to_csv(
+                tmp.name, index=False
+            )
+        self.stdout.write(
+            f"{options['rows']:,} rows, {os.path.getsize(tmp.name) / 2**20:.1f} MB, "
+            f"{os.cpu_count()} CPU cores"
+        )
+        try:
+            baseline = None
+            for workers in options["workers"]:
+                with transaction.atomic():
+                    PatientLoader().load(patients_frame(options["patients"]))
+                    stats = ingest_parallel(
+                        "observations",
+                        tmp.name,
+                        workers=workers,
+                        batch_size=options["batch_size"],
+                        shard_bytes=options["shard_bytes"],
+                    )
+                    transaction.set_rollback(True)
+                baseline = baseline or stats.rows_per_second
+                self.stdout.write(
+                    f"{workers:>2} workers: {stats.rows_per_second:12,.0f} rows/s "
+                    f"({stats.seconds:6.1f}s, {stats.rows_per_second / baseline:4.2f}x)"
+                )
+        finally:
+            os.unlink(tmp.name)
@@ -0,0 +1,89 @@
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+HEAVY_MODULES = (
+    "numpy",
+    "pandas",
+    "joblib",
+    "pyarrow",
+    "sklearn",
+    "tensorflow",
+    "keras",
+)
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+# Runs in a fresh interpreter under ``python -X importtime``
+CHILD_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import importlib
+importlib.import_module(sys.argv[1])
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": sorted(m for m in %r if m in sys.modules),
+}))
+""" % (HEAVY_MODULES,)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold-boot time and peak RSS of django.setup() plus each app's "
+        "URLconf (which imports its views) in a fresh process, using "
+        "python -X importtime to list the slowest top-level imports."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--apps", nargs="+", default=["datasets", "insights", "predictions"]
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--top", type=int, default=5)
+
+    def handle(self, *args, **options):
+        targets = [(app, f"{app}.urls") for app in options["apps"]]
+        targets.append(("project", settings.ROOT_URLCONF))
+        for label, module in targets:
+            runs = [self.run_child(module) for _ in range(options["repeat"])]
+            best = min(runs, key=lambda run: run["seconds"])
+            self.stdout.write(
+                f"{label:<12} boot {best['seconds']:6.2f} s  "
+                f"imports {best['import_seconds']:6.2f} s  "
+                f"peak RSS {best['max_rss_mb']:6.1f} MB  "
+                f"heavy modules: {', '.join(best['heavy']) or 'none'}"
+            )
+            slowest = sorted(best["packages"].items(), key=lambda item: -item[1])
+            for package, seconds in slowest[: options["top"]]:
+                self.stdout.write(f"    {package:<24} {seconds:6.3f} s")
+
+    def run_child(self, module):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT, module],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        )
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        total_us = 0
+        packages = defaultdict(int)
+        for line in output.stderr.splitlines():
+            match = IMPORTTIME_RE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, indent, name = match.groups()
+            total_us += int(self_us)
+            if not indent:  # Top-level imports carry their children's time
+                packages[name.split(".")[0]] += int(cumulative_us)
+        result["import_seconds"] = total_us / 1e6
+        result["packages"] = {name: us / 1e6 for name, us in packages.items()}
+        return result
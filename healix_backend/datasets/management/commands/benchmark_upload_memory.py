@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from datasets.ingestion import ObservationLoader, PatientLoader
+
+from ._synthetic import observations_frame, patients_frame
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure peak memory of streaming vs whole-file observation uploads "
+        "across file sizes. Each run happens in a fresh process and is rolled back."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[100_000, 500_000, 2_000_000]
+        )
+        parser.add_argument("--patients", type=int, default=5_000)
+        parser.add_argument("--batch-size", type=int, default=None)
+        # Internal: run a single measurement in this process
+        parser.add_argument("--measure", choices=["stream", "memory"])
+        parser.add_argument("--path")
+
+    def handle(self, *args, **options):
+        if options["measure"]:
+            return self.measure(options)
+
+        for rows in options["rows"]:
+            with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as tmp:
+                observations_frame(rows, options["patients"]).to_csv(
+                    tmp.name, index=False
+                )
+            try:
+                size_mb = os.path.getsize(tmp.name) / 2**20
+                results = {
+                    mode: self.run_child(mode, tmp.name, options)
+                    for mode in ("memory", "stream")
+                }
+            finally:
+                os.unlink(tmp.name)
+            self.stdout.write(
+                f"{rows:>10,} rows ({size_mb:7.1f} MB): "
+                f"whole-file {results['memory']}  streaming {results['stream']}"
+            )
+
+    def run_child(self, mode, path, options):
+        command = [
+            sys.executable,
+            sys.argv[0],
+            "benchmark_upload_memory",
+            "--measure",
+            mode,
+            "--path",
+            path,
+            "--patients",
+            str(options["patients"]),
+        ]
+        if options["batch_size"]:
+            command += ["--batch-size", str(options["batch_size"])]
+        output = subprocess.run(command, capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+
+    def measure(self, options):
+        # With DEBUG on, Django keeps the SQL of recent queries in memory,
+        # which would show up as growth unrelated to the ingestion itself.
+        settings.DEBUG = False
+        with transaction.atomic():
+            PatientLoader().load(patients_frame(options["patients"]))
+            # tracemalloc also sees numpy/pandas buffers, so its peak is the
+            # ingestion's own high-water mark rather than the process's.
+            tracemalloc.start()
+            with open(options["path"], "rb") as file_obj:
+                ObservationLoader(batch_size=options["batch_size"]).load_csv(
+                    file_obj, streaming=options["measure"] == "stream"
+                )
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            transaction.set_rollback(True)
+        self.stdout.write(f"peak {peak:7.1f} MB")
@@ -0,0 +1,35 @@
+import timeit
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from datasets.ingestion import clean_observation_value, clean_observation_values
+
+from ._synthetic import observations_frame
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the scalar and column observation value cleaners."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        values = observations_frame(options["rows"], 1_000)["VALUE"]
+        # Mix in the awkward formats the cleaner has to normalize
+        rng = np.random.default_rng(0)
+        picks = rng.random(len(values))
+        values = values.where(picks > 0.05, "> " + values)
+        values = values.where((picks < 0.05) | (picks > 0.08), values + " mg/dL")
+        values = values.where((picks < 0.08) | (picks > 0.1), "Unknown")
+
+        for label, func in (
+            ("scalar (Series.map)", lambda: values.map(clean_observation_value)),
+            ("column", lambda: clean_observation_values(values)),
+        ):
+            best = min(timeit.repeat(func, number=1, repeat=options["repeat"]))
+            self.stdout.write(
+                f"{label:<20} {best * 1000:9.1f} ms  {len(values) / best:14,.0f} values/s"
+            )
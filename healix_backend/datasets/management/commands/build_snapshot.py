@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from datasets.snapshot import build_snapshot, get_snapshot_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Export patients, conditions and observations to a new Parquet "
+        "analytics snapshot and publish it. Uploads do this automatically; "
+        "use this after changing data by other means, which leaves the "
+        "published snapshot stale."
+    )
+
+    def handle(self, *args, **options):
+        manifest = build_snapshot()
+        rows = ", ".join(
+            f"{count:,} {table}" for table, count in manifest["rows"].items()
+        )
+        self.stdout.write(
+            f"Snapshot of dataset version {manifest['version']} ({rows}) written "
+            f"to {get_snapshot_dir() / manifest['path']} in {manifest['seconds']:.2f} s"
+        )
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from datasets.vitals import derive_vitals
+
+
+class Command(BaseCommand):
+    help = (
+        "Derive patient BMI, blood pressure, heart rate and BP category from "
+        "each patient's latest observations. Uploads do this incrementally; "
+        "use this to backfill existing data or after changing observations "
+        "by other means."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patients", nargs="+", help="Only these patient IDs (default: all)"
+        )
+        parser.add_argument("--chunk-size", type=int)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = derive_vitals(options["patients"], chunk_size=options["chunk_size"])
+        self.stdout.write(
+            f"Vitals updated for {changed} patients in "
+            f"{time.perf_counter() - started:.2f} s"
+        )
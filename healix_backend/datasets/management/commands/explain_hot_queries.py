@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from datasets.query_plans import explain, hot_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan of each hot dataset lookup and whether it uses "
+        "the index meant to serve it. Sequential scans are disabled while "
+        "planning on PostgreSQL, so small tables still show index use."
+    )
+
+    def handle(self, *args, **options):
+        for query in hot_queries():
+            if query.postgresql_only and connection.vendor != "postgresql":
+                self.stdout.write(f"{query.label}: skipped (PostgreSQL only)")
+                continue
+            plan = explain(query.queryset)
+            uses_index = any(name in plan for name in query.indexes)
+            status = "ok" if uses_index else f"MISSING {query.indexes[0]}"
+            self.stdout.write(f"{query.label}: {status}")
+            for line in plan.splitlines():
+                self.stdout.write(f"    {line}")
+            self.stdout.write("")
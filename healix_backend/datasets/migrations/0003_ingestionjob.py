@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:11
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0002_alter_condition_id_alter_observation_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("kind", models.CharField(max_length=20)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                    ),
+                ),
+                ("file_path", models.CharField(max_length=500)),
+                ("file_size", models.BigIntegerField(default=0)),
+                ("bytes_processed", models.BigIntegerField(default=0)),
+                ("rows_processed", models.BigIntegerField(default=0)),
+                ("skipped_rows", models.BigIntegerField(default=0)),
+                ("options", models.JSONField(blank=True, default=dict)),
+                ("errors", models.JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:16
+
+from django.db import migrations, models
+from django.db.models import Count
+
+NATURAL_KEYS = {
+    "Condition": ["patient", "description", "start_date"],
+    "Observation": ["patient", "description", "date"],
+}
+# Repeated keys listed in the error
+MAX_REPORTED = 20
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Plain re-uploads used to duplicate rows, and which copy to keep is the
+    operator's call, so refuse to add the unique constraints while any natural
+    key is repeated and list the offending keys. Rows with a NULL key part are
+    left alone, as the constraints do not apply to them.
+    """
+    problems = []
+    for model_name, fields in NATURAL_KEYS.items():
+        model = apps.get_model("datasets", model_name)
+        repeated = (
+            model.objects.filter(**{f"{field}__isnull": False for field in fields})
+            .values(*fields)
+            .annotate(rows=Count("id"))
+            .filter(rows__gt=1)
+            .order_by(*fields)
+        )
+        total = repeated.count()
+        if total:
+            problems.append(
+                f"{total} repeated {model_name} keys ({', '.join(fields)}):"
+            )
+            problems += [f"  {row}" for row in repeated[:MAX_REPORTED]]
+            if total > MAX_REPORTED:
+                problems.append(f"  ... and {total - MAX_REPORTED} more")
+    if problems:
+        raise RuntimeError(
+            "Cannot add the natural key constraints; delete or merge the "
+            "repeated rows first, then migrate again.\n" + "\n".join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0003_ingestionjob"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="condition",
+            constraint=models.UniqueConstraint(
+                fields=("patient", "description", "start_date"),
+                name="unique_condition_natural_key",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="observation",
+            constraint=models.UniqueConstraint(
+                fields=("patient", "description", "date"),
+                name="unique_observation_natural_key",
+            ),
+        ),
+    ]
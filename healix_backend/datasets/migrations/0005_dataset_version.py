@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:55
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    apps.get_model("datasets", "DatasetVersion").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0004_natural_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DatasetVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
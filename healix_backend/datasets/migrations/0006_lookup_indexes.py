@@ -0,0 +1,72 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:58
+
+from django.db import migrations, models
+
+# PostgreSQL-only indexes, which the other backends cannot express
+POSTGRESQL_INDEXES = [
+    # Case-insensitive and substring condition name searches (ILIKE)
+    (
+        "condition_description_trgm",
+        "CREATE INDEX IF NOT EXISTS condition_description_trgm "
+        "ON datasets_condition USING gin (description gin_trgm_ops)",
+    ),
+    # Observations arrive roughly in date order, so a block range index
+    # serves date range scans at a tiny fraction of a B-tree's size
+    (
+        "observation_date_brin",
+        "CREATE INDEX IF NOT EXISTS observation_date_brin "
+        "ON datasets_observation USING brin (date)",
+    ),
+]
+
+
+def create_postgresql_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for _, sql in POSTGRESQL_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_postgresql_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in POSTGRESQL_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0005_dataset_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="condition",
+            index=models.Index(
+                fields=["description", "patient"], name="condition_description_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                fields=["description", "date"],
+                include=("value",),
+                name="observation_series_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(fields=["gender", "bmi"], name="patient_gender_bmi_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(
+                condition=models.Q(("bp_category__isnull", False)),
+                fields=["bp_category"],
+                name="patient_bp_category_idx",
+            ),
+        ),
+        migrations.RunPython(create_postgresql_indexes, drop_postgresql_indexes),
+    ]
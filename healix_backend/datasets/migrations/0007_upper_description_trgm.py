@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-17 08:20
+
+from django.db import migrations
+
+# Django compiles icontains/istartswith/iexact on PostgreSQL to
+# UPPER(column::text) LIKE UPPER(%s), which only an index on the same
+# expression can serve; the index on the bare column was never used.
+UPPER_TRGM_SQL = (
+    "CREATE INDEX IF NOT EXISTS condition_description_trgm "
+    "ON datasets_condition USING gin (UPPER(description) gin_trgm_ops)"
+)
+BARE_TRGM_SQL = (
+    "CREATE INDEX IF NOT EXISTS condition_description_trgm "
+    "ON datasets_condition USING gin (description gin_trgm_ops)"
+)
+
+
+def replace_index(sql):
+    def replace(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        schema_editor.execute("DROP INDEX IF EXISTS condition_description_trgm")
+        schema_editor.execute(sql)
+
+    return replace
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0006_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            replace_index(UPPER_TRGM_SQL), replace_index(BARE_TRGM_SQL)
+        ),
+    ]
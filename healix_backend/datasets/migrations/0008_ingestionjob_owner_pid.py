@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-17 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0007_upper_description_trgm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestionjob",
+            name="owner_pid",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-17 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("datasets", "0008_ingestionjob_owner_pid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestionjob",
+            name="owner_host",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 
@@ -22,6 +24,19 @@ class Patient(models.Model):
         max_length=20, null=True, blank=True
     )  # Derived field
 
+    class Meta:
+        indexes = [
+            # Per-gender BMI aggregates read both columns from the index
+            models.Index(fields=["gender", "bmi"], name="patient_gender_bmi_idx"),
+            # Cohort filters on a blood pressure category; uncategorized
+            # patients are never looked up this way
+            models.Index(
+                fields=["bp_category"],
+                name="patient_bp_category_idx",
+                condition=models.Q(bp_category__isnull=False),
+            ),
+        ]
+
     def __str__(self):
         return f"Patient {self.id}"
 
@@ -38,8 +53,26 @@ class Condition(models.Model):
     description = models.TextField(null=True, blank=True)
     start_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # Natural key used to upsert re-imported Synthea exports
+            models.UniqueConstraint(
+                fields=["patient", "description", "start_date"],
+                name="unique_condition_natural_key",
+            ),
+        ]
+        indexes = [
+            # Prevalence by condition name, joined to the patient's gender.
+            # PostgreSQL additionally gets a trigram index on
+            # UPPER(description) for icontains searches (migration
+            # 0007_upper_description_trgm).
+            models.Index(
+                fields=["description", "patient"], name="condition_description_idx"
+            ),
+        ]
+
     def __str__(self):
-        return f"Condition {self.description} for Patient {self.patient.id}"
+        return f"Condition {self.description} for Patient {self.patient_id}"
 
 
 class Observation(models.Model):
@@ -56,5 +89,75 @@ class Observation(models.Model):
     units = models.CharField(max_length=50, null=True, blank=True)
     date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # Natural key used to upsert re-imported Synthea exports
+            models.UniqueConstraint(
+                fields=["patient", "description", "date"],
+                name="unique_observation_natural_key",
+            ),
+        ]
+        indexes = [
+            # Cohort time series of one measurement; the unique constraint
+            # above already serves per-patient series. PostgreSQL covers the
+            # value too and gets a BRIN index on date (migration
+            # 0006_lookup_indexes).
+            models.Index(
+                fields=["description", "date"],
+                name="observation_series_idx",
+                include=["value"],
+            ),
+        ]
+
+    def __str__(self):
+        return f"Observation {self.description} for Patient {self.patient_id}"
+
+
+class IngestionJob(models.Model):
+    """
+    Background ingestion of an uploaded CSV file, polled by clients for progress.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20)  # patients, conditions or observations
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    file_path = models.CharField(max_length=500)
+    # Host and process that queued the job; its worker pool dies with them
+    owner_host = models.CharField(max_length=255, blank=True)
+    owner_pid = models.IntegerField(null=True, blank=True)
+    file_size = models.BigIntegerField(default=0)
+    bytes_processed = models.BigIntegerField(default=0)
+    rows_processed = models.BigIntegerField(default=0)
+    skipped_rows = models.BigIntegerField(default=0)
+    options = models.JSONField(default=dict, blank=True)
+    errors = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Ingestion job {self.id} ({self.kind}, {self.status})"
+
+
+class DatasetVersion(models.Model):
+    """
+    Single-row counter bumped whenever patient, condition or observation data
+    changes; keys and validates cached responses built from that data.
+    """
+
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"Observation {self.description} for Patient {self.patient.id}"
+        return f"Dataset version {self.version}"
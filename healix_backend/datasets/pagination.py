@@ -0,0 +1,53 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+from .ingestion import parse_bool
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 5000
+
+
+class DatasetCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key for the dataset tables.
+
+    Each page is fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n``, an
+    index range scan whose cost does not grow with the page's depth, so walking
+    a whole table is linear. Clients pick the page size with ``?page_size=``
+    (capped at ``HEALIX_DATASET_MAX_PAGE_SIZE``). The total row count costs a
+    full scan and is only included when asked for with ``?count=true``.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+
+    def get_page_size(self, request):
+        self.page_size = getattr(
+            settings, "HEALIX_DATASET_PAGE_SIZE", DEFAULT_PAGE_SIZE
+        )
+        self.max_page_size = getattr(
+            settings, "HEALIX_DATASET_MAX_PAGE_SIZE", DEFAULT_MAX_PAGE_SIZE
+        )
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if parse_bool(request.query_params.get(self.count_query_param)):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data["count"] = self.count
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"] = {
+            "type": "integer",
+            "example": 123,
+            "description": "Only present with ?count=true.",
+        }
+        return response_schema
@@ -0,0 +1,132 @@
+"""
+Multi-process ingestion of large CSV files.
+
+The file is split into byte-range shards aligned on line boundaries. Worker
+processes parse and clean their shards independently (``CSVLoader.clean``) and
+send the cleaned frames back, while the calling process acts as the single
+writer that resolves patients and bulk-loads each frame (``CSVLoader.persist``).
+
+Shards are cut on newlines, so this mode assumes no quoted field spans several
+lines, which holds for Synthea exports.
+"""
+
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from healix_backend.lazy import lazy_import
+
+from .ingestion import LOADERS, IngestionError, IngestionStats
+
+pd = lazy_import("pandas")
+
+DEFAULT_SHARD_BYTES = 8 * 2**20
+MAX_WORKERS = 32
+
+
+def get_workers(value=None):
+    """Resolve the worker count from ``value`` or ``HEALIX_INGEST_PARALLEL_WORKERS``."""
+    if value in (None, ""):
+        value = getattr(settings, "HEALIX_INGEST_PARALLEL_WORKERS", 1)
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        raise IngestionError({"error": f"Invalid workers: {value!r}."})
+    return max(1, min(workers, MAX_WORKERS))
+
+
+def shard_file(path, shard_bytes=None):
+    """
+    Return ``(header, shards)`` for the CSV at ``path``: the header line as
+    bytes and a list of ``(start, end)`` byte ranges that each begin at the
+    start of a line and end just after a newline (or at end of file).
+    """
+    shard_bytes = shard_bytes or getattr(
+        settings, "HEALIX_INGEST_SHARD_BYTES", DEFAULT_SHARD_BYTES
+    )
+    size = os.path.getsize(path)
+    shards = []
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + shard_bytes, size))
+            if f.tell() < size:
+                f.readline()  # Advance to the next line boundary
+            end = f.tell()
+            shards.append((start, end))
+            start = end
+    return header, shards
+
+
+def clean_shard(kind, path, header, start, end):
+    """
+    Worker entry point: parse the bytes ``[start, end)`` of ``path`` and return
+    the cleaned frame. Errors are tagged with the shard offset.
+    """
+    loader = LOADERS[kind]()
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    wanted = set(loader.required_columns)
+    chunk = pd.read_csv(
+        io.BytesIO(header + data),
+        usecols=lambda column: column in wanted,
+        dtype=str,
+    )
+    try:
+        return loader.clean(chunk)
+    except IngestionError as e:
+        raise IngestionError({**e.detail, "shard_byte_offset": start})
+
+
+def ingest_parallel(kind, path, workers=None, shard_bytes=None, **loader_options):
+    """
+    Ingest the CSV at ``path`` with ``workers`` parsing processes and this
+    process as the writer. At most two shards per worker are in flight, so
+    memory stays bounded however large the file is. ``loader_options`` are
+    passed to the writer's loader (batch_size, mode, progress).
+    """
+    workers = get_workers(workers)
+    loader = LOADERS[kind](**loader_options)
+    header, shards = shard_file(path, shard_bytes)
+    loader.check_columns(pd.read_csv(io.BytesIO(header), nrows=0))
+
+    stats = IngestionStats()
+    remaining = iter(shards)
+    pending = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    ) as pool:
+
+        def submit_next():
+            shard = next(remaining, None)
+            if shard is not None:
+                future = pool.submit(clean_shard, kind, path, header, *shard)
+                pending.append((shard, future))
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+            while pending:
+                (start, end), future = pending.popleft()
+                frame = future.result()
+                submit_next()  # Keep workers busy while this shard is written
+                for offset in range(0, len(frame), loader.batch_size):
+                    written = min(offset + loader.batch_size, len(frame))
+                    stats.bytes_read = start + (end - start) * written // len(frame)
+                    loader.persist(
+                        frame.iloc[offset : offset + loader.batch_size], stats
+                    )
+        except BaseException:
+            for _, future in pending:
+                future.cancel()
+            raise
+    return loader.finish(stats)
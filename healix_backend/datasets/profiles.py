@@ -0,0 +1,98 @@
+"""
+Patient profiles: one patient with their conditions and observations.
+
+A profile is always read with a fixed number of queries, one for the patient
+plus one per included relation, whichever path builds it:
+
+- ``profile_queryset`` prefetches the relations for the nested
+  ``PatientProfileSerializer``;
+- ``profile_values`` skips model instances and DRF field serialization
+  altogether and returns plain ``values()`` dicts of the same shape.
+
+Both honour sparse fieldsets: ``fields`` picks patient fields, and
+``fields[conditions]`` / ``fields[observations]`` pick related-row fields.
+``include`` limits which relations are loaded at all.
+"""
+
+from django.db.models import Prefetch
+
+from .models import Condition, Observation, Patient
+
+PATIENT_FIELDS = [field.name for field in Patient._meta.concrete_fields]
+# Relation name -> (model, fields, ordering); the patient key is implied
+RELATIONS = {
+    "conditions": (
+        Condition,
+        ["id", "description", "start_date"],
+        ["start_date", "id"],
+    ),
+    "observations": (
+        Observation,
+        ["id", "description", "value", "units", "date"],
+        ["date", "id"],
+    ),
+}
+
+
+class ProfileError(ValueError):
+    """Raised for unknown fields or relations in profile parameters."""
+
+
+def _pick(param, value, available):
+    if value is None:
+        return list(available)
+    picked = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = sorted(set(picked) - set(available))
+    if unknown:
+        raise ProfileError(
+            f"Unknown {param}: {', '.join(unknown)}. "
+            f"Available: {', '.join(available)}."
+        )
+    return picked
+
+
+def parse_profile_params(params):
+    """
+    ``(fields, relations)`` from query ``params``: the patient fields, and a
+    map of each included relation to its fields.
+    """
+    fields = _pick("fields", params.get("fields"), PATIENT_FIELDS)
+    include = _pick("include", params.get("include"), RELATIONS)
+    relations = {
+        name: _pick(
+            f"fields[{name}]", params.get(f"fields[{name}]"), RELATIONS[name][1]
+        )
+        for name in include
+    }
+    return fields, relations
+
+
+def _related(name):
+    model, _, ordering = RELATIONS[name]
+    return model.objects.order_by(*ordering)
+
+
+def profile_queryset(fields, relations):
+    """Patients loading only ``fields`` with ``relations`` prefetched."""
+    queryset = Patient.objects.only(*fields)
+    for name, related_fields in relations.items():
+        queryset = queryset.prefetch_related(
+            Prefetch(
+                name,
+                # The patient key matches prefetched rows to their patient
+                queryset=_related(name).only("patient", *related_fields),
+            )
+        )
+    return queryset
+
+
+def profile_values(pk, fields, relations):
+    """The profile of patient ``pk`` as plain dicts, or ``None`` if missing."""
+    profile = Patient.objects.filter(pk=pk).values(*fields).first()
+    if profile is None:
+        return None
+    for name, related_fields in relations.items():
+        profile[name] = list(
+            _related(name).filter(patient_id=pk).values(*related_fields)
+        )
+    return profile
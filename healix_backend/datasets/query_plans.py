@@ -0,0 +1,93 @@
+"""
+Hot lookups on the dataset tables and the indexes that serve them.
+
+``manage.py explain_hot_queries`` prints their plans against the current
+database, and the tests assert that each one uses its index.
+"""
+
+import datetime
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import Condition, Observation, Patient
+
+# ``indexes`` lists acceptable index names: SQLite builds unique constraints
+# into the table definition and names their index itself
+HotQuery = namedtuple("HotQuery", "label indexes queryset postgresql_only")
+
+SINCE = datetime.date(2020, 1, 1)
+
+
+def hot_queries():
+    return [
+        HotQuery(
+            "condition prevalence by name",
+            ("condition_description_idx",),
+            Condition.objects.filter(description__in=["Hypertension"])
+            .values("description", "patient__gender")
+            .annotate(count=Count("id"))
+            .order_by(),
+            False,
+        ),
+        HotQuery(
+            "one patient's measurement series",
+            ("unique_observation_natural_key", "sqlite_autoindex_datasets_observation"),
+            Observation.objects.filter(
+                patient_id="p1", description="Body Mass Index", date__gte=SINCE
+            )
+            .order_by("date")
+            .values_list("date", "value"),
+            False,
+        ),
+        HotQuery(
+            "cohort measurement series",
+            ("observation_series_idx",),
+            Observation.objects.filter(description="Body Mass Index", date__gte=SINCE)
+            .order_by("date")
+            .values_list("date", "value"),
+            False,
+        ),
+        HotQuery(
+            "BMI by gender",
+            ("patient_gender_bmi_idx",),
+            Patient.objects.values("gender")
+            .annotate(bmi_count=Count("bmi"), bmi_sum=Sum("bmi"))
+            .order_by("gender"),
+            False,
+        ),
+        HotQuery(
+            "patients in a blood pressure category",
+            ("patient_bp_category_idx",),
+            Patient.objects.filter(bp_category="severe").values_list("id", flat=True),
+            False,
+        ),
+        HotQuery(
+            # icontains compiles to UPPER(description::text) LIKE UPPER(%s)
+            "condition name search",
+            ("condition_description_trgm",),
+            Condition.objects.filter(description__icontains="tension").values_list(
+                "id", flat=True
+            ),
+            True,
+        ),
+        HotQuery(
+            "observations since a date",
+            ("observation_date_brin",),
+            Observation.objects.filter(date__gte=SINCE).values_list("id", flat=True),
+            True,
+        ),
+    ]
+
+
+def explain(queryset):
+    """
+    Plan of ``queryset``. On PostgreSQL sequential scans are disabled, so the
+    plan shows the index the query can use even on a small table.
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
@@ -1,5 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Patient, Condition, Observation
+from .models import Patient, Condition, Observation, IngestionJob
+from .profiles import PATIENT_FIELDS, RELATIONS
 
 
 class PatientSerializer(serializers.ModelSerializer):
@@ -18,3 +20,89 @@ class ObservationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Observation
         fields = "__all__"
+
+
+class SparseFieldsMixin:
+    """Keeps only the field names passed as ``fields``, if any."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ConditionProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Condition
+        fields = RELATIONS["conditions"][1]
+
+
+class ObservationProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Observation
+        fields = RELATIONS["observations"][1]
+
+
+class PatientProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Patient with nested conditions and observations. ``relations`` maps each
+    relation to include to its fields; the patient must come from
+    ``profiles.profile_queryset`` so the relations are prefetched.
+    """
+
+    nested = {
+        "conditions": ConditionProfileSerializer,
+        "observations": ObservationProfileSerializer,
+    }
+
+    class Meta:
+        model = Patient
+        fields = PATIENT_FIELDS
+
+    def __init__(self, *args, relations=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, fields in (relations or {}).items():
+            self.fields[name] = self.nested[name](
+                many=True, read_only=True, fields=fields
+            )
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    """
+    Job status with throughput and an ETA extrapolated from the share of the
+    file read so far.
+    """
+
+    elapsed_seconds = serializers.SerializerMethodField()
+    rows_per_second = serializers.SerializerMethodField()
+    progress = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        exclude = ["file_path", "owner_host", "owner_pid"]
+
+    def get_elapsed_seconds(self, job):
+        if job.started_at is None:
+            return None
+        end = job.finished_at or timezone.now()
+        return round((end - job.started_at).total_seconds(), 3)
+
+    def get_rows_per_second(self, job):
+        elapsed = self.get_elapsed_seconds(job)
+        if not elapsed:
+            return None
+        return round(job.rows_processed / elapsed, 1)
+
+    def get_progress(self, job):
+        if not job.file_size:
+            return None
+        return round(min(job.bytes_processed / job.file_size, 1.0), 4)
+
+    def get_eta_seconds(self, job):
+        if job.status != IngestionJob.RUNNING or not job.bytes_processed:
+            return 0 if job.finished_at else None
+        elapsed = self.get_elapsed_seconds(job)
+        remaining = max(job.file_size - job.bytes_processed, 0)
+        return round(elapsed * remaining / job.bytes_processed, 1)
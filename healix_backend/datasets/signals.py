@@ -0,0 +1,28 @@
+"""
+Signals sent by the dataset loaders.
+
+Bulk loads bypass ``post_save``, so apps that keep derived data in sync with
+the raw tables (such as the insights aggregates) listen to these instead:
+
+- ``rows_written`` is sent for every chunk, inside the transaction that writes
+  it, with ``kind`` (``"patients"``, ``"conditions"`` or ``"observations"``),
+  ``mode`` (``"insert"`` or ``"upsert"``) and ``frame``, the rows actually
+  written as model field columns (unchanged upsert rows excluded). Upserts
+  also pass ``previous``: the natural keys and update fields of the rows in
+  ``frame`` that were already stored, as they were before the write.
+- ``dataset_loaded`` is sent once per upload after every chunk has been
+  written, with ``kind``, ``mode`` and the upload's ``IngestionStats``.
+- ``vitals_derived`` is sent by ``datasets.vitals`` after it bulk-updates
+  patient vitals, with ``before`` and ``after``: frames indexed by patient ID
+  with ``gender``, the vital fields and ``bp_category`` for the patients that
+  changed.
+- ``worker_pool_started`` is sent by ``datasets.jobs`` when a process creates
+  its background worker pool, before the pool runs anything.
+"""
+
+from django.dispatch import Signal
+
+rows_written = Signal()
+dataset_loaded = Signal()
+vitals_derived = Signal()
+worker_pool_started = Signal()
@@ -0,0 +1,363 @@
+"""
+Columnar analytics snapshot of the dataset tables.
+
+``build_snapshot`` exports patients, conditions and observations to Parquet
+under ``HEALIX_SNAPSHOT_DIR``, streaming each table chunk by chunk like the
+export endpoints do. Conditions and observations are hive-partitioned by a
+short hash of their description (``description_key``), so a query about one
+condition or measurement reads only that partition's files, however long the
+description; the description itself stays a column of the files. Every build
+goes to a new directory that is published by atomically replacing the
+``CURRENT`` manifest, so readers never see a half-written snapshot; the newest
+``HEALIX_SNAPSHOT_KEEP`` builds are kept.
+
+The manifest records the ``DatasetVersion`` read before the export started.
+Any write after that bumps the version, so a snapshot whose version differs
+from the current one is stale and readers should use the database instead.
+
+Uploads schedule a rebuild in a background thread ``HEALIX_SNAPSHOT_DELAY``
+seconds after they commit, unless ``HEALIX_SNAPSHOT_ON_UPLOAD`` is False, so
+upload requests never wait for it and uploads within the delay share one
+build; ``manage.py build_snapshot`` builds it on demand. ``current_snapshot``
+returns the published snapshot, whose tables are read through memory-mapped
+files and kept in memory per process.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from healix_backend.lazy import lazy_import
+
+from .export import arrow_schema, export_columns, iter_chunks, record_batches
+from .models import Condition, Observation, Patient
+from .signals import dataset_loaded
+from .versioning import get_dataset_version
+
+pa = lazy_import("pyarrow")
+ds = lazy_import("pyarrow.dataset")
+pafs = lazy_import("pyarrow.fs")
+pq = lazy_import("pyarrow.parquet")
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "CURRENT"
+# Bumped when the file layout changes; builds of another layout are ignored
+LAYOUT = 2
+DEFAULT_KEEP = 2
+DEFAULT_DELAY = 10
+# Table -> (model, partition column or None)
+TABLES = {
+    "patients": (Patient, None),
+    "conditions": (Condition, "description"),
+    "observations": (Observation, "description"),
+}
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def get_snapshot_dir():
+    return Path(
+        getattr(settings, "HEALIX_SNAPSHOT_DIR", settings.BASE_DIR / "snapshots")
+    )
+
+
+def table_schema(table):
+    model, _ = TABLES[table]
+    return arrow_schema(model, export_columns(model))
+
+
+def _partition_key(value):
+    """Fixed-length partition key of a partition column value."""
+    if value is None:
+        return None
+    return hashlib.blake2b(str(value).encode(), digest_size=8).hexdigest()
+
+
+def _partition_field(table):
+    _, column = TABLES[table]
+    return None if column is None else f"{column}_key"
+
+
+def _partitioning(table):
+    field = _partition_field(table)
+    if field is None:
+        return None
+    # Explicit types, so that all-digit keys stay strings
+    return ds.partitioning(pa.schema([pa.field(field, pa.string())]), flavor="hive")
+
+
+def _partition_dir(table, value):
+    # Hive naming, as read back by ds.partitioning(flavor="hive")
+    key = _partition_key(value)
+    return f"{_partition_field(table)}={key or '__HIVE_DEFAULT_PARTITION__'}"
+
+
+def _runs(batch, column):
+    """``(value, slice)`` for each run of equal ``column`` values in ``batch``."""
+    values = batch.column(column).to_pylist()
+    start = 0
+    for end in range(1, len(values) + 1):
+        if end == len(values) or values[end] != values[start]:
+            yield values[start], batch.slice(start, end - start)
+            start = end
+
+
+def _write_table(table, directory):
+    """
+    Write ``table`` under ``directory`` and return its row count. Partitioned
+    tables are read ordered by the partition column, so every value is one
+    contiguous run written to a single file, one row group per chunk; values
+    whose keys collide share a partition directory.
+    """
+    model, column = TABLES[table]
+    columns = export_columns(model)
+    schema = table_schema(table)
+    ordering = ["pk"] if column is None else [column, "pk"]
+    chunks = iter_chunks(model.objects.order_by(*ordering), columns)
+    directory.mkdir(parents=True)
+    if column is None:
+        rows = 0
+        with pq.ParquetWriter(
+            directory / "part-0.parquet", schema, compression="snappy"
+        ) as writer:
+            for batch in record_batches(chunks, schema):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    rows, writer, partition, files = 0, None, None, 0
+    try:
+        for batch in record_batches(chunks, schema):
+            rows += batch.num_rows
+            for value, run in _runs(batch, column):
+                if writer is None or value != partition:
+                    if writer is not None:
+                        writer.close()
+                    path = directory / _partition_dir(table, value)
+                    path.mkdir(exist_ok=True)
+                    writer = pq.ParquetWriter(
+                        path / f"part-{files}.parquet", schema, compression="snappy"
+                    )
+                    partition, files = value, files + 1
+                writer.write_batch(run)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def build_snapshot():
+    """Export every table to a new snapshot, publish it and return its manifest."""
+    root = get_snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    version, _ = get_dataset_version()
+    # Sorts by version, then build time
+    name = f"{version:012d}-{time.time_ns():020d}-{uuid.uuid4().hex[:6]}"
+    # Hidden until complete, so pruning and readers ignore it
+    building = root / f".{name}"
+    try:
+        rows = {table: _write_table(table, building / table) for table in TABLES}
+        building.rename(root / name)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    manifest = {
+        "layout": LAYOUT,
+        "version": version,
+        "path": name,
+        "built_at": timezone.now().isoformat(),
+        "rows": rows,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    published = read_manifest(root)
+    if published is None or published["version"] <= version:
+        temporary = root / f".{MANIFEST}-{name}"
+        temporary.write_text(json.dumps(manifest))
+        os.replace(temporary, root / MANIFEST)
+    # else a concurrent build of newer data has already been published
+    prune_snapshots(root)
+    return manifest
+
+
+def read_manifest(root=None):
+    """The published manifest, or ``None`` if no snapshot has been built."""
+    try:
+        return json.loads(((root or get_snapshot_dir()) / MANIFEST).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def prune_snapshots(root=None):
+    """Delete all but the newest ``HEALIX_SNAPSHOT_KEEP`` published builds."""
+    root = root or get_snapshot_dir()
+    keep = getattr(settings, "HEALIX_SNAPSHOT_KEEP", DEFAULT_KEEP)
+    manifest = read_manifest(root)
+    current = manifest["path"] if manifest else None
+    builds = sorted(
+        path.name
+        for path in root.iterdir()
+        if path.is_dir() and not path.name.startswith(".")
+    )
+    for name in builds[: max(len(builds) - keep, 0)]:
+        if name != current:
+            shutil.rmtree(root / name, ignore_errors=True)
+
+
+class Snapshot:
+    """A published snapshot; tables are loaded on first use and kept."""
+
+    def __init__(self, path, manifest):
+        self.path = Path(path)
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self._datasets = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def dataset(self, table):
+        # Files are discovered once; a published snapshot never changes
+        with self._lock:
+            if table not in self._datasets:
+                schema = table_schema(table)
+                if _partition_field(table) is not None:
+                    schema = schema.append(
+                        pa.field(_partition_field(table), pa.string())
+                    )
+                self._datasets[table] = ds.dataset(
+                    self.path / table,
+                    schema=schema,
+                    format="parquet",
+                    partitioning=_partitioning(table),
+                    filesystem=pafs.LocalFileSystem(use_mmap=True),
+                )
+            return self._datasets[table]
+
+    def table(self, table, columns=None, **equals):
+        """
+        Arrow table of ``columns`` (default all) of ``table``, restricted to
+        rows whose columns equal ``equals``; filters on the partition column
+        only read the matching partition.
+        """
+        _, partition = TABLES[table]
+        condition = None
+        for column, value in equals.items():
+            term = ds.field(column) == value
+            if column == partition and value is not None:
+                term &= ds.field(_partition_field(table)) == _partition_key(value)
+            condition = term if condition is None else condition & term
+        return self.dataset(table).to_table(
+            columns=columns or table_schema(table).names, filter=condition
+        )
+
+    def frame(self, table, columns, index=None):
+        """
+        pandas frame of ``columns`` of a whole table, cached per process.
+        Strings are categorical, which makes grouping by them cheap, unless the
+        frame is indexed by the lookup column ``index``.
+        """
+        key = (table, tuple(columns), index)
+        if key not in self._frames:
+            arrow = self.table(table, list(columns))
+            if index is None:
+                frame = arrow.to_pandas(strings_to_categorical=True)
+            else:
+                frame = arrow.to_pandas().set_index(index)
+            with self._lock:
+                self._frames.setdefault(key, frame)
+        return self._frames[key]
+
+
+def current_snapshot():
+    """
+    The published ``Snapshot``, or ``None`` if none has been built with the
+    current layout.
+    """
+    global _current
+    root = get_snapshot_dir()
+    manifest = read_manifest(root)
+    if manifest is None or manifest.get("layout") != LAYOUT:
+        return None
+    with _current_lock:
+        if _current is None or _current.path != root / manifest["path"]:
+            _current = Snapshot(root / manifest["path"], manifest)
+        return _current
+
+
+class BuildScheduler:
+    """
+    Runs one background snapshot build per burst of uploads: the first upload
+    to commit starts a timer, and uploads committing before it fires are
+    covered by the same build.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self, delay):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(delay, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    @property
+    def pending(self):
+        return self._timer is not None
+
+    def _fire(self):
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                return  # Already run by run_pending
+            self._timer = None
+        try:
+            self._build()
+        finally:
+            connection.close()
+
+    def run_pending(self):
+        """Run a scheduled build now, in this thread; ``False`` if none was."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is None:
+            return False
+        timer.cancel()
+        self._build()
+        return True
+
+    def _build(self):
+        with self._build_lock:
+            try:
+                build_snapshot()
+            except Exception:
+                # The uploads succeeded; readers fall back to the database
+                logger.exception("Building the analytics snapshot failed")
+
+
+scheduler = BuildScheduler()
+
+
+def _schedule_build():
+    scheduler.schedule(getattr(settings, "HEALIX_SNAPSHOT_DELAY", DEFAULT_DELAY))
+
+
+@receiver(dataset_loaded)
+def snapshot_after_upload(sender, **kwargs):
+    if getattr(settings, "HEALIX_SNAPSHOT_ON_UPLOAD", True):
+        transaction.on_commit(_schedule_build)
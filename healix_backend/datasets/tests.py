@@ -1,3 +1,1045 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from healix_backend import metrics
+from healix_backend.lazy import LazyModule
+from .jobs import fail_orphaned_jobs
+from .parallel import ingest_parallel, shard_file
+from .query_plans import explain, hot_queries
+from .signals import rows_written
+from .snapshot import build_snapshot, current_snapshot, read_manifest, scheduler
+from .versioning import get_dataset_version
+from . import vitals
+from .vitals import derive_vitals
+from .management.commands._synthetic import observations_frame
+from .ingestion import (
+    PatientResolver,
+    clean_observation_value,
+    clean_observation_values,
+)
+from .models import Patient, Condition, Observation, IngestionJob
+
+PATIENTS_CSV = """Id,BIRTHDATE,GENDER
+p1,1980-05-01,M
+p2,1992-11-20,F
+p3,,F
+"""
+
+CONDITIONS_CSV = """START,PATIENT,DESCRIPTION
+2015-03-02,p1,Hypertension
+2018-07-19,p2,Prediabetes
+,p2,Hyperlipidemia
+"""
+
+OBSERVATIONS_CSV = """DATE,PATIENT,DESCRIPTION,VALUE,UNITS
+2019-01-01T10:00:00Z,p1,Body Mass Index,31.2,kg/m2
+2019-01-01T10:00:00Z,p1,Systolic Blood Pressure,>150 mm[Hg],mm[Hg]
+2019-01-02T10:00:00Z,p2,Body Weight,"1,250",g
+2019-01-02T10:00:00Z,p2,Tobacco smoking status,Unknown,
+"""
+
+
+def csv_file(content, name="data.csv"):
+    return SimpleUploadedFile(name, content.encode(), content_type="text/csv")
+
+
+class UploadMixin:
+    """``upload`` posts CSV ``content`` with ``upload_params`` plus ``params``."""
+
+    upload_params = {"wait": "true"}
+
+    def upload(self, kind, content, **params):
+        url = f"/api/datasets/upload/{kind}/"
+        query = urlencode({**self.upload_params, **params})
+        return self.client.post(
+            f"{url}?{query}" if query else url,
+            {"file": csv_file(content)},
+            format="multipart",
+        )
+
+
+class DatasetUploadTests(UploadMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_upload_all_tables(self):
+        response = self.upload("patients", PATIENTS_CSV)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["rows"], 3)
+        self.assertIn("rows_per_second", response.data)
+        self.assertEqual(
+            Patient.objects.get(id="p1").birthdate, datetime.date(1980, 5, 1)
+        )
+        self.assertIsNone(Patient.objects.get(id="p3").age)
+
+        self.assertEqual(self.upload("conditions", CONDITIONS_CSV).status_code, 201)
+        self.assertEqual(Condition.objects.count(), 3)
+        self.assertIsNone(
+            Condition.objects.get(description="Hyperlipidemia").start_date
+        )
+
+        response = self.upload("observations", OBSERVATIONS_CSV, batch_size=1)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["chunks"], 4)
+        values = dict(Observation.objects.values_list("description", "value"))
+        self.assertEqual(values["Systolic Blood Pressure"], 150.0)
+        self.assertEqual(values["Body Weight"], 1250.0)
+        self.assertIsNone(values["Tobacco smoking status"])
+        self.assertEqual(Observation.objects.filter(units__isnull=True).count(), 1)
+
+    def test_missing_file(self):
+        response = self.client.post("/api/datasets/upload/patients/", {})
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_columns(self):
+        response = self.upload("patients", "Id,GENDER\np1,M\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("BIRTHDATE", response.data["error"])
+
+    def test_duplicate_patients_rejected(self):
+        self.upload("patients", PATIENTS_CSV)
+        response = self.upload("patients", PATIENTS_CSV)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["duplicate_patient_ids"], ["p1", "p2", "p3"])
+
+    def test_invalid_rows_reported_together(self):
+        response = self.upload(
+            "patients",
+            "Id,BIRTHDATE,GENDER\np1,not-a-date,M\np2,1990-01-01,UNSPECIFIED\n",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data["rows"]), 2)
+        self.assertFalse(Patient.objects.exists())
+
+    def test_unknown_patients_reported_together(self):
+        Patient.objects.create(id="p2")
+        response = self.upload("conditions", CONDITIONS_CSV, batch_size=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["missing_patient_ids"], ["p1"])
+        self.assertEqual(response.data["skipped_rows"], 1)
+        self.assertEqual(response.data["rows"], 2)
+        self.assertEqual(Condition.objects.count(), 2)
+
+    def test_streaming_and_whole_file_modes_match(self):
+        self.upload("patients", PATIENTS_CSV)
+        streamed = self.upload("observations", OBSERVATIONS_CSV, batch_size=3)
+        self.assertEqual(streamed.data["chunks"], 2)
+        rows = list(Observation.objects.values_list("description", "value", "date"))
+        Observation.objects.all().delete()
+
+        whole = self.upload("observations", OBSERVATIONS_CSV, stream="false")
+        self.assertEqual(whole.status_code, 201, whole.data)
+        self.assertEqual(
+            sorted(rows, key=str),
+            sorted(
+                Observation.objects.values_list("description", "value", "date"), key=str
+            ),
+        )
+
+    def test_version_is_bumped_after_chunk_receivers(self):
+        seen = []
+
+        def receiver(sender, **kwargs):
+            seen.append(get_dataset_version()[0])
+
+        rows_written.connect(receiver)
+        self.addCleanup(rows_written.disconnect, receiver)
+        before = get_dataset_version()[0]
+        self.upload("patients", PATIENTS_CSV, batch_size=2)
+        self.upload("observations", OBSERVATIONS_CSV)
+        # One bump per chunk, none while the receivers run
+        self.assertEqual(seen, [before, before + 1, before + 2])
+        self.assertEqual(get_dataset_version()[0], before + 3)
+
+
+class IngestionJobTests(UploadMixin, TestCase):
+    # Queued rather than run in the request
+    upload_params = {}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.upload_dir.cleanup)
+        overrides = override_settings(
+            HEALIX_INGEST_EXECUTOR="inline", HEALIX_UPLOAD_DIR=self.upload_dir.name
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_upload_returns_job_and_reports_progress(self):
+        response = self.upload("patients", PATIENTS_CSV)
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertIn(response.data["job_id"], response.data["status_url"])
+
+        job = self.client.get(response.data["status_url"]).data
+        self.assertEqual(job["status"], IngestionJob.SUCCEEDED)
+        self.assertEqual(job["rows_processed"], 3)
+        self.assertEqual(job["progress"], 1.0)
+        self.assertEqual(job["eta_seconds"], 0)
+        self.assertIsNotNone(job["rows_per_second"])
+        self.assertEqual(Patient.objects.count(), 3)
+        self.assertEqual(os.listdir(self.upload_dir.name), [])
+
+    def test_failed_job_keeps_errors(self):
+        response = self.upload("conditions", CONDITIONS_CSV)
+        job = self.client.get(response.data["status_url"]).data
+        self.assertEqual(job["status"], IngestionJob.FAILED)
+        self.assertEqual(job["errors"]["missing_patient_ids"], ["p1", "p2"])
+
+    def test_invalid_rows_fail_the_job(self):
+        response = self.upload("patients", "Id,BIRTHDATE,GENDER\np1,notadate,M\n")
+        self.assertEqual(response.status_code, 202, response.data)
+        job = self.client.get(response.data["status_url"]).data
+        self.assertEqual(job["status"], IngestionJob.FAILED)
+        self.assertEqual(len(job["errors"]["rows"]), 1)
+        self.assertEqual(job["rows_processed"], 0)
+        self.assertEqual(os.listdir(self.upload_dir.name), [])
+
+    def test_orphaned_jobs_are_failed(self):
+        def queued(owner_pid, status=IngestionJob.QUEUED, host=socket.gethostname()):
+            path = os.path.join(self.upload_dir.name, f"{host}-{owner_pid}.csv")
+            with open(path, "w") as handle:
+                handle.write(PATIENTS_CSV)
+            return IngestionJob.objects.create(
+                kind="patients",
+                status=status,
+                file_path=path,
+                owner_host=host,
+                owner_pid=owner_pid,
+            )
+
+        # Far above any real PID (pid_max is at most 2**22)
+        exited = queued(2**30)
+        running = queued(2**30 + 1, IngestionJob.RUNNING)
+        live = queued(os.getpid())
+        # Its PID means nothing here
+        other_host = queued(2**30, host="another-host")
+
+        self.assertEqual(fail_orphaned_jobs(), 2)
+        for job in (exited, running):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.FAILED)
+            self.assertIsNotNone(job.errors)
+            self.assertFalse(os.path.exists(job.file_path))
+        for job in (live, other_host):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.QUEUED)
+            self.assertTrue(os.path.exists(job.file_path))
+
+
+class ParallelIngestionTests(TestCase):
+    def write_csv(self, content):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_shards_align_on_lines(self):
+        path = self.write_csv(OBSERVATIONS_CSV)
+        header, shards = shard_file(path, shard_bytes=10)
+        self.assertEqual(header, b"DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n")
+        self.assertEqual(len(shards), 4)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertEqual(b"".join(data[a:b] for a, b in shards), data[len(header) :])
+        self.assertTrue(all(data[b - 1 : b] == b"\n" for _, b in shards))
+
+    def test_parallel_matches_serial(self):
+        Patient.objects.bulk_create([Patient(id="p1"), Patient(id="p2")])
+        path = self.write_csv(OBSERVATIONS_CSV)
+        stats = ingest_parallel("observations", path, workers=2, shard_bytes=60)
+        self.assertEqual(stats.rows, 4)
+        values = dict(Observation.objects.values_list("description", "value"))
+        self.assertEqual(values["Systolic Blood Pressure"], 150.0)
+        self.assertEqual(values["Body Weight"], 1250.0)
+
+
+class BenchmarkCommandTests(TestCase):
+    """Run the ingestion benchmarks on a few rows to keep them working."""
+
+    def run_command(self, name, **options):
+        out = io.StringIO()
+        call_command(name, stdout=out, **options)
+        self.assertFalse(Observation.objects.exists())
+        return out.getvalue()
+
+    def test_benchmark_ingestion(self):
+        output = self.run_command(
+            "benchmark_ingestion", rows=300, legacy_rows=20, patients=5
+        )
+        self.assertIn("(300 rows", output)
+
+    def test_benchmark_parallel_ingestion(self):
+        output = self.run_command(
+            "benchmark_parallel_ingestion", rows=300, patients=5, workers=[1]
+        )
+        self.assertIn(" 1 workers:", output)
+
+    def test_benchmark_upload_memory_measurements(self):
+        # The parent command reruns itself in child processes on the default
+        # database, so the test drives the in-process measurements directly.
+        handle = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        observations_frame(300, 5).to_csv(handle.name, index=False)
+        for mode in ("memory", "stream"):
+            with self.subTest(mode):
+                output = self.run_command(
+                    "benchmark_upload_memory",
+                    measure=mode,
+                    path=handle.name,
+                    patients=5,
+                )
+                self.assertIn("peak", output)
+
+
+class PatientResolverTests(TestCase):
+    def setUp(self):
+        Patient.objects.bulk_create(Patient(id=f"p{i}") for i in range(5))
+
+    def test_known_ids_are_not_queried_again(self):
+        resolver = PatientResolver()
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.resolve(["p0", "p1", "x"]), {"x"})
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(["p1", "p0", "x"]), {"x"})
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.resolve(["p0", "p2"]), set())
+        self.assertEqual(resolver.missing, {"x"})
+
+    def test_cache_is_bounded(self):
+        resolver = PatientResolver(max_size=2)
+        self.assertEqual(resolver.resolve(["p0", "p1", "p2", "x"]), {"x"})
+        self.assertEqual(len(resolver.known), 2)
+        self.assertEqual(resolver.resolve(["p3"]), set())
+        self.assertEqual(len(resolver.known), 2)
+        self.assertIn("p3", resolver.known)
+
+
+class CleanObservationValuesParityTests(SimpleTestCase):
+    """The column cleaner must agree with the scalar cleaner value for value."""
+
+    CASES = [
+        "31.2",
+        "  31.2  ",
+        "120 mm[Hg]",
+        ">150",
+        "<0.5 mg/dL",
+        "=7",
+        "1,250",
+        "1,250.5 g",
+        "12,5",
+        ">1,000 cells",
+        "-4.5",
+        "+3",
+        "1e3",
+        ".5",
+        "5.",
+        "1_000",
+        "inf",
+        "nan",
+        ">",
+        ">>5",
+        "<=5",
+        "abc",
+        "Never smoked tobacco (finding)",
+        "N/A",
+        "NULL",
+        "Missing",
+        "Unknown",
+        "",
+        " N/A",
+        None,
+        np.nan,
+        42,
+        98.6,
+    ]
+
+    def assertParity(self, values):
+        expected = [clean_observation_value(v) for v in values]
+        actual = clean_observation_values(pd.Series(values, dtype=object))
+        for raw, want, got in zip(values, expected, actual):
+            if want is None or math.isnan(want):
+                self.assertTrue(pd.isna(got), f"{raw!r}: expected missing, got {got!r}")
+            else:
+                self.assertEqual(got, want, f"{raw!r}")
+
+    def test_known_formats(self):
+        self.assertParity(self.CASES)
+
+    def test_randomized_values(self):
+        rng = np.random.default_rng(7)
+        numbers = rng.uniform(-1e6, 1e6, 2000).round(2)
+        prefixes = rng.choice(["", "<", ">", "="], 2000)
+        units = rng.choice(["", " kg", " mm[Hg]", " %"], 2000)
+        values = [
+            f"{prefix}{number:,}{unit}" if i % 3 else f"{prefix}{number}{unit}"
+            for i, (prefix, number, unit) in enumerate(zip(prefixes, numbers, units))
+        ]
+        self.assertParity(values + self.CASES)
+
+    def test_numeric_column(self):
+        self.assertParity([1.5, np.nan, 3.0, 1e20])
+
+    def test_whitespace_only_is_missing(self):
+        # The scalar cleaner raises IndexError here; the column cleaner skips it
+        self.assertTrue(pd.isna(clean_observation_values(pd.Series(["   "]))[0]))
+
+    def test_preserves_index(self):
+        series = pd.Series(["1", "2"], index=[10, 11])
+        self.assertEqual(list(clean_observation_values(series).index), [10, 11])
+
+
+class UpsertModeTests(UploadMixin, TestCase):
+    upload_params = {"wait": "true", "mode": "upsert"}
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_reimport_is_idempotent(self):
+        for kind, content in (
+            ("patients", PATIENTS_CSV),
+            ("conditions", CONDITIONS_CSV),
+            ("observations", OBSERVATIONS_CSV),
+        ):
+            first = self.upload(kind, content)
+            self.assertEqual(first.status_code, 201, first.data)
+            again = self.upload(kind, content)
+            self.assertEqual(again.status_code, 201, again.data)
+            self.assertEqual(again.data["unchanged_rows"], again.data["rows"])
+        self.assertEqual(Patient.objects.count(), 3)
+        self.assertEqual(Condition.objects.count(), 3)
+        self.assertEqual(Observation.objects.count(), 4)
+
+    def test_changed_rows_are_updated(self):
+        self.upload("patients", PATIENTS_CSV)
+        self.upload("observations", OBSERVATIONS_CSV)
+        changed = OBSERVATIONS_CSV.replace("31.2,kg/m2", "29.9,kg/m2")
+        response = self.upload("observations", changed)
+        self.assertEqual(response.data["unchanged_rows"], 3)
+        self.assertEqual(Observation.objects.count(), 4)
+        self.assertEqual(
+            Observation.objects.get(description="Body Mass Index").value, 29.9
+        )
+
+        response = self.upload(
+            "patients", PATIENTS_CSV.replace("p2,1992-11-20,F", "p2,1992-11-20,M")
+        )
+        self.assertEqual(response.data["unchanged_rows"], 2)
+        self.assertEqual(Patient.objects.get(id="p2").gender, "M")
+
+    def test_insert_mode_skips_existing_rows(self):
+        self.upload("patients", PATIENTS_CSV)
+        self.upload("conditions", CONDITIONS_CSV, mode="insert")
+        response = self.upload("conditions", CONDITIONS_CSV, mode="insert")
+        self.assertEqual(response.status_code, 201, response.data)
+        # The condition without a start date has no natural key
+        self.assertEqual(response.data["duplicate_rows"], 2)
+        self.assertEqual(Condition.objects.count(), 4)
+
+        response = self.upload("patients", PATIENTS_CSV, mode="insert")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("p1", response.data["duplicate_patient_ids"])
+
+    def test_first_row_of_a_key_wins_in_both_modes(self):
+        self.upload("patients", PATIENTS_CSV)
+        same_day = (
+            "DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n"
+            "2019-01-01T08:00:00Z,p1,Heart rate,70,/min\n"
+            "2019-01-01T12:00:00Z,p1,Heart rate,80,/min\n"
+            "2019-01-01T18:00:00Z,p1,Heart rate,90,/min\n"
+        )
+        for mode in ("insert", "upsert"):
+            for batch_size in (1000, 1):
+                with self.subTest(mode=mode, batch_size=batch_size):
+                    Observation.objects.all().delete()
+                    response = self.upload(
+                        "observations", same_day, mode=mode, batch_size=batch_size
+                    )
+                    self.assertEqual(response.status_code, 201, response.data)
+                    self.assertEqual(response.data["duplicate_rows"], 2)
+                    self.assertEqual(response.data["skipped_rows"], 2)
+                    self.assertEqual(
+                        list(Observation.objects.values_list("value", flat=True)),
+                        [70.0],
+                    )
+
+        # Re-importing the same file keeps the stored first row
+        response = self.upload("observations", same_day, batch_size=1)
+        self.assertEqual(response.data["unchanged_rows"], 1)
+        self.assertEqual(Observation.objects.get().value, 70.0)
+
+    def test_invalid_mode(self):
+        response = self.upload("patients", PATIENTS_CSV, mode="merge")
+        self.assertEqual(response.status_code, 400)
+
+
+class DatasetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        patients = [Patient(id=f"p{i:02d}", gender="F") for i in range(7)]
+        Patient.objects.bulk_create(patients)
+        Observation.objects.bulk_create(
+            Observation(patient=patient, description="Heart rate", value=i)
+            for i, patient in enumerate(patients * 3)
+        )
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row["id"] for row in response.data["results"])
+            pages += 1
+            if not response.data["next"]:
+                return ids, pages
+            response = self.client.get(response.data["next"])
+
+    def test_walks_table_in_primary_key_order(self):
+        ids, pages = self.walk("/api/datasets/observations/", page_size=4)
+        expected = list(Observation.objects.order_by("id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 6)
+
+        ids, _ = self.walk("/api/datasets/patients/", page_size=3)
+        self.assertEqual(ids, [f"p{i:02d}" for i in range(7)])
+
+    def test_pages_skip_count_unless_requested(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/datasets/observations/")
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 21)
+
+        response = self.client.get(
+            "/api/datasets/observations/", {"page_size": 5, "count": "true"}
+        )
+        self.assertEqual(response.data["count"], 21)
+        self.assertEqual(len(response.data["results"]), 5)
+
+    @override_settings(HEALIX_DATASET_PAGE_SIZE=2, HEALIX_DATASET_MAX_PAGE_SIZE=5)
+    def test_page_size_defaults_and_cap(self):
+        response = self.client.get("/api/datasets/conditions/")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/datasets/observations/")
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get("/api/datasets/observations/", {"page_size": 50})
+        self.assertEqual(len(response.data["results"]), 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Patient.objects.bulk_create(
+            [Patient(id="p1", gender="M", bmi=27.5), Patient(id="p2", gender="F")]
+        )
+        Observation.objects.bulk_create(
+            Observation(
+                patient_id=patient_id,
+                description="Heart rate",
+                value=60.0 + day,
+                units="/min",
+                date=datetime.date(2020, 1, day),
+            )
+            for patient_id in ("p1", "p2")
+            for day in range(1, 6)
+        )
+
+    def export(self, kind, **params):
+        headers = {
+            key: params.pop(key) for key in list(params) if key.startswith("HTTP_")
+        }
+        response = self.client.get(f"/api/datasets/{kind}/export/", params, **headers)
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def test_csv(self):
+        response = self.export("observations", HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.body.decode())))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(
+            list(rows[0]),
+            ["id", "patient_id", "description", "value", "units", "date"],
+        )
+        self.assertEqual(rows[0]["date"], "2020-01-01")
+
+    def test_ndjson_with_filters_and_fields(self):
+        response = self.export(
+            "observations",
+            output="ndjson",
+            patient="p2",
+            since="2020-01-04",
+            fields="patient_id,value,date",
+        )
+        rows = [json.loads(line) for line in response.body.decode().splitlines()]
+        self.assertEqual(
+            rows,
+            [
+                {"patient_id": "p2", "value": 64.0, "date": "2020-01-04"},
+                {"patient_id": "p2", "value": 65.0, "date": "2020-01-05"},
+            ],
+        )
+
+    def test_parquet_and_arrow(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        response = self.export("patients", output="parquet")
+        table = pq.read_table(io.BytesIO(response.body))
+        self.assertEqual(table.column("id").to_pylist(), ["p1", "p2"])
+        self.assertEqual(table.column("bmi").to_pylist(), [27.5, None])
+        self.assertEqual(table.schema.field("birthdate").type, pa.date32())
+
+        response = self.export("observations", output="arrow", description="Nope")
+        table = pa.ipc.open_stream(response.body).read_all()
+        self.assertEqual(table.num_rows, 0)
+        self.assertIn("value", table.column_names)
+
+    @override_settings(HEALIX_EXPORT_CHUNK_SIZE=3)
+    def test_streams_in_chunks(self):
+        response = self.client.get("/api/datasets/observations/export/")
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(b"".join(chunks).splitlines()), 11)
+
+    def test_gzip(self):
+        response = self.export("observations", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        lines = gzip.decompress(response.body).decode().splitlines()
+        self.assertEqual(len(lines), 11)
+
+        # Parquet compresses its own pages
+        response = self.export(
+            "observations", output="parquet", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"output": "xlsx"},
+            {"fields": "id,secret"},
+            {"since": "2020-02-30"},
+        ):
+            with self.subTest(**params):
+                response = self.export("observations", **params)
+                self.assertEqual(response.status_code, 400)
+
+
+class PatientProfileTests(TestCase):
+    url = "/api/datasets/patients/p1/profile/"
+
+    def setUp(self):
+        self.client = APIClient()
+        Patient.objects.bulk_create(
+            [Patient(id="p1", gender="F", bmi=24.5), Patient(id="p2", gender="M")]
+        )
+        Condition.objects.bulk_create(
+            Condition(
+                patient_id=patient_id,
+                description=description,
+                start_date=datetime.date(2019, month, 1),
+            )
+            for patient_id in ("p1", "p2")
+            for month, description in ((3, "Hypertension"), (1, "Prediabetes"))
+        )
+        Observation.objects.bulk_create(
+            Observation(
+                patient_id="p1",
+                description="Heart rate",
+                value=70.0 + day,
+                units="/min",
+                date=datetime.date(2020, 1, day),
+            )
+            for day in range(1, 21)
+        )
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_is_fixed(self):
+        for lightweight in ("false", "true"):
+            with self.subTest(lightweight=lightweight):
+                # Patient, conditions, observations
+                with self.assertNumQueries(3):
+                    profile = self.get(lightweight=lightweight)
+                self.assertEqual(len(profile["observations"]), 20)
+                self.assertEqual(
+                    [c["description"] for c in profile["conditions"]],
+                    ["Prediabetes", "Hypertension"],
+                )
+                with self.assertNumQueries(1):
+                    self.get(lightweight=lightweight, include="")
+
+    def test_lightweight_path_matches_serializers(self):
+        self.assertEqual(self.get(), self.get(lightweight="true"))
+        self.assertEqual(
+            self.get(**{"fields": "id,bmi", "fields[conditions]": "description"}),
+            self.get(
+                **{
+                    "fields": "id,bmi",
+                    "fields[conditions]": "description",
+                    "lightweight": "true",
+                }
+            ),
+        )
+
+    def test_sparse_fieldsets(self):
+        params = {
+            "fields": "id,bmi",
+            "include": "observations",
+            "fields[observations]": "date,value",
+        }
+        for lightweight in ("false", "true"):
+            with self.subTest(lightweight=lightweight):
+                with self.assertNumQueries(2):
+                    profile = self.get(lightweight=lightweight, **params)
+                self.assertEqual(set(profile), {"id", "bmi", "observations"})
+                self.assertEqual(
+                    profile["observations"][0], {"date": "2020-01-01", "value": 71.0}
+                )
+
+    def test_errors(self):
+        for lightweight in ("false", "true"):
+            response = self.client.get(
+                "/api/datasets/patients/missing/profile/", {"lightweight": lightweight}
+            )
+            self.assertEqual(response.status_code, 404)
+        for params in ({"fields": "ssn"}, {"include": "visits"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_str_does_not_load_patient(self):
+        condition = Condition.objects.first()
+        observation = Observation.objects.first()
+        with self.assertNumQueries(0):
+            self.assertIn("Patient p1", str(condition))
+            self.assertIn("Patient p1", str(observation))
+
+
+VITALS_CSV = """DATE,PATIENT,DESCRIPTION,VALUE,UNITS
+2019-01-01T10:00:00Z,p1,Body Mass Index,31.2,kg/m2
+2020-06-01T10:00:00Z,p1,Body Mass Index,29.8,kg/m2
+2018-03-01T10:00:00Z,p1,Body Mass Index,35.0,kg/m2
+2020-06-01T10:00:00Z,p1,Systolic Blood Pressure,142,mm[Hg]
+2020-06-01T10:00:00Z,p1,Diastolic Blood Pressure,91,mm[Hg]
+2020-06-01T10:00:00Z,p1,Heart rate,77,/min
+2019-02-01T10:00:00Z,p2,Systolic Blood Pressure,118,mm[Hg]
+2019-02-01T10:00:00Z,p2,Body Weight,61,kg
+"""
+
+
+class VitalsDerivationTests(UploadMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.upload("patients", PATIENTS_CSV)
+
+    def upload(self, kind, content, **params):
+        response = super().upload(kind, content, **params)
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def vitals(self, patient_id):
+        return Patient.objects.values(
+            "bmi", "sys_bp", "dia_bp", "heart_rate", "bp_category"
+        ).get(id=patient_id)
+
+    def test_upload_derives_latest_values(self):
+        self.upload("observations", VITALS_CSV)
+        self.assertEqual(
+            self.vitals("p1"),
+            {
+                "bmi": 29.8,
+                "sys_bp": 142.0,
+                "dia_bp": 91.0,
+                "heart_rate": 77.0,
+                "bp_category": "severe",
+            },
+        )
+        self.assertEqual(
+            self.vitals("p2"),
+            {
+                "bmi": None,
+                "sys_bp": 118.0,
+                "dia_bp": None,
+                "heart_rate": None,
+                "bp_category": "normal",
+            },
+        )
+        self.assertEqual(self.vitals("p3")["bp_category"], None)
+
+    def test_later_uploads_only_touch_their_patients(self):
+        self.upload("observations", VITALS_CSV)
+        Patient.objects.filter(id="p2").update(heart_rate=99.0)
+        self.upload(
+            "observations",
+            "DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n"
+            "2021-01-01T10:00:00Z,p1,Systolic Blood Pressure,185,mm[Hg]\n"
+            "2017-01-01T10:00:00Z,p1,Heart rate,60,/min\n",
+        )
+        p1 = self.vitals("p1")
+        self.assertEqual((p1["sys_bp"], p1["bp_category"]), (185.0, "crisis"))
+        # An older observation does not replace the latest one
+        self.assertEqual(p1["heart_rate"], 77.0)
+        self.assertEqual(p1["bmi"], 29.8)
+        # Not in the upload, so not re-derived
+        self.assertEqual(self.vitals("p2")["heart_rate"], 99.0)
+
+    def test_upserted_values_are_rederived(self):
+        self.upload("observations", VITALS_CSV)
+        self.upload(
+            "observations",
+            "DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n"
+            "2020-06-01T10:00:00Z,p1,Systolic Blood Pressure,112,mm[Hg]\n",
+            mode="upsert",
+        )
+        self.assertEqual(self.vitals("p1")["bp_category"], "normal")
+
+    def test_backfill(self):
+        with override_settings(HEALIX_DERIVE_VITALS_ON_UPLOAD=False):
+            self.upload("observations", VITALS_CSV)
+        self.assertIsNone(self.vitals("p1")["bmi"])
+        self.assertEqual(derive_vitals(chunk_size=1), 2)
+        self.assertEqual(self.vitals("p1")["bmi"], 29.8)
+        # Nothing left to change
+        self.assertEqual(derive_vitals(), 0)
+
+    def test_backfill_commits_each_chunk(self):
+        with override_settings(HEALIX_DERIVE_VITALS_ON_UPLOAD=False):
+            self.upload("observations", VITALS_CSV)
+        version = get_dataset_version()[0]
+        derive_chunk = vitals.derive_chunk
+
+        def fail_on_p2(patient_ids):
+            if "p2" in patient_ids:
+                raise RuntimeError("interrupted")
+            return derive_chunk(patient_ids)
+
+        with mock.patch.object(vitals, "derive_chunk", fail_on_p2):
+            with self.assertRaises(RuntimeError):
+                derive_vitals(chunk_size=1)
+        # The first chunk stays committed, with its own version bump
+        self.assertEqual(self.vitals("p1")["bmi"], 29.8)
+        self.assertEqual(get_dataset_version()[0], version + 1)
+
+
+class SnapshotTests(UploadMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.snapshot_dir.cleanup)
+        overrides = override_settings(HEALIX_SNAPSHOT_DIR=self.snapshot_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Never leave a timer to build into another test's directory
+        self.addCleanup(scheduler.run_pending)
+
+    def upload(self, kind, content):
+        # Builds are scheduled once the upload commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = super().upload(kind, content)
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_uploads_publish_a_snapshot(self):
+        self.assertIsNone(current_snapshot())
+        self.upload("patients", PATIENTS_CSV)
+        self.upload("conditions", CONDITIONS_CSV)
+        # Both uploads are covered by one build, run after the responses
+        self.assertIsNone(read_manifest())
+        self.assertTrue(scheduler.run_pending())
+        self.assertFalse(scheduler.run_pending())
+
+        snapshot = current_snapshot()
+        self.assertEqual(snapshot.version, get_dataset_version()[0])
+        self.assertEqual(
+            snapshot.manifest["rows"],
+            {"patients": 3, "conditions": 3, "observations": 0},
+        )
+        partitions = os.listdir(snapshot.path / "conditions")
+        self.assertEqual(len(partitions), 3)
+        self.assertTrue(
+            all(re.fullmatch("description_key=[0-9a-f]{16}", p) for p in partitions)
+        )
+        prediabetes = snapshot.table(
+            "conditions", ["patient_id", "description"], description="Prediabetes"
+        )
+        self.assertEqual(
+            prediabetes.to_pylist(),
+            [{"patient_id": "p2", "description": "Prediabetes"}],
+        )
+        patients = snapshot.frame("patients", ["id", "gender", "birthdate"])
+        self.assertEqual(patients["id"].tolist(), ["p1", "p2", "p3"])
+        self.assertEqual(patients["birthdate"][0], datetime.date(1980, 5, 1))
+        self.assertTrue(pd.isna(patients["birthdate"][2]))
+
+    def test_snapshot_upload_can_be_disabled(self):
+        with override_settings(HEALIX_SNAPSHOT_ON_UPLOAD=False):
+            self.upload("patients", PATIENTS_CSV)
+        self.assertFalse(scheduler.pending)
+        self.assertIsNone(read_manifest())
+
+    def test_partition_values_round_trip(self):
+        Patient.objects.create(id="p1", gender="M")
+        long = "Chronic " * 100  # Longer than a file name may be
+        for description in ("Anemia (disorder) 50%/x", "1999", long, None):
+            Condition.objects.create(patient_id="p1", description=description)
+        snapshot = current_snapshot() if build_snapshot() else None
+        descriptions = snapshot.table("conditions", ["description"]).column(0)
+        self.assertCountEqual(
+            descriptions.to_pylist(), ["Anemia (disorder) 50%/x", "1999", long, None]
+        )
+        for description in ("1999", long):
+            self.assertEqual(
+                snapshot.table(
+                    "conditions", ["patient_id"], description=description
+                ).num_rows,
+                1,
+            )
+        self.assertEqual(
+            snapshot.table("conditions").column_names,
+            ["id", "patient_id", "description", "start_date"],
+        )
+
+    def test_old_builds_are_pruned(self):
+        Patient.objects.create(id="p1", gender="M")
+        paths = [build_snapshot()["path"] for _ in range(3)]
+        self.assertEqual(
+            sorted(os.listdir(self.snapshot_dir.name)), [*paths[1:], "CURRENT"]
+        )
+        self.assertEqual(current_snapshot().path.name, paths[-1])
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        for query in hot_queries():
+            if query.postgresql_only and connection.vendor != "postgresql":
+                continue
+            with self.subTest(query.label):
+                plan = explain(query.queryset)
+                self.assertTrue(
+                    any(name in plan for name in query.indexes),
+                    f"{query.label} does not use {query.indexes[0]}:\n{plan}",
+                )
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_proxy_imports_on_first_use(self):
+        proxy = LazyModule("json")
+        self.assertIn("not loaded", repr(proxy))
+        self.assertEqual(proxy.dumps([1]), "[1]")
+        self.assertIn("(loaded)", repr(proxy))
+
+    def test_urlconf_does_not_import_heavy_modules(self):
+        script = (
+            "import sys, django; django.setup(); "
+            "import healix_backend.urls; "
+            "print(','.join(m for m in "
+            "('numpy', 'pandas', 'joblib', 'pyarrow', 'tensorflow') "
+            "if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        )
+        self.assertEqual(output.stdout.strip(), "")
+
+
+class MetricsTests(UploadMixin, TestCase):
+    upload_params = {}
+
+    def setUp(self):
+        metrics.reset()
+        self.client = APIClient()
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        overrides = override_settings(
+            HEALIX_METRICS_ENABLED=True,
+            HEALIX_INGEST_EXECUTOR="inline",
+            HEALIX_UPLOAD_DIR=upload_dir.name,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_requests_record_latency_and_sql(self):
+        Patient.objects.create(id="p1", gender="F")
+        self.client.get("/api/datasets/patients/")
+        self.client.get("/api/datasets/patients/")
+        labels = {"method": "GET", "endpoint": "/api/datasets/patients/", "status": 200}
+        self.assertEqual(metrics.REQUEST_SECONDS.count(**labels), 2)
+        self.assertGreater(metrics.REQUEST_SECONDS.sum(**labels), 0)
+        endpoint = labels["endpoint"]
+        self.assertEqual(metrics.REQUEST_QUERIES.count(endpoint=endpoint), 2)
+        self.assertGreaterEqual(metrics.REQUEST_QUERIES.sum(endpoint=endpoint), 2)
+
+        self.client.get("/no/such/path/")
+        self.assertEqual(
+            metrics.REQUEST_SECONDS.count(
+                method="GET", endpoint="unmatched", status=404
+            ),
+            1,
+        )
+
+    def test_uploads_record_rows(self):
+        # Queued (run inline here) and in-request uploads
+        self.upload("patients", PATIENTS_CSV)
+        self.upload("patients", PATIENTS_CSV, wait="true", mode="upsert")
+        labels = {"kind": "patients", "status": IngestionJob.SUCCEEDED}
+        self.assertEqual(metrics.UPLOAD_ROWS.count(**labels), 2)
+        self.assertEqual(metrics.UPLOAD_ROWS.sum(**labels), 6)
+        self.assertEqual(metrics.INGESTED_ROWS.value(kind="patients"), 6)
+
+        self.upload("conditions", CONDITIONS_CSV.replace("p2", "nobody"))
+        self.assertEqual(
+            metrics.UPLOAD_SECONDS.count(kind="conditions", status=IngestionJob.FAILED),
+            1,
+        )
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/datasets/patients/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn("# TYPE healix_http_request_duration_seconds histogram", text)
+        self.assertIn(
+            'healix_http_request_duration_seconds_count{method="GET",'
+            'endpoint="/api/datasets/patients/",status="200"} 1',
+            text,
+        )
+        self.assertIn('le="+Inf"', text)
+
+    def test_disabled(self):
+        with override_settings(HEALIX_METRICS_ENABLED=False):
+            client = APIClient()
+            client.get("/api/datasets/patients/")
+            self.assertEqual(client.get("/metrics").status_code, 404)
+        self.assertNotIn("healix_http_request_duration_seconds_count", metrics.render())
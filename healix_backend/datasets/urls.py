@@ -5,6 +5,7 @@ from .views import (
     ConditionViewSet,
     ObservationViewSet,
     DatasetUploadViewSet,
+    IngestionJobViewSet,
 )
 
 router = DefaultRouter()
@@ -14,6 +15,7 @@ router.register(r"observations", ObservationViewSet)
 router.register(
     r"upload", DatasetUploadViewSet, basename="upload"
 )  # Register upload viewset
+router.register(r"jobs", IngestionJobViewSet, basename="ingestion-job")
 
 urlpatterns = [
     path("", include(router.urls)),
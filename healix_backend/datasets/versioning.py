@@ -0,0 +1,56 @@
+"""
+Dataset version counter.
+
+Responses derived from the raw tables (such as the insights endpoints) stay
+valid until the data changes, so they are cached under the current
+``DatasetVersion``. Every bulk-loaded chunk and every single-row save or delete
+bumps the counter; cached entries for older versions are never read again and
+age out of their cache. The loaders bump it as the last statement of each
+chunk's transaction, after the ``rows_written`` receivers, so concurrent
+uploads only contend for the version row between that update and the commit.
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Condition, DatasetVersion, Observation, Patient
+
+VERSION_PK = 1
+
+
+def get_dataset_version():
+    """Current ``(version, updated_at)``."""
+    current = (
+        DatasetVersion.objects.filter(pk=VERSION_PK)
+        .values_list("version", "updated_at")
+        .first()
+    )
+    if current is None:
+        row, _ = DatasetVersion.objects.get_or_create(pk=VERSION_PK)
+        current = (row.version, row.updated_at)
+    return current
+
+
+def bump_dataset_version():
+    """
+    Mark the datasets as changed. Call this after writes that bypass model
+    signals, such as ``QuerySet.update()``; inside a transaction the bump
+    becomes visible together with the data.
+    """
+    updated = DatasetVersion.objects.filter(pk=VERSION_PK).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        DatasetVersion.objects.get_or_create(pk=VERSION_PK, defaults={"version": 1})
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Condition)
+@receiver(post_delete, sender=Condition)
+@receiver(post_save, sender=Observation)
+@receiver(post_delete, sender=Observation)
+def bump_after_change(sender, **kwargs):
+    bump_dataset_version()
@@ -1,87 +1,205 @@
-import pandas as pd
+import re
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Patient, Condition, Observation
-from .serializers import PatientSerializer, ConditionSerializer, ObservationSerializer
-import uuid
-
 
-def clean_observation_value(value_str):
+from healix_backend import metrics
+
+from .models import Patient, Condition, Observation, IngestionJob
+from .serializers import (
+    PatientProfileSerializer,
+    PatientSerializer,
+    ConditionSerializer,
+    ObservationSerializer,
+    IngestionJobSerializer,
+)
+from .ingestion import (
+    LOADERS,
+    IngestionError,
+    get_batch_size,
+    get_mode,
+    parse_bool,
+)
+from .export import (
+    COMPRESSED_FORMATS,
+    FORMATS,
+    ExportError,
+    apply_filters,
+    select_columns,
+    stream_export,
+)
+from .pagination import DatasetCursorPagination
+from .profiles import (
+    ProfileError,
+    parse_profile_params,
+    profile_queryset,
+    profile_values,
+)
+from .parallel import get_workers
+from . import jobs
+
+ACCEPTS_GZIP_RE = re.compile(r"\bgzip\b")
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
     """
-    Cleans and converts a string value from the observation dataset to a float or None.
-    Handles various formats including comma decimal separators, thousands separators,
-    units attached, non-numeric prefixes, and missing value representations.
+    Exports are not rendered by DRF, so a client asking for ``text/csv`` must
+    not get 406; error responses fall back to the first renderer.
     """
-    if pd.isna(value_str) or value_str in ["N/A", "NULL", "Missing", "Unknown", ""]:
-        return None  # Handle missing values
-
-    value_text = str(
-        value_str
-    ).strip()  # Convert to string and remove leading/trailing whitespace
-
-    # Remove units if present (assuming unit is separated by space and at the end)
-    parts = value_text.split()
-    numeric_part_str = parts[0]
 
-    # Remove thousands separators (commas and spaces)
-    numeric_part_str = numeric_part_str.replace(",", "").replace(" ", "")
+    def select_parser(self, request, parsers):
+        return parsers[0]
 
-    # Replace comma decimal separator with period
-    numeric_part_str = numeric_part_str.replace(",", ".")
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
 
-    # Remove non-numeric prefixes like ">" or "<" (simply take the number after)
-    if (
-        numeric_part_str.startswith(">")
-        or numeric_part_str.startswith("<")
-        or numeric_part_str.startswith("=")
-    ):
-        numeric_part_str = numeric_part_str[1:]  # Remove the first character
-
-    try:
-        return float(numeric_part_str)
-    except ValueError:
-        return None  # Return None if still cannot convert to float
 
+class ExportMixin:
+    """
+    Adds ``GET <collection>/export/`` streaming the whole table, or the subset
+    selected by the viewset's ``export_filters``, as CSV (default), NDJSON,
+    Parquet or Arrow (``?output=``). ``?fields=`` picks columns. CSV, NDJSON
+    and Arrow are gzipped on the fly for clients that accept it.
+    """
 
-class PatientViewSet(viewsets.ModelViewSet):
+    export_filters = {}
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def export(self, request):
+        params = request.query_params
+        export_format = params.get("output", "csv")
+        if export_format not in FORMATS:
+            return Response(
+                {"error": f"output must be one of: {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.get_queryset()
+        try:
+            columns = select_columns(queryset.model, params.get("fields"))
+            queryset = apply_filters(queryset, self.export_filters, params)
+        except ExportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content = stream_export(queryset, columns, export_format)
+        gzip = export_format not in COMPRESSED_FORMATS and ACCEPTS_GZIP_RE.search(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
+        )
+        if gzip:
+            content = compress_sequence(content)
+        response = StreamingHttpResponse(content, content_type=FORMATS[export_format])
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        filename = f"{queryset.model._meta.verbose_name_plural}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class PatientViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows patients to be viewed and edited.
     """
 
     queryset = Patient.objects.all().order_by("id")
     serializer_class = PatientSerializer
+    pagination_class = DatasetCursorPagination
+    export_filters = {
+        "id": "id__in",
+        "gender": "gender",
+        "bp_category": "bp_category",
+    }
+
+    @action(detail=True, methods=["get"])
+    def profile(self, request, pk=None):
+        """
+        The patient with their conditions and observations in one response,
+        read with one query per included relation. Supports ``?include=``,
+        sparse ``?fields=`` / ``?fields[conditions]=`` /
+        ``?fields[observations]=``, and ``?lightweight=true`` to build the
+        response from plain ``values()`` dicts instead of serializers.
+        """
+        try:
+            fields, relations = parse_profile_params(request.query_params)
+        except ProfileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if parse_bool(request.query_params.get("lightweight")):
+            profile = profile_values(pk, fields, relations)
+            if profile is None:
+                return Response(
+                    {"error": "Patient not found."}, status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(profile)
 
+        patient = get_object_or_404(profile_queryset(fields, relations), pk=pk)
+        return Response(
+            PatientProfileSerializer(patient, fields=fields, relations=relations).data
+        )
 
-class ConditionViewSet(viewsets.ModelViewSet):
+
+class ConditionViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows conditions to be viewed and edited.
     """
 
     queryset = Condition.objects.all().order_by("id")
     serializer_class = ConditionSerializer
+    pagination_class = DatasetCursorPagination
+    export_filters = {
+        "patient": "patient_id__in",
+        "description": "description",
+        "since": "start_date__gte",
+        "until": "start_date__lte",
+    }
 
 
-class ObservationViewSet(viewsets.ModelViewSet):
+class ObservationViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows observations to be viewed and edited.
     """
 
     queryset = Observation.objects.all().order_by("id")
     serializer_class = ObservationSerializer
+    pagination_class = DatasetCursorPagination
+    export_filters = {
+        "patient": "patient_id__in",
+        "description": "description",
+        "since": "date__gte",
+        "until": "date__lte",
+    }
 
 
 class DatasetUploadViewSet(viewsets.ViewSet):
     """
     API endpoint for uploading Synthea CSV datasets.
+
+    Uploads are queued as background ingestion jobs and answered with 202 and
+    a job ID; pass ``?wait=true`` to ingest within the request instead.
+    ``?workers=N`` parses a queued upload in N processes, and ``?mode=upsert``
+    makes re-imports idempotent by updating rows that match on their natural
+    key instead of inserting them again. The default insert mode skips
+    conditions and observations whose natural key is already stored or
+    repeated in the upload, reported as ``duplicate_rows``.
     """
 
     parser_classes = (MultiPartParser, FormParser)
 
-    @action(detail=False, methods=["post"], url_path="patients")
-    def upload_patients(self, request):
-        """Upload and process patients.csv."""
+    def _ingest(self, request, kind, success_message):
+        """Queue or run the bulk loader for ``kind`` over the uploaded CSV file."""
         file_obj = request.FILES.get("file")
         if file_obj is None:
             return Response(
@@ -89,143 +207,74 @@ class DatasetUploadViewSet(viewsets.ViewSet):
             )
 
         try:
-            df = pd.read_csv(file_obj)
-
-            for index, row in df.iterrows():
-                birthdate = (
-                    pd.to_datetime(row["BIRTHDATE"]).date()
-                    if pd.notnull(row["BIRTHDATE"])
-                    else None
+            params = request.query_params
+            options = {
+                "batch_size": get_batch_size(params.get("batch_size")),
+                "streaming": parse_bool(params.get("stream")),
+                "mode": get_mode(params.get("mode")),
+            }
+            wait = parse_bool(
+                params.get("wait"),
+                default=not getattr(settings, "HEALIX_INGEST_ASYNC", True),
+            )
+            if not wait:
+                job = jobs.enqueue(
+                    kind,
+                    file_obj,
+                    workers=get_workers(params.get("workers")),
+                    **options,
                 )
-                age = (
-                    (pd.to_datetime("today").year - birthdate.year)
-                    if birthdate
-                    else None
+                return Response(
+                    {
+                        "status": "Upload queued for processing.",
+                        "job_id": str(job.id),
+                        "status_url": reverse(
+                            "ingestion-job-detail", args=[job.id], request=request
+                        ),
+                    },
+                    status=status.HTTP_202_ACCEPTED,
                 )
-                patient_data = {
-                    "id": row["Id"],
-                    "gender": row["GENDER"],
-                    "birthdate": birthdate,
-                    "age": age,
-                }
-                serializer = PatientSerializer(data=patient_data)
-                if serializer.is_valid():
-                    serializer.save()
-                else:
-                    return Response(
-                        serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                    )
+
+            streaming = options.pop("streaming")
+            stats = LOADERS[kind](**options).load_csv(file_obj, streaming=streaming)
+            metrics.observe_upload(
+                kind, IngestionJob.SUCCEEDED, stats.rows, stats.seconds
+            )
             return Response(
-                {"status": "Patients data uploaded successfully."},
+                {"status": success_message, **stats.as_dict()},
                 status=status.HTTP_201_CREATED,
             )
+        except IngestionError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=["post"], url_path="patients")
+    def upload_patients(self, request):
+        """Upload and process patients.csv."""
+        return self._ingest(request, "patients", "Patients data uploaded successfully.")
+
     @action(detail=False, methods=["post"], url_path="conditions")
     def upload_conditions(self, request):
         """Upload and process conditions.csv."""
-        file_obj = request.FILES.get("file")
-        if file_obj is None:
-            return Response(
-                {"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST
-            )
-
-        try:
-            df = pd.read_csv(file_obj)
-
-            for index, row in df.iterrows():
-                patient_id = row["PATIENT"]
-                start_date_str = row["START"]
-                start_date = (
-                    pd.to_datetime(start_date_str).date()
-                    if pd.notnull(start_date_str)
-                    else None
-                )
-
-                try:
-                    patient = Patient.objects.get(id=patient_id)
-                except Patient.DoesNotExist:
-                    return Response(
-                        {
-                            "error": f"Patient with ID {patient_id} not found for condition."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                condition_data = {
-                    "patient": patient.id,
-                    "description": row["DESCRIPTION"],
-                    "start_date": start_date,
-                }
-                serializer = ConditionSerializer(data=condition_data)
-                if serializer.is_valid():
-                    serializer.save()
-                else:
-                    return Response(
-                        serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                    )
-            return Response(
-                {"status": "Conditions data uploaded successfully."},
-                status=status.HTTP_201_CREATED,
-            )
-        except Exception as e:
-            return Response(
-                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        return self._ingest(
+            request, "conditions", "Conditions data uploaded successfully."
+        )
 
     @action(detail=False, methods=["post"], url_path="observations")
     def upload_observations(self, request):
         """Upload and process observations.csv."""
-        file_obj = request.FILES.get("file")
-        if file_obj is None:
-            return Response(
-                {"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST
-            )
+        return self._ingest(
+            request, "observations", "Observations data uploaded successfully."
+        )
 
-        try:
-            df = pd.read_csv(file_obj)  # Adjust separator if needed
-
-            for index, row in df.iterrows():
-                patient_id = row["PATIENT"]
-                date_str = row["DATE"]
-                date = pd.to_datetime(date_str).date() if pd.notnull(date_str) else None
-                units = row["UNITS"] if pd.notnull(row["UNITS"]) else None
-
-                # Clean and convert the 'VALUE' column using the dedicated function
-                value = clean_observation_value(row["VALUE"])
-
-                try:
-                    patient = Patient.objects.get(id=patient_id)
-                except Patient.DoesNotExist:
-                    return Response(
-                        {
-                            "error": f"Patient with ID {patient_id} not found for observation."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                observation_data = {
-                    "patient": patient.id,
-                    "description": row["DESCRIPTION"],
-                    "value": value,  # Use the cleaned value
-                    "units": units,
-                    "date": date,
-                }
-                serializer = ObservationSerializer(data=observation_data)
-                if serializer.is_valid():
-                    serializer.save()
-                else:
-                    return Response(
-                        serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                    )
-            return Response(
-                {"status": "Observations data uploaded successfully."},
-                status=status.HTTP_201_CREATED,
-            )
-        except Exception as e:
-            return Response(
-                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+
+class IngestionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint to poll the progress of background dataset uploads.
+    """
+
+    queryset = IngestionJob.objects.all().order_by("-created_at")
+    serializer_class = IngestionJobSerializer
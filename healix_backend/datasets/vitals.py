@@ -0,0 +1,164 @@
+"""
+Derivation of patient vitals from observations.
+
+``Patient.bmi``, ``sys_bp``, ``dia_bp`` and ``heart_rate`` hold the latest
+observed value of the matching Synthea observation, and ``bp_category`` bins
+the systolic pressure with the same bins the prediction model was trained
+with. ``derive_vitals`` recomputes them for a set of patients: one window
+query per chunk of patients picks each patient's latest value per vital, the
+result is pivoted in pandas, and only patients whose values changed are
+written back with ``bulk_update``.
+
+Observation uploads derive the vitals of the patients in each written chunk,
+so the cost follows the upload rather than the table size; ``manage.py
+derive_vitals`` backfills every patient.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.dispatch import receiver
+
+from healix_backend.lazy import lazy_import
+
+from .batching import IN_BATCH_SIZE, batched
+from .ingestion import to_records
+from .models import Observation, Patient
+from .signals import rows_written, vitals_derived
+from .versioning import bump_dataset_version
+
+pd = lazy_import("pandas")
+
+# Synthea observation description -> Patient field
+VITALS = {
+    "Body Mass Index": "bmi",
+    "Systolic Blood Pressure": "sys_bp",
+    "Diastolic Blood Pressure": "dia_bp",
+    "Heart rate": "heart_rate",
+}
+VITAL_FIELDS = list(VITALS.values())
+BP_BINS = [0, 120, 140, 180, 300]
+BP_LABELS = ["normal", "hypertensive", "severe", "crisis"]
+
+
+def bp_categories(sys_bp):
+    """Bin systolic pressure into the training BP categories (NaN outside bins)."""
+    return pd.cut(sys_bp, bins=BP_BINS, labels=BP_LABELS)
+
+
+def latest_vitals(patient_ids):
+    """
+    Frame indexed by patient ID with one column per vital field holding the
+    value of the latest observation (by date, then ID), NaN if none.
+    """
+    rows = (
+        Observation.objects.filter(
+            patient_id__in=patient_ids,
+            description__in=list(VITALS),
+            value__isnull=False,
+        )
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("patient_id"), F("description")],
+                order_by=[F("date").desc(nulls_last=True), F("id").desc()],
+            )
+        )
+        .filter(rank=1)
+        .values_list("patient_id", "description", "value")
+    )
+    latest = pd.DataFrame.from_records(
+        list(rows), columns=["id", "description", "value"]
+    )
+    return (
+        latest.pivot(index="id", columns="description", values="value")
+        .rename(columns=VITALS)
+        .reindex(columns=VITAL_FIELDS)
+        .astype("float64")
+    )
+
+
+def derive_chunk(patient_ids):
+    """Derive the vitals of ``patient_ids``; returns the number of patients changed."""
+    derived = latest_vitals(patient_ids)
+    if derived.empty:
+        return 0
+    columns = ["id", "gender", *VITAL_FIELDS, "bp_category"]
+    before = pd.DataFrame.from_records(
+        list(
+            Patient.objects.filter(id__in=derived.index.tolist()).values_list(*columns)
+        ),
+        columns=columns,
+    ).set_index("id")
+    before[VITAL_FIELDS] = before[VITAL_FIELDS].astype("float64")
+
+    after = before.copy()
+    # Vitals without an observation keep their current value
+    after[VITAL_FIELDS] = derived.reindex(before.index).combine_first(
+        before[VITAL_FIELDS]
+    )
+    binned = bp_categories(after["sys_bp"]).astype(object)
+    after["bp_category"] = binned.where(
+        after["sys_bp"].notna() & binned.notna(), before["bp_category"]
+    )
+
+    values_changed = ~(
+        (after[VITAL_FIELDS] == before[VITAL_FIELDS])
+        | (after[VITAL_FIELDS].isna() & before[VITAL_FIELDS].isna())
+    ).all(axis=1)
+    category_changed = after["bp_category"].ne(before["bp_category"]) & ~(
+        after["bp_category"].isna() & before["bp_category"].isna()
+    )
+    changed = values_changed | category_changed
+    if not changed.any():
+        return 0
+    before, after = before[changed], after[changed]
+
+    update_fields = [*VITAL_FIELDS, "bp_category"]
+    patients = [
+        Patient(id=row[0], **dict(zip(update_fields, row[1:])))
+        for row in to_records(after.reset_index(), ["id", *update_fields])
+    ]
+    Patient.objects.bulk_update(patients, update_fields, batch_size=IN_BATCH_SIZE)
+    vitals_derived.send(sender=Patient, before=before, after=after)
+    return len(patients)
+
+
+def derive_vitals(patient_ids=None, chunk_size=None, bump_version=True):
+    """
+    Derive vitals for ``patient_ids`` (every patient when ``None``) and return
+    the number of patients whose stored vitals changed. Each chunk of
+    patients is committed on its own, so a backfill never holds one
+    transaction over the whole table. Uploads pass ``bump_version=False``, as
+    the loader bumps the version after the chunk.
+    """
+    chunk_size = chunk_size or getattr(
+        settings, "HEALIX_VITALS_CHUNK_SIZE", IN_BATCH_SIZE
+    )
+    if patient_ids is None:
+        patient_ids = Patient.objects.order_by("id").values_list("id", flat=True)
+    patient_ids = list(patient_ids)
+
+    changed = 0
+    for chunk in batched(patient_ids, chunk_size):
+        with transaction.atomic():
+            chunk_changed = derive_chunk(chunk)
+            if chunk_changed and bump_version:
+                # Last, so the version row stays locked only until commit
+                bump_dataset_version()
+        changed += chunk_changed
+    return changed
+
+
+@receiver(rows_written)
+def derive_after_upload(sender, kind, frame, **kwargs):
+    if kind != "observations":
+        return
+    if not getattr(settings, "HEALIX_DERIVE_VITALS_ON_UPLOAD", True):
+        return
+    vitals = frame["description"].isin(list(VITALS))
+    if vitals.any():
+        derive_vitals(
+            frame.loc[vitals, "patient_id"].unique().tolist(), bump_version=False
+        )
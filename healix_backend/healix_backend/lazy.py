@@ -0,0 +1,48 @@
+"""
+Deferred imports for heavy dependencies.
+
+pandas, NumPy and joblib together add most of a second and tens of MB to every
+process that imports them, and Django imports every view module while loading
+the URLconf. Modules that only need them inside request handlers bind them
+with ``lazy_import`` instead::
+
+    pd = lazy_import("pandas")
+
+The real module is imported on first attribute access, so ``manage.py``
+commands, migrations and workers that never reach those code paths do not pay
+for it. Do not use the proxy at module level (for example in constants), as
+that defeats the deferral.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """Module proxy that imports ``name`` on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
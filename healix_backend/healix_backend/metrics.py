@@ -0,0 +1,274 @@
+"""
+Request-level performance metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and, through
+``connection.execute_wrapper``, counts and times the SQL it runs, labelled by
+the matched URL route. Uploads report the rows they ingested
+(``observe_upload``) and the prediction endpoint times model loading and
+inference (``timed``). ``metrics_view`` serves everything at ``/metrics``.
+
+Metrics live in the memory of each process, like the model registry: scrape
+every server process, not a load balancer in front of them. Ingestion jobs
+that run in worker processes report back to the process that queued them.
+
+With ``HEALIX_METRICS_ENABLED`` off, the middleware removes itself at startup,
+``/metrics`` answers 404, and the hooks return after one settings lookup.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ROW_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_registry = []
+
+
+def enabled():
+    return getattr(settings, "HEALIX_METRICS_ENABLED", False)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with a fixed set of label names, registered on creation."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines += self._samples(key, value)
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = (*sorted(buckets), float("inf"))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Upper bounds are inclusive ("le")
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def sum(self, **labels):
+        return self._values.get(self._key(labels), ((), 0.0))[1]
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _labels(self.label_names, key, [("le", _number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "healix_http_request_duration_seconds",
+    "Request latency by URL route.",
+    ["method", "endpoint", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "healix_http_request_queries",
+    "SQL queries run per request.",
+    ["endpoint"],
+    buckets=QUERY_BUCKETS,
+)
+REQUEST_QUERY_SECONDS = Histogram(
+    "healix_http_request_query_seconds",
+    "Time spent in SQL per request.",
+    ["endpoint"],
+)
+UPLOAD_ROWS = Histogram(
+    "healix_upload_rows",
+    "Rows ingested per dataset upload.",
+    ["kind", "status"],
+    buckets=ROW_BUCKETS,
+)
+UPLOAD_SECONDS = Histogram(
+    "healix_upload_duration_seconds",
+    "Dataset upload ingestion time.",
+    ["kind", "status"],
+)
+INGESTED_ROWS = Counter(
+    "healix_ingested_rows_total", "Rows ingested by dataset uploads.", ["kind"]
+)
+PREDICTION_SECONDS = Histogram(
+    "healix_prediction_stage_seconds",
+    "Condition prediction time by stage (model_load, features, inference).",
+    ["stage"],
+)
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Forget every recorded value, mainly for tests."""
+    for metric in _registry:
+        metric.clear()
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the ``with`` block on ``histogram``."""
+    if not enabled():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def observe_upload(kind, status, rows, seconds):
+    """Record one finished upload of ``kind``."""
+    if not enabled():
+        return
+    UPLOAD_ROWS.observe(rows, kind=kind, status=status)
+    UPLOAD_SECONDS.observe(seconds, kind=kind, status=status)
+    INGESTED_ROWS.inc(rows, kind=kind)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` counting and timing the queries it sees."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _endpoint(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Unrouted paths are one label, however many are probed
+        return "unmatched"
+    # Router regexes read like path() routes: ^jobs/(?P<pk>[^/.]+)/$ -> jobs/<pk>/
+    route = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"<\1>", match.route)
+    return "/" + re.sub(r"(^|/)\^|\$", r"\1", route)
+
+
+class MetricsMiddleware:
+    """
+    Record latency and SQL per request. Streamed response bodies are
+    produced after the middleware returns and are not included.
+    """
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        endpoint = _endpoint(request)
+        REQUEST_SECONDS.observe(
+            elapsed,
+            method=request.method,
+            endpoint=endpoint,
+            status=response.status_code,
+        )
+        REQUEST_QUERIES.observe(queries.queries, endpoint=endpoint)
+        REQUEST_QUERY_SECONDS.observe(queries.seconds, endpoint=endpoint)
+        return response
+
+
+def metrics_view(request):
+    """The recorded metrics for a Prometheus scrape."""
+    if not enabled():
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
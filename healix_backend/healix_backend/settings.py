@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so that request timings include the other middleware
+    "healix_backend.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -85,6 +87,117 @@ REST_FRAMEWORK = {
 }
 
 
+# Dataset API
+# Rows per page of the patients, conditions and observations endpoints.
+HEALIX_DATASET_PAGE_SIZE = 100
+# Largest page a client may request with ?page_size=.
+HEALIX_DATASET_MAX_PAGE_SIZE = 5000
+# Rows fetched and encoded per chunk by the export/ endpoints.
+HEALIX_EXPORT_CHUNK_SIZE = 10000
+
+
+# Dataset ingestion
+# Rows per bulk_create chunk; each chunk is written in its own transaction.
+HEALIX_INGEST_BATCH_SIZE = 5000
+# On PostgreSQL, write chunks with COPY instead of bulk_create.
+HEALIX_INGEST_USE_COPY = True
+# Read uploads in HEALIX_INGEST_BATCH_SIZE-row chunks instead of loading the
+# whole file; can be overridden per request with ?stream=false.
+HEALIX_INGEST_STREAMING = True
+# Number of known patient IDs remembered across chunks during an upload.
+HEALIX_PATIENT_CACHE_SIZE = 100000
+# Run uploads as background jobs (202 + job ID) unless ?wait=true is passed.
+HEALIX_INGEST_ASYNC = True
+# Worker pool for background uploads: "process", "thread" or "inline".
+HEALIX_INGEST_EXECUTOR = "process"
+# Uploads each server process ingests at once; every worker holds a database
+# connection and a batch of rows in memory.
+HEALIX_INGEST_WORKERS = 2
+HEALIX_UPLOAD_DIR = BASE_DIR / "uploads"
+# Processes that parse a single background upload in parallel byte-range shards
+# (1 disables sharding); can be overridden per upload with ?workers=N.
+HEALIX_INGEST_PARALLEL_WORKERS = 1
+HEALIX_INGEST_SHARD_BYTES = 8 * 2**20
+# Derive patient vitals (BMI, blood pressure, heart rate, BP category) from
+# each uploaded chunk of observations; see manage.py derive_vitals.
+HEALIX_DERIVE_VITALS_ON_UPLOAD = True
+# Patients per latest-value query when deriving vitals.
+HEALIX_VITALS_CHUNK_SIZE = 500
+
+
+# Prediction models
+# Load model artifacts when the app registry is ready instead of on first use.
+HEALIX_PRELOAD_MODELS = False
+# Seconds between checks of predictions/models for a new or modified model.
+HEALIX_MODEL_CHECK_INTERVAL = 5.0
+# Pin a model version (e.g. "20250127_011852"); None serves the newest one.
+HEALIX_MODEL_VERSION = None
+# "numpy" serves the .npz export (see manage.py export_numpy_model) without
+# importing TensorFlow, "keras" the .keras file; "auto" prefers the export.
+HEALIX_MODEL_ENGINE = "auto"
+# Largest number of patients accepted by predict-condition/batch/.
+HEALIX_PREDICTION_MAX_BATCH = 10000
+# Micro-batch concurrent predict-condition/ requests into one forward pass.
+HEALIX_MICROBATCH_ENABLED = False
+# Longest a request waits for others to join its batch, in milliseconds.
+HEALIX_MICROBATCH_MAX_WAIT_MS = 2.0
+# Largest micro-batch; a full batch is scored without waiting.
+HEALIX_MICROBATCH_MAX_SIZE = 64
+# Patients loaded and scored per chunk by population risk scoring.
+HEALIX_SCORING_CHUNK_SIZE = 5000
+# Queue API-triggered scoring runs on the ingestion worker pool by default.
+HEALIX_SCORING_ASYNC = True
+# Largest limit accepted by risk-scores/top/.
+HEALIX_TOP_RISK_MAX_LIMIT = 1000
+
+
+# Analytics snapshot
+# Directory of the Parquet snapshots of the dataset tables (datasets.snapshot).
+HEALIX_SNAPSHOT_DIR = BASE_DIR / "snapshots"
+# Rebuild the snapshot in the background after uploads; see manage.py build_snapshot.
+HEALIX_SNAPSHOT_ON_UPLOAD = True
+# Seconds from an upload's commit to the rebuild; uploads in between share it.
+HEALIX_SNAPSHOT_DELAY = 10
+# Snapshot builds kept on disk, so readers of a replaced one can finish.
+HEALIX_SNAPSHOT_KEEP = 2
+# Backend answering insight queries: "orm" (aggregate tables) or "snapshot",
+# which falls back to "orm" while the snapshot is stale; per request ?backend=.
+HEALIX_INSIGHTS_BACKEND = "orm"
+
+
+# Insights response cache
+# Cache alias holding insights responses, keyed by request and dataset version.
+HEALIX_INSIGHTS_CACHE = "insights"
+# Most points returned by the trends/ endpoints; longer series are downsampled.
+HEALIX_TRENDS_MAX_POINTS = 1000
+# Largest limit accepted by condition-cooccurrence/.
+HEALIX_COOCCURRENCE_MAX_LIMIT = 1000
+# Most condition names one prevalence/ request may ask for.
+HEALIX_PREVALENCE_MAX_CONDITIONS = 50
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Entries never expire: a data change bumps the dataset version, and
+    # entries for older versions are evicted least-recently-used first once
+    # MAX_ENTRIES is reached. Use FileBasedCache to share the cache between
+    # worker processes on one host.
+    HEALIX_INSIGHTS_CACHE: {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "healix-insights",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
+
+# Performance metrics
+# Record request latency, SQL, upload and prediction timings per process and
+# serve them at /metrics in the Prometheus text format (healix_backend.metrics).
+HEALIX_METRICS_ENABLED = True
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -18,6 +18,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+
 # urlpatterns = [
 #     path('admin/', admin.site.urls),
 # ]
@@ -28,4 +30,5 @@ urlpatterns = [
     path("api/datasets/", include("datasets.urls")),
     path("api/insights/", include("insights.urls")),
     path("api/predictions/", include("predictions.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -1,3 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import BPCategoryCount, ConditionPrevalence, GenderBMIStats
+
+admin.site.register(ConditionPrevalence)
+admin.site.register(GenderBMIStats)
+admin.site.register(BPCategoryCount)
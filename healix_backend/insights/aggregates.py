@@ -0,0 +1,408 @@
+"""
+Maintenance of the precomputed insight aggregates.
+
+Uploads apply deltas: every chunk of new conditions or patients adds its own
+counts to the affected aggregate rows, so the cost of keeping them current
+depends on the upload size, not on the table size. Aggregate rows are unique
+per group and deltas are added with ``INSERT ... ON CONFLICT DO UPDATE``, so
+concurrent uploads cannot create a group twice. Patient upserts move the
+counts of patients whose gender changed from the old group to the new one.
+Patients saved or deleted through the ORM apply their own delta the same
+way; single condition changes recompute their descriptions' rows.
+``rebuild`` recomputes everything and backs ``manage.py refresh_insights``.
+"""
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from datasets.batching import batched
+from datasets.models import Condition, Patient
+from healix_backend.lazy import lazy_import
+
+from .models import BPCategoryCount, ConditionPrevalence, GenderBMIStats
+
+pd = lazy_import("pandas")
+
+
+def refresh_condition_prevalence(descriptions=None):
+    """
+    Recompute prevalence rows for ``descriptions`` (an iterable, which may
+    contain ``None``), or for every description when it is ``None``.
+    """
+    if descriptions is None:
+        with transaction.atomic():
+            ConditionPrevalence.objects.all().delete()
+            _insert_prevalence(Condition.objects.all())
+        return
+
+    descriptions = list(set(descriptions))
+    with transaction.atomic():
+        if None in descriptions:
+            descriptions.remove(None)
+            ConditionPrevalence.objects.filter(description__isnull=True).delete()
+            _insert_prevalence(Condition.objects.filter(description__isnull=True))
+        for chunk in batched(descriptions):
+            ConditionPrevalence.objects.filter(description__in=chunk).delete()
+            _insert_prevalence(Condition.objects.filter(description__in=chunk))
+
+
+def _insert_prevalence(conditions):
+    ConditionPrevalence.objects.bulk_create(
+        ConditionPrevalence(
+            description=row["description"],
+            gender=row["patient__gender"],
+            count=row["count"],
+        )
+        for row in conditions.values("description", "patient__gender")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+def add_condition_counts(frame):
+    """
+    Add newly written conditions (a frame with ``patient_id`` and
+    ``description`` columns) to the prevalence rows of their patients' gender.
+    """
+    patient_ids = frame["patient_id"].unique().tolist()
+    genders = dict(
+        Patient.objects.filter(id__in=patient_ids).values_list("id", "gender")
+    )
+    deltas = Counter(
+        zip(
+            _nullable(frame["description"]),
+            [genders.get(patient_id) for patient_id in frame["patient_id"].tolist()],
+        )
+    )
+    _increment(
+        ConditionPrevalence,
+        ["description", "gender"],
+        [
+            {"description": description, "gender": gender, "count": count}
+            for (description, gender), count in deltas.items()
+        ],
+    )
+
+
+def add_new_patients(frame):
+    """
+    Add newly inserted patients (a frame with a ``gender`` column) to the
+    per-gender rows. Uploaded patients carry no BMI or blood pressure yet, so
+    they count towards the uncategorized blood pressure row.
+    """
+    genders = Counter(_nullable(frame["gender"]))
+    with transaction.atomic():
+        _increment(
+            GenderBMIStats,
+            ["gender"],
+            [
+                {"gender": gender, "patients": count, "bmi_count": 0}
+                for gender, count in genders.items()
+            ],
+        )
+        _increment(
+            BPCategoryCount,
+            ["bp_category"],
+            [{"bp_category": None, "count": len(frame)}],
+        )
+
+
+def apply_patient_upserts(frame, previous):
+    """
+    Apply a chunk of upserted patients: ``frame`` holds the written rows and
+    ``previous`` the stored ``id`` and ``gender`` of those that already
+    existed. New patients are added like inserted ones; patients whose gender
+    changed move their BMI and condition counts from the old gender's rows to
+    the new one's.
+    """
+    new = frame[~frame["id"].isin(previous["id"])]
+    if not new.empty:
+        add_new_patients(new)
+    before = dict(zip(previous["id"], _nullable(previous["gender"])))
+    after = dict(zip(frame["id"], _nullable(frame["gender"])))
+    moved = [
+        patient_id
+        for patient_id, gender in before.items()
+        if after.get(patient_id, gender) != gender
+    ]
+    if not moved:
+        return
+
+    stats, prevalence = {}, Counter()
+    for chunk in batched(moved):
+        for patient_id, bmi in Patient.objects.filter(id__in=chunk).values_list(
+            "id", "bmi"
+        ):
+            for gender, sign in ((before[patient_id], -1), (after[patient_id], 1)):
+                row = stats.setdefault(
+                    gender,
+                    {"gender": gender, "patients": 0, "bmi_count": 0, "bmi_sum": 0.0},
+                )
+                row["patients"] += sign
+                if bmi is not None:
+                    row["bmi_count"] += sign
+                    row["bmi_sum"] += sign * bmi
+        for patient_id, description, count in (
+            Condition.objects.filter(patient_id__in=chunk)
+            .values_list("patient_id", "description")
+            .annotate(count=Count("id"))
+            .order_by()
+        ):
+            prevalence[(description, before[patient_id])] -= count
+            prevalence[(description, after[patient_id])] += count
+
+    with transaction.atomic():
+        _increment(
+            GenderBMIStats,
+            ["gender"],
+            [
+                row
+                for row in stats.values()
+                if row["patients"] or row["bmi_count"] or row["bmi_sum"]
+            ],
+        )
+        _increment(
+            ConditionPrevalence,
+            ["description", "gender"],
+            [
+                {"description": description, "gender": gender, "count": count}
+                for (description, gender), count in prevalence.items()
+                if count
+            ],
+        )
+        # A rebuild has no rows for emptied groups
+        GenderBMIStats.objects.filter(patients=0).delete()
+        ConditionPrevalence.objects.filter(count=0).delete()
+
+
+def apply_patient_change(patient_id, before, after):
+    """
+    Apply one patient saved or deleted through the ORM: ``before`` and
+    ``after`` are its stored ``gender``, ``bmi`` and ``bp_category`` (``None``
+    for a created or deleted patient). A changed gender moves the patient's
+    conditions between prevalence rows; the conditions of a deleted patient
+    are removed by their own delete signals.
+    """
+    stats, categories, prevalence = {}, Counter(), Counter()
+    for values, sign in ((before, -1), (after, 1)):
+        if values is None:
+            continue
+        row = stats.setdefault(
+            values["gender"],
+            {"gender": values["gender"], "patients": 0, "bmi_count": 0, "bmi_sum": 0.0},
+        )
+        row["patients"] += sign
+        if values["bmi"] is not None:
+            row["bmi_count"] += sign
+            row["bmi_sum"] += sign * values["bmi"]
+        categories[values["bp_category"]] += sign
+    if before and after and before["gender"] != after["gender"]:
+        for description, count in (
+            Condition.objects.filter(patient_id=patient_id)
+            .values_list("description")
+            .annotate(count=Count("id"))
+            .order_by()
+        ):
+            prevalence[(description, before["gender"])] -= count
+            prevalence[(description, after["gender"])] += count
+
+    with transaction.atomic():
+        _increment(
+            GenderBMIStats,
+            ["gender"],
+            [
+                row
+                for row in stats.values()
+                if row["patients"] or row["bmi_count"] or row["bmi_sum"]
+            ],
+        )
+        _increment(
+            BPCategoryCount,
+            ["bp_category"],
+            [
+                {"bp_category": category, "count": count}
+                for category, count in categories.items()
+                if count
+            ],
+        )
+        _increment(
+            ConditionPrevalence,
+            ["description", "gender"],
+            [
+                {"description": description, "gender": gender, "count": count}
+                for (description, gender), count in prevalence.items()
+                if count
+            ],
+        )
+        # A rebuild has no rows for emptied groups
+        GenderBMIStats.objects.filter(patients=0).delete()
+        BPCategoryCount.objects.filter(count=0).delete()
+        ConditionPrevalence.objects.filter(count=0).delete()
+
+
+def apply_vitals_changes(before, after):
+    """
+    Move patients whose vitals were re-derived (``before``/``after`` frames
+    from ``datasets.signals.vitals_derived``) between BMI and blood pressure
+    aggregate rows.
+    """
+    bmi = pd.DataFrame(
+        {
+            "gender": _nullable(after["gender"]),
+            "count": after["bmi"].notna().astype(int)
+            - before["bmi"].notna().astype(int),
+            "sum": after["bmi"].fillna(0) - before["bmi"].fillna(0),
+        }
+    )
+    categories = Counter(_nullable(after["bp_category"]))
+    categories.subtract(_nullable(before["bp_category"]))
+    with transaction.atomic():
+        _increment(
+            GenderBMIStats,
+            ["gender"],
+            [
+                {
+                    "gender": None if pd.isna(gender) else gender,
+                    "patients": 0,
+                    "bmi_count": int(group["count"].sum()),
+                    "bmi_sum": float(group["sum"].sum()),
+                }
+                for gender, group in bmi.groupby("gender", dropna=False)
+                if group["count"].any() or group["sum"].any()
+            ],
+        )
+        _increment(
+            BPCategoryCount,
+            ["bp_category"],
+            [
+                {"bp_category": category, "count": count}
+                for category, count in categories.items()
+                if count
+            ],
+        )
+        # A rebuild has no rows for emptied categories
+        BPCategoryCount.objects.filter(count=0).delete()
+
+
+def _nullable(series):
+    """Values of ``series`` as Python objects with missing values as ``None``."""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _increment(model, key, rows):
+    """
+    Add the values of ``rows`` (dicts of the ``key`` fields and the fields to
+    add to) to the rows of ``model`` with the same key, creating missing ones.
+    """
+    if not rows:
+        return
+    fields = [name for name in rows[0] if name not in key]
+    # A consistent order keeps concurrent uploads from deadlocking on rows
+    rows = sorted(
+        rows, key=lambda row: [(row[name] is None, row[name] or "") for name in key]
+    )
+    with transaction.atomic():
+        if connection.features.supports_nulls_distinct_unique_constraints:
+            # The group constraints treat NULL keys as equal, so the database
+            # can increment or create every row atomically
+            upsert_increments(
+                model,
+                key,
+                fields,
+                [[row[name] for name in (*key, *fields)] for row in rows],
+            )
+            return
+        # Backends without them (SQLite serializes writers anyway) update,
+        # then create
+        for row in rows:
+            lookup = {}
+            for name in key:
+                if row[name] is None:
+                    lookup[f"{name}__isnull"] = True
+                else:
+                    lookup[name] = row[name]
+            updated = model.objects.filter(**lookup).update(
+                **{
+                    # Sums of no values are stored as NULL
+                    name: Coalesce(
+                        F(name), Value(0), output_field=model._meta.get_field(name)
+                    )
+                    + row[name]
+                    for name in fields
+                }
+            )
+            if not updated:
+                model.objects.create(**row)
+
+
+def upsert_increments(model, key, fields, rows):
+    """
+    Insert ``rows`` (sequences of the ``key`` then ``fields`` values) into the
+    table of ``model``, adding the ``fields`` values to the existing row when
+    the key is already present. The key must be covered by a unique
+    constraint, and appear at most once in ``rows``.
+    """
+    # Concurrent uploads add to the same rows, so the increment happens in
+    # the database: INSERT ... ON CONFLICT DO UPDATE SET n = n + new
+    upsert_rows(model, key, fields, rows, increment=True)
+
+
+def upsert_rows(model, key, fields, rows, increment=False, page_size=100):
+    """
+    ``upsert_increments``, or with ``increment`` off overwriting the
+    ``fields`` of an existing row instead. PostgreSQL sends ``page_size``
+    rows per statement; SQLite runs one statement per row.
+    """
+    quote = connection.ops.quote_name
+    opts = model._meta
+    table = quote(opts.db_table)
+    key = [quote(opts.get_field(name).column) for name in key]
+    fields = [quote(opts.get_field(name).column) for name in fields]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(key + fields)}) VALUES {{}} "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+        + ", ".join(
+            # Sums of no values are stored as NULL
+            (
+                f"{column} = COALESCE({table}.{column}, 0) + EXCLUDED.{column}"
+                if increment
+                else f"{column} = EXCLUDED.{column}"
+            )
+            for column in fields
+        )
+    )
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            from psycopg2.extras import execute_values
+
+            execute_values(cursor.cursor, sql.format("%s"), rows, page_size=page_size)
+        else:
+            placeholders = ", ".join(["%s"] * (len(key) + len(fields)))
+            cursor.executemany(sql.format(f"({placeholders})"), rows)
+
+
+def refresh_patient_stats():
+    """Recompute the per-gender BMI and per-category blood pressure rows."""
+    with transaction.atomic():
+        GenderBMIStats.objects.all().delete()
+        GenderBMIStats.objects.bulk_create(
+            GenderBMIStats(**row)
+            for row in Patient.objects.values("gender")
+            .annotate(patients=Count("id"), bmi_count=Count("bmi"), bmi_sum=Sum("bmi"))
+            .order_by()
+        )
+        BPCategoryCount.objects.all().delete()
+        BPCategoryCount.objects.bulk_create(
+            BPCategoryCount(**row)
+            for row in Patient.objects.values("bp_category")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+
+
+def rebuild():
+    refresh_patient_stats()
+    refresh_condition_prevalence()
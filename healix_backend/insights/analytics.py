@@ -0,0 +1,91 @@
+"""
+Insight queries answered from the columnar analytics snapshot.
+
+Each function returns the same rows as the matching database query the
+insight views run, computed with pandas over the tables of a
+``datasets.snapshot.Snapshot``. Views opt in per request with
+``?backend=snapshot`` or for every request with ``HEALIX_INSIGHTS_BACKEND``;
+``get_snapshot`` falls back to the database while no snapshot of the current
+``DatasetVersion`` has been published.
+"""
+
+from django.conf import settings
+
+from datasets.snapshot import current_snapshot
+from datasets.versioning import get_dataset_version
+from healix_backend.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+BACKENDS = ("orm", "snapshot")
+DEFAULT_BACKEND = "orm"
+
+
+class AnalyticsError(ValueError):
+    """Raised for an unknown insights backend."""
+
+
+def get_snapshot(params):
+    """
+    The snapshot to answer a request with query ``params`` from, or ``None``
+    to use the database.
+    """
+    backend = params.get("backend") or getattr(
+        settings, "HEALIX_INSIGHTS_BACKEND", DEFAULT_BACKEND
+    )
+    if backend not in BACKENDS:
+        raise AnalyticsError(
+            f"Unknown backend '{backend}'. Available: {', '.join(BACKENDS)}."
+        )
+    if backend == "orm":
+        return None
+    snapshot = current_snapshot()
+    if snapshot is None or snapshot.version != get_dataset_version()[0]:
+        return None
+    return snapshot
+
+
+def _records(frame):
+    """Row dicts of ``frame`` with missing values as ``None``."""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def condition_prevalence(snapshot, description):
+    """``gender``/``count`` rows of ``description`` conditions, most frequent first."""
+    patient_ids = snapshot.table(
+        "conditions", ["patient_id"], description=description
+    ).column("patient_id")
+    genders = snapshot.frame("patients", ["id", "gender"], index="id")["gender"]
+    counts = (
+        genders.reindex(patient_ids.to_numpy(zero_copy_only=False))
+        .value_counts(dropna=False)
+        .rename_axis("gender")
+        .rename("count")
+        .reset_index()
+        .sort_values(["count", "gender"], ascending=[False, True])
+    )
+    return _records(counts)
+
+
+def average_bmi(snapshot):
+    """``gender``/``average_bmi`` rows, ordered by gender."""
+    patients = snapshot.frame("patients", ["gender", "bmi"])
+    averages = (
+        patients.groupby("gender", dropna=False, observed=True)["bmi"]
+        .mean()
+        .rename("average_bmi")
+        .reset_index()
+        # By name rather than by category order
+        .astype({"gender": object})
+        .sort_values("gender")
+    )
+    return _records(averages)
+
+
+def bp_category_counts(snapshot):
+    """``bp_category``/``count`` rows covering every patient."""
+    patients = snapshot.frame("patients", ["bp_category"])
+    counts = (
+        patients["bp_category"].value_counts(dropna=False, sort=False).rename("count")
+    )
+    return _records(counts.reset_index())
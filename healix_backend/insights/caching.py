@@ -0,0 +1,73 @@
+"""
+Versioned response cache for the insights endpoints.
+
+Insight responses only change when the datasets do, so ``versioned_cache``
+stores each successful response body under the request path, its query
+parameters and the current ``DatasetVersion``. A new upload or edit bumps the
+version, which switches every view to fresh keys; stale entries are never read
+again and are evicted by the cache backend's LRU culling.
+
+Responses carry an ``ETag`` derived from the same key, so clients revalidating
+with ``If-None-Match`` get a ``304 Not Modified`` without a body. There is no
+``Last-Modified``: its one-second resolution cannot tell apart two versions
+bumped within the same second, so ``If-Modified-Since`` could confirm a stale
+body.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+from datasets.versioning import get_dataset_version
+
+DEFAULT_CACHE_ALIAS = "insights"
+
+
+def get_cache():
+    return caches[getattr(settings, "HEALIX_INSIGHTS_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def request_digest(request):
+    """Hash of the request path and its (order-insensitive) query parameters."""
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists() for value in values
+    )
+    return hashlib.md5(
+        repr((request.path, params)).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def versioned_cache(view_method):
+    """Cache and validate the responses of an ``APIView.get`` handler."""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        version, _ = get_dataset_version()
+        digest = request_digest(request)
+        key = f"insights:{version}:{digest}"
+        etag = quote_etag(f"{version}-{digest[:16]}")
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            response = not_modified
+        else:
+            cache = get_cache()
+            data = cache.get(key)
+            if data is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data)
+            else:
+                response = Response(data)
+        response["ETag"] = etag
+        # Dashboards may keep the body but must revalidate before reusing it
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    return wrapper
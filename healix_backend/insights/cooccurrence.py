@@ -0,0 +1,236 @@
+"""
+Condition co-occurrence.
+
+Which conditions cluster together is read from ``ConditionCooccurrence``: the
+number of patients having both conditions of each pair. The counts come from
+a binary patient x condition incidence matrix ``A`` (scipy.sparse), where one
+product ``A.T @ A`` gives every pair at once, each condition's own patient
+count on its diagonal, instead of self-joining ``Condition`` per patient.
+
+Uploads keep the counts current without a rebuild: a written chunk only
+changes the rows of ``A`` of its patients, so ``B_after.T @ B_after -
+B_before.T @ B_before`` over those patients' incidence rows is the exact
+delta, added with one atomic upsert. ``rebuild`` recomputes everything and
+backs ``manage.py refresh_insights``.
+
+``pair_metrics`` turns the counts into lift (how much more often a pair
+occurs than if the conditions were independent) and Jaccard similarity.
+"""
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from datasets.batching import batched
+from datasets.models import Condition
+from healix_backend.lazy import lazy_import
+
+from .aggregates import upsert_increments
+from .models import ConditionCooccurrence, GenderBMIStats
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+sparse = lazy_import("scipy.sparse")
+
+PAIR_COLUMNS = ["description_a", "description_b", "patients"]
+METRICS = ("lift", "jaccard", "patients")
+
+
+def incidence(pairs):
+    """
+    ``(matrix, descriptions)``: the binary CSR incidence matrix of a frame of
+    ``patient_id``/``description`` rows (duplicates allowed) and the sorted
+    descriptions its columns stand for.
+    """
+    pairs = pairs.dropna(subset=["description"]).drop_duplicates(
+        ["patient_id", "description"]
+    )
+    patients = pd.factorize(pairs["patient_id"])[0]
+    conditions = pd.Categorical(pairs["description"])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype="int64"), (patients, conditions.codes)),
+        shape=(patients.max() + 1 if len(pairs) else 0, len(conditions.categories)),
+    )
+    return matrix, conditions.categories
+
+
+def pair_counts(pairs):
+    """
+    Frame of ``description_a <= description_b`` pairs and the number of
+    patients in ``pairs`` having both, from a single sparse product.
+    """
+    matrix, descriptions = incidence(pairs)
+    # Sorted columns make the upper triangle the description_a <= b half
+    counts = sparse.triu(matrix.T @ matrix).tocoo()
+    return pd.DataFrame(
+        {
+            "description_a": np.asarray(descriptions)[counts.row],
+            "description_b": np.asarray(descriptions)[counts.col],
+            "patients": counts.data,
+        },
+        columns=PAIR_COLUMNS,
+    )
+
+
+def count_changes(before, after):
+    """Pair count deltas between two incidence frames of the same patients."""
+    delta = (
+        pair_counts(after)
+        .set_index(PAIR_COLUMNS[:2])["patients"]
+        .sub(pair_counts(before).set_index(PAIR_COLUMNS[:2])["patients"], fill_value=0)
+        .astype("int64")
+    )
+    return delta[delta != 0].reset_index()
+
+
+def _condition_rows(patient_ids):
+    """``patient_id``/``description``/``rows`` of the stored conditions of patients."""
+    frames = [
+        pd.DataFrame.from_records(
+            list(
+                Condition.objects.filter(
+                    patient_id__in=chunk,
+                    description__isnull=False,
+                )
+                .values_list("patient_id", "description")
+                .annotate(rows=Count("id"))
+                .order_by()
+            ),
+            columns=["patient_id", "description", "rows"],
+        )
+        for chunk in batched(patient_ids)
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def add_conditions(frame):
+    """
+    Add newly written conditions (a frame with ``patient_id`` and
+    ``description`` columns) to the co-occurrence counts.
+    """
+    frame = frame.dropna(subset=["description"])
+    if frame.empty:
+        return
+    after = _condition_rows(frame["patient_id"].unique().tolist())
+    written = frame.groupby(["patient_id", "description"]).size().rename("written")
+    stored = after.join(written, on=["patient_id", "description"])
+    # A pair existed before the chunk if some of its rows were already stored
+    before = stored[stored["rows"] > stored["written"].fillna(0)]
+    apply_changes(count_changes(before, after))
+
+
+def update_patient(patient_id, added=None, removed=None, pending=()):
+    """
+    Apply a single-row change to one patient's conditions: a row with
+    description ``added`` was created, or one with ``removed`` was deleted, or
+    a row's description changed from ``removed`` to ``added``. ``pending``
+    holds the descriptions of the patient's rows deleted by the same query
+    whose removal has not been applied yet.
+    """
+    if added == removed:
+        return
+    rows = Counter(pending)
+    for _, description, count in _condition_rows([patient_id]).itertuples(
+        index=False, name=None
+    ):
+        rows[description] += count
+    # The patient only gained a condition if no other row already had it
+    new = {added} if added is not None and rows[added] == 1 else set()
+    gone = {removed} if removed is not None and rows[removed] == 0 else set()
+    if not new and not gone:
+        return
+    current = {description for description, count in rows.items() if count}
+    before = pd.DataFrame(
+        {"patient_id": patient_id, "description": sorted(current - new | gone)}
+    )
+    after = pd.DataFrame({"patient_id": patient_id, "description": sorted(current)})
+    apply_changes(count_changes(before, after))
+
+
+def apply_changes(delta):
+    """Add a frame of pair ``patients`` deltas to the stored counts."""
+    if delta.empty:
+        return
+    rows = list(delta[PAIR_COLUMNS].itertuples(index=False, name=None))
+    rows = [(a, b, int(patients)) for a, b, patients in rows]
+    with transaction.atomic():
+        if connection.vendor in ("postgresql", "sqlite"):
+            upsert_increments(
+                ConditionCooccurrence, PAIR_COLUMNS[:2], PAIR_COLUMNS[2:], rows
+            )
+        else:
+            for a, b, patients in rows:
+                updated = ConditionCooccurrence.objects.filter(
+                    description_a=a, description_b=b
+                ).update(patients=F("patients") + patients)
+                if not updated:
+                    ConditionCooccurrence.objects.create(
+                        description_a=a, description_b=b, patients=patients
+                    )
+        # A rebuild has no rows for pairs no patient has any more
+        emptied = delta.loc[delta["patients"] < 0, "description_a"].unique().tolist()
+        for chunk in batched(emptied):
+            ConditionCooccurrence.objects.filter(
+                description_a__in=chunk,
+                patients=0,
+            ).delete()
+
+
+def rebuild():
+    """Recompute every co-occurrence count from the conditions table."""
+    pairs = pd.DataFrame.from_records(
+        Condition.objects.filter(description__isnull=False)
+        .values_list("patient_id", "description")
+        .distinct()
+        .iterator(chunk_size=10000),
+        columns=["patient_id", "description"],
+    )
+    counts = pair_counts(pairs)
+    with transaction.atomic():
+        ConditionCooccurrence.objects.all().delete()
+        ConditionCooccurrence.objects.bulk_create(
+            (
+                ConditionCooccurrence(description_a=a, description_b=b, patients=n)
+                for a, b, n in counts.itertuples(index=False, name=None)
+            ),
+            batch_size=5000,
+        )
+
+
+def pair_metrics(condition_name=None, min_patients=1):
+    """
+    Frame of condition pairs (``condition``, ``other``) with ``patients``,
+    ``lift`` and ``jaccard``; only pairs including ``condition_name`` if given.
+    """
+    pairs = ConditionCooccurrence.objects.filter(patients__gte=min_patients)
+    if condition_name is not None:
+        pairs = pairs.filter(
+            Q(description_a=condition_name) | Q(description_b=condition_name)
+        )
+    pairs = pd.DataFrame.from_records(
+        list(
+            pairs.exclude(description_a=F("description_b")).values_list(*PAIR_COLUMNS)
+        ),
+        columns=["condition", "other", "patients"],
+    )
+    if condition_name is not None:
+        # Put the requested condition first in every pair
+        swap = pairs["other"] == condition_name
+        pairs.loc[swap, ["condition", "other"]] = pairs.loc[
+            swap, ["other", "condition"]
+        ].to_numpy()
+    # Each condition's own patient count, one row per known condition
+    own = dict(
+        ConditionCooccurrence.objects.filter(
+            description_a=F("description_b")
+        ).values_list("description_a", "patients")
+    )
+    total = GenderBMIStats.objects.aggregate(total=Sum("patients"))["total"] or 0
+
+    n_a = pairs["condition"].map(own).astype("float64")
+    n_b = pairs["other"].map(own).astype("float64")
+    both = pairs["patients"].astype("float64")
+    pairs["lift"] = both * total / (n_a * n_b)
+    pairs["jaccard"] = both / (n_a + n_b - both)
+    return pairs, total
@@ -0,0 +1,85 @@
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from datasets.ingestion import ConditionLoader, PatientLoader
+from datasets.management.commands._synthetic import conditions_frame, patients_frame
+from datasets.snapshot import build_snapshot
+from insights.caching import get_cache
+from insights.management.commands.benchmark_insights import legacy_queries
+from insights.views import (
+    AvgBMIByLocation,
+    BloodPressureDistribution,
+    ConditionPrevalenceByLocation,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the uncached insight endpoints served from the database "
+        "(aggregate tables, and the raw GROUP BY queries they replaced) with "
+        "the same endpoints served from the Parquet analytics snapshot, and "
+        "report the cost of building the snapshot. Synthetic rows are rolled "
+        "back and the snapshot is written to a temporary directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conditions", type=int, nargs="+", default=[10_000, 100_000, 500_000]
+        )
+        parser.add_argument("--patients", type=int, default=20_000)
+        parser.add_argument("--requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        views = [
+            (
+                ConditionPrevalenceByLocation.as_view(),
+                {"condition_name": "Hypertension"},
+            ),
+            (AvgBMIByLocation.as_view(), {}),
+            (BloodPressureDistribution.as_view(), {}),
+        ]
+
+        def endpoints(backend):
+            get_cache().clear()
+            for view, params in views:
+                view(factory.get("/", {**params, "backend": backend}))
+
+        for rows in options["conditions"]:
+            with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(
+                HEALIX_SNAPSHOT_DIR=snapshot_dir
+            ), transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = conditions_frame(rows, options["patients"])
+                ConditionLoader().load(frame)
+                started = time.perf_counter()
+                build_snapshot()
+                build = time.perf_counter() - started
+
+                results = {}
+                for label, run in (
+                    ("group by", legacy_queries),
+                    ("orm", lambda: endpoints("orm")),
+                    ("snapshot", lambda: endpoints("snapshot")),
+                ):
+                    run()  # Warm up; loads the snapshot's tables
+                    samples = []
+                    for _ in range(options["requests"]):
+                        started = time.perf_counter()
+                        run()
+                        samples.append((time.perf_counter() - started) * 1000)
+                    results[label] = statistics.median(samples)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{len(frame):>9,} conditions: group by "
+                f"{results['group by']:7.2f} ms, aggregates "
+                f"{results['orm']:6.2f} ms, snapshot {results['snapshot']:6.2f} ms; "
+                f"snapshot build {build:5.2f} s"
+            )
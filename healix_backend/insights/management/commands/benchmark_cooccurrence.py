@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from datasets.ingestion import ConditionLoader, PatientLoader
+from datasets.management.commands._synthetic import conditions_frame, patients_frame
+from datasets.models import Condition
+from insights import cooccurrence
+from insights.models import ConditionCooccurrence
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare counting condition co-occurrence with an ORM self-join of "
+        "Condition against the sparse incidence-matrix rebuild, and time the "
+        "incremental update applied for an uploaded chunk. The synthetic rows "
+        "are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conditions", type=int, nargs="+", default=[10_000, 100_000, 500_000]
+        )
+        parser.add_argument("--patients", type=int, default=20_000)
+        parser.add_argument("--chunk", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        for rows in options["conditions"]:
+            with transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = conditions_frame(rows, options["patients"])
+                ConditionLoader().load(frame)
+
+                started = time.perf_counter()
+                self_join = list(
+                    Condition.objects.filter(
+                        description__lte=F("patient__conditions__description")
+                    )
+                    .values("description", "patient__conditions__description")
+                    .annotate(patients=Count("patient_id", distinct=True))
+                    .order_by()
+                )
+                joined = time.perf_counter() - started
+
+                started = time.perf_counter()
+                cooccurrence.rebuild()
+                rebuilt = time.perf_counter() - started
+                assert len(self_join) == ConditionCooccurrence.objects.count()
+
+                # The update an upload applies for one more written chunk
+                chunk = conditions_frame(options["chunk"], options["patients"], seed=1)
+                chunk = chunk.assign(START="2030-01-01").drop_duplicates(
+                    ["PATIENT", "DESCRIPTION"]
+                )
+                ConditionLoader().load(chunk)
+                started = time.perf_counter()
+                cooccurrence.add_conditions(
+                    chunk.rename(
+                        columns={"PATIENT": "patient_id", "DESCRIPTION": "description"}
+                    )
+                )
+                incremental = time.perf_counter() - started
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{len(frame):>9,} conditions: self-join {joined * 1000:9.1f} ms, "
+                f"sparse rebuild {rebuilt * 1000:8.1f} ms, "
+                f"{len(chunk):,}-row chunk update {incremental * 1000:7.1f} ms"
+            )
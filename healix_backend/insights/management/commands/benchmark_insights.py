@@ -0,0 +1,109 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count
+from rest_framework.test import APIRequestFactory
+
+from datasets.ingestion import ConditionLoader, PatientLoader
+from datasets.management.commands._synthetic import conditions_frame, patients_frame
+from datasets.models import Condition, Patient
+from insights import aggregates
+from insights.caching import get_cache
+from insights.views import (
+    AvgBMIByLocation,
+    BloodPressureDistribution,
+    ConditionPrevalenceByLocation,
+)
+
+
+def legacy_queries():
+    """The GROUP BY queries the insight endpoints used to run per request."""
+    list(
+        Condition.objects.filter(description="Hypertension")
+        .values("patient__gender")
+        .annotate(count=Count("patient"))
+        .order_by("-count")
+    )
+    list(
+        Patient.objects.values("gender").annotate(avg_bmi=Avg("bmi")).order_by("gender")
+    )
+    list(Patient.objects.values("bp_category").annotate(count=Count("id")))
+    Patient.objects.count()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the insight endpoints' old per-request GROUP BY queries with "
+        "reads of the precomputed aggregates and of the versioned response "
+        "cache across table sizes, and report the incremental refresh cost of "
+        "an upload. All writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conditions", type=int, nargs="+", default=[10_000, 100_000, 500_000]
+        )
+        parser.add_argument("--patients", type=int, default=20_000)
+        parser.add_argument("--requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        views = [
+            (
+                ConditionPrevalenceByLocation.as_view(),
+                {"condition_name": "Hypertension"},
+            ),
+            (AvgBMIByLocation.as_view(), {}),
+            (BloodPressureDistribution.as_view(), {}),
+        ]
+
+        def endpoints():
+            for view, params in views:
+                view(factory.get("/", params))
+
+        def uncached():
+            get_cache().clear()
+            endpoints()
+
+        for rows in options["conditions"]:
+            with transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = conditions_frame(rows, options["patients"])
+                ConditionLoader().load(frame)
+
+                results = {}
+                for label, run in (
+                    ("group by", legacy_queries),
+                    ("aggregates", uncached),
+                    ("cached", endpoints),
+                ):
+                    run()  # Warm up
+                    samples = []
+                    for _ in range(options["requests"]):
+                        started = time.perf_counter()
+                        run()
+                        samples.append((time.perf_counter() - started) * 1000)
+                    results[label] = statistics.median(samples)
+
+                # What an upload chunk of 1,000 new conditions adds to the
+                # aggregates, against recomputing them from scratch
+                new_rows = conditions_frame(1000, options["patients"], seed=1).rename(
+                    columns={"PATIENT": "patient_id", "DESCRIPTION": "description"}
+                )
+                started = time.perf_counter()
+                aggregates.add_condition_counts(new_rows)
+                results["delta"] = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                aggregates.rebuild()
+                results["rebuild"] = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{len(frame):>9,} conditions: requests: group by "
+                f"{results['group by']:7.2f} ms, aggregates "
+                f"{results['aggregates']:5.2f} ms, cached "
+                f"{results['cached']:5.2f} ms; 1,000-row upload delta "
+                f"{results['delta']:6.1f} ms vs rebuild {results['rebuild']:7.1f} ms"
+            )
@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from datasets.ingestion import ConditionLoader, PatientLoader
+from datasets.management.commands._synthetic import (
+    CONDITIONS,
+    conditions_frame,
+    patients_frame,
+)
+from insights.caching import get_cache
+from insights.views import CohortPrevalence, ConditionPrevalenceByLocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare building a dashboard of every synthetic condition from one "
+        "condition-prevalence/ call per condition with a single uncached "
+        "prevalence/ call grouped by gender and age band. The synthetic rows "
+        "are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conditions", type=int, nargs="+", default=[10_000, 100_000]
+        )
+        parser.add_argument("--patients", type=int, default=20_000)
+        parser.add_argument("--requests", type=int, default=10)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        per_condition = ConditionPrevalenceByLocation.as_view()
+        cohort = CohortPrevalence.as_view()
+
+        def dashboard_per_condition():
+            for name in CONDITIONS:
+                per_condition(factory.get("/", {"condition_name": name}))
+
+        def dashboard_cohort():
+            cohort(
+                factory.get(
+                    "/",
+                    {"conditions": ",".join(CONDITIONS), "group_by": "gender,age_band"},
+                )
+            )
+
+        for rows in options["conditions"]:
+            with transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = conditions_frame(rows, options["patients"])
+                ConditionLoader().load(frame)
+
+                results = {}
+                for label, run in (
+                    ("per condition", dashboard_per_condition),
+                    ("cohort", dashboard_cohort),
+                ):
+                    samples = []
+                    for _ in range(options["requests"]):
+                        get_cache().clear()
+                        started = time.perf_counter()
+                        run()
+                        samples.append((time.perf_counter() - started) * 1000)
+                    results[label] = statistics.median(samples)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{len(frame):>9,} conditions: {len(CONDITIONS)} condition-prevalence/ "
+                f"calls {results['per condition']:8.1f} ms, one prevalence/ call "
+                f"{results['cohort']:8.1f} ms"
+            )
@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from datasets.ingestion import ObservationLoader, PatientLoader
+from datasets.management.commands._synthetic import observations_frame, patients_frame
+from insights.caching import get_cache
+from insights.views import ObservationTrend, PatientObservationTrend
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the uncached trends/ endpoints per bucketing interval across "
+        "table sizes and report how many points each returns. The synthetic "
+        "rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[50_000, 200_000])
+        parser.add_argument("--patients", type=int, default=5_000)
+        parser.add_argument("--requests", type=int, default=10)
+        parser.add_argument("--max-points", type=int, default=500)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        cohort = ObservationTrend.as_view()
+        patient = PatientObservationTrend.as_view()
+
+        def timed(view, params, **kwargs):
+            samples = []
+            for _ in range(options["requests"]):
+                get_cache().clear()
+                started = time.perf_counter()
+                response = view(factory.get("/", params), **kwargs)
+                samples.append((time.perf_counter() - started) * 1000)
+            return statistics.median(samples), response.data
+
+        for rows in options["rows"]:
+            with transaction.atomic():
+                PatientLoader().load(patients_frame(options["patients"]))
+                frame = observations_frame(rows, options["patients"])
+                # Observations are stored per day
+                frame = frame[
+                    ~frame.assign(DAY=frame["DATE"].str[:10]).duplicated(
+                        ["PATIENT", "DESCRIPTION", "DAY"]
+                    )
+                ]
+                ObservationLoader().load(frame)
+                self.stdout.write(f"{len(frame):,} observations")
+
+                params = {
+                    "description": "Body Mass Index",
+                    "max_points": options["max_points"],
+                }
+                for interval in ("day", "week", "month"):
+                    ms, data = timed(cohort, {**params, "interval": interval})
+                    self.stdout.write(
+                        f"    cohort  {interval:<6}{ms:9.1f} ms  "
+                        f"{len(data['points']):>5} points"
+                        f"{' (downsampled)' if data['downsampled'] else ''}"
+                    )
+                busiest = frame["PATIENT"].value_counts().index[0]
+                ms, data = timed(patient, params, patient_id=busiest)
+                self.stdout.write(
+                    f"    patient raw   {ms:9.1f} ms  {len(data['points']):>5} points"
+                )
+                transaction.set_rollback(True)
@@ -0,0 +1,107 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:33
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_aggregates(apps, schema_editor):
+    """Compute the aggregates for data loaded before they existed."""
+    Patient = apps.get_model("datasets", "Patient")
+    Condition = apps.get_model("datasets", "Condition")
+    ConditionPrevalence = apps.get_model("insights", "ConditionPrevalence")
+    GenderBMIStats = apps.get_model("insights", "GenderBMIStats")
+    BPCategoryCount = apps.get_model("insights", "BPCategoryCount")
+
+    ConditionPrevalence.objects.bulk_create(
+        ConditionPrevalence(
+            description=row["description"],
+            gender=row["patient__gender"],
+            count=row["count"],
+        )
+        for row in Condition.objects.values("description", "patient__gender")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    GenderBMIStats.objects.bulk_create(
+        GenderBMIStats(**row)
+        for row in Patient.objects.values("gender")
+        .annotate(patients=Count("id"), bmi_count=Count("bmi"), bmi_sum=Sum("bmi"))
+        .order_by()
+    )
+    BPCategoryCount.objects.bulk_create(
+        BPCategoryCount(**row)
+        for row in Patient.objects.values("bp_category")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("datasets", "0004_natural_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BPCategoryCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bp_category", models.CharField(blank=True, max_length=20, null=True)),
+                ("count", models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="GenderBMIStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gender", models.CharField(blank=True, max_length=10, null=True)),
+                ("patients", models.BigIntegerField()),
+                ("bmi_count", models.BigIntegerField()),
+                ("bmi_sum", models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ConditionPrevalence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("description", models.TextField(blank=True, null=True)),
+                ("gender", models.CharField(blank=True, max_length=10, null=True)),
+                ("count", models.BigIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["description", "-count"], name="prevalence_lookup_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+def populate_cooccurrence(apps, schema_editor):
+    """Count the pairs of conditions loaded before the table existed."""
+    import pandas as pd
+
+    from insights.cooccurrence import pair_counts
+
+    Condition = apps.get_model("datasets", "Condition")
+    ConditionCooccurrence = apps.get_model("insights", "ConditionCooccurrence")
+
+    pairs = pd.DataFrame.from_records(
+        Condition.objects.filter(description__isnull=False)
+        .values_list("patient_id", "description")
+        .distinct()
+        .iterator(chunk_size=10000),
+        columns=["patient_id", "description"],
+    )
+    ConditionCooccurrence.objects.bulk_create(
+        (
+            ConditionCooccurrence(description_a=a, description_b=b, patients=n)
+            for a, b, n in pair_counts(pairs).itertuples(index=False, name=None)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("insights", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConditionCooccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("description_a", models.TextField()),
+                ("description_b", models.TextField()),
+                ("patients", models.BigIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["description_b"], name="cooccurrence_b_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("description_a", "description_b"),
+                        name="unique_cooccurrence_pair",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_cooccurrence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.5 on 2026-10-17 08:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+# model -> (group key, counted fields)
+GROUPS = {
+    "ConditionPrevalence": (["description", "gender"], ["count"]),
+    "GenderBMIStats": (["gender"], ["patients", "bmi_count", "bmi_sum"]),
+    "BPCategoryCount": (["bp_category"], ["count"]),
+}
+
+
+def merge_duplicate_groups(apps, schema_editor):
+    """
+    Concurrent uploads could create a group row twice, each holding part of
+    the counts. Keep one row per group with the summed counts.
+    """
+    for name, (key, fields) in GROUPS.items():
+        model = apps.get_model("insights", name)
+        duplicates = (
+            model.objects.values(*key)
+            .annotate(
+                rows=Count("id"),
+                keep=Min("id"),
+                **{f"total_{field}": Sum(field) for field in fields},
+            )
+            .filter(rows__gt=1)
+            .order_by()
+        )
+        for group in duplicates:
+            rows = model.objects.filter(
+                *(
+                    (
+                        Q(**{f"{field}__isnull": True})
+                        if group[field] is None
+                        else Q(**{field: group[field]})
+                    )
+                    for field in key
+                )
+            )
+            rows.exclude(id=group["keep"]).delete()
+            rows.filter(id=group["keep"]).update(
+                **{field: group[f"total_{field}"] for field in fields}
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("insights", "0002_condition_cooccurrence"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_groups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="bpcategorycount",
+            constraint=models.UniqueConstraint(
+                fields=("bp_category",), name="unique_bp_category", nulls_distinct=False
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="conditionprevalence",
+            constraint=models.UniqueConstraint(
+                fields=("description", "gender"),
+                name="unique_prevalence_group",
+                nulls_distinct=False,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="genderbmistats",
+            constraint=models.UniqueConstraint(
+                fields=("gender",), name="unique_bmi_stats_gender", nulls_distinct=False
+            ),
+        ),
+    ]
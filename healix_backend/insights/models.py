@@ -1,3 +1,105 @@
 from django.db import models
 
-# Create your models here.
+# Aggregates maintained by insights.aggregates so the insight endpoints read a
+# handful of precomputed rows instead of grouping the raw tables per request.
+
+
+class ConditionPrevalence(models.Model):
+    """
+    Number of condition records per condition description and patient gender.
+    """
+
+    description = models.TextField(null=True, blank=True)
+    gender = models.CharField(max_length=10, null=True, blank=True)
+    count = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            # One row per group; uploads increment it with an upsert
+            models.UniqueConstraint(
+                fields=["description", "gender"],
+                name="unique_prevalence_group",
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["description", "-count"], name="prevalence_lookup_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.gender}): {self.count}"
+
+
+class GenderBMIStats(models.Model):
+    """
+    Patient count and BMI sum/count per gender; the average is derived on read.
+    """
+
+    gender = models.CharField(max_length=10, null=True, blank=True)
+    patients = models.BigIntegerField()
+    bmi_count = models.BigIntegerField()
+    bmi_sum = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["gender"], name="unique_bmi_stats_gender", nulls_distinct=False
+            ),
+        ]
+
+    @property
+    def average_bmi(self):
+        return self.bmi_sum / self.bmi_count if self.bmi_count else None
+
+    def __str__(self):
+        return f"BMI stats for {self.gender}"
+
+
+class BPCategoryCount(models.Model):
+    """
+    Number of patients per blood pressure category (including uncategorized).
+    """
+
+    bp_category = models.CharField(max_length=20, null=True, blank=True)
+    count = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bp_category"],
+                name="unique_bp_category",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bp_category}: {self.count}"
+
+
+class ConditionCooccurrence(models.Model):
+    """
+    Number of patients with both conditions of a pair, stored once per pair
+    with ``description_a <= description_b``. Rows with equal descriptions hold
+    each condition's own patient count.
+    """
+
+    description_a = models.TextField()
+    description_b = models.TextField()
+    patients = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["description_a", "description_b"],
+                name="unique_cooccurrence_pair",
+            ),
+        ]
+        indexes = [
+            # Pairs of one condition where it sorts second
+            models.Index(fields=["description_b"], name="cooccurrence_b_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.description_a} + {self.description_b}: {self.patients}"
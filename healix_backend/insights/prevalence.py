@@ -0,0 +1,313 @@
+"""
+Multi-dimension condition prevalence for the insights dashboards.
+
+``cohort_prevalence`` groups patients by any of ``DIMENSIONS`` (gender, age
+band, blood pressure category, birth decade), after optional filters on the
+same dimensions, and summarises every group in one query: its patient count,
+how many of them have each requested condition, and the distribution of each
+of ``MEASURES`` (count, mean, percentiles and a fixed-bin histogram).
+
+Condition counts are ``COUNT(*) FILTER (WHERE EXISTS ...)`` aggregates probing
+``condition_description_idx`` per patient, and histogram bins are ``FILTER``
+aggregates over value ranges (``CASE`` on backends without ``FILTER``).
+PostgreSQL computes the percentiles with ``percentile_cont`` in the same
+query; other backends return one row per patient instead, and pandas computes
+the same aggregates and (linearly interpolated) quantiles.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Avg,
+    Case,
+    CharField,
+    Count,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, ExtractYear
+
+from datasets.models import Condition, Patient
+from healix_backend.lazy import lazy_import
+
+from .trends import PercentileCont, parse_percentiles
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+AGE_BANDS = [
+    ("0-17", 0, 18),
+    ("18-29", 18, 30),
+    ("30-39", 30, 40),
+    ("40-49", 40, 50),
+    ("50-59", 50, 60),
+    ("60-69", 60, 70),
+    ("70-79", 70, 80),
+    ("80+", 80, None),
+]
+DIMENSIONS = ("gender", "age_band", "bp_category", "birth_decade")
+# Dimensions computed from patient fields rather than stored
+COMPUTED_DIMENSIONS = ("age_band", "birth_decade")
+# Measure -> histogram bin edges; the outer bins are open-ended
+MEASURES = {
+    "bmi": (18.5, 25, 30, 35, 40),
+    "sys_bp": (90, 120, 130, 140, 160, 180),
+    "dia_bp": (60, 80, 90, 100, 120),
+}
+DEFAULT_MAX_CONDITIONS = 50
+
+
+class PrevalenceError(ValueError):
+    """Raised for missing or invalid prevalence parameters."""
+
+
+def get_max_conditions():
+    return getattr(settings, "HEALIX_PREVALENCE_MAX_CONDITIONS", DEFAULT_MAX_CONDITIONS)
+
+
+def _dimension(name):
+    if name == "age_band":
+        return Case(
+            *(
+                When(
+                    Q(age__gte=lower) & (Q() if upper is None else Q(age__lt=upper)),
+                    then=Value(label),
+                )
+                for label, lower, upper in AGE_BANDS
+            ),
+            default=None,
+            output_field=CharField(),
+        )
+    return Cast(ExtractYear("birthdate"), IntegerField()) / 10 * 10
+
+
+def bin_labels(edges):
+    """Histogram bin labels for ``edges``: ``<a``, ``a-b``, ..., ``>=z``."""
+    return (
+        [f"<{edges[0]:g}"]
+        + [f"{lower:g}-{upper:g}" for lower, upper in zip(edges, edges[1:])]
+        + [f">={edges[-1]:g}"]
+    )
+
+
+def _bins(measure, edges):
+    """``Q`` range of every histogram bin of ``measure``."""
+    bounds = [None, *edges, None]
+    for lower, upper in zip(bounds, bounds[1:]):
+        condition = Q()
+        if lower is not None:
+            condition &= Q(**{f"{measure}__gte": lower})
+        if upper is not None:
+            condition &= Q(**{f"{measure}__lt": upper})
+        yield condition
+
+
+def _split(params, name):
+    return [
+        value.strip()
+        for item in params.getlist(name)
+        for value in item.split(",")
+        if value.strip()
+    ]
+
+
+def parse_prevalence_params(params):
+    """
+    Prevalence options from query ``params``: ``conditions`` (comma-separated,
+    or repeated ``condition`` for names containing commas; required),
+    ``group_by`` dimensions, ``percentiles`` and one filter per dimension
+    (comma-separated values, any of which matches).
+    """
+    conditions = list(dict.fromkeys(params.getlist("condition")))
+    conditions += [
+        name for name in _split(params, "conditions") if name not in conditions
+    ]
+    if not conditions:
+        raise PrevalenceError("At least one condition name is required.")
+    max_conditions = get_max_conditions()
+    if len(conditions) > max_conditions:
+        raise PrevalenceError(
+            f"At most {max_conditions} conditions can be requested at once."
+        )
+
+    group_by = list(dict.fromkeys(_split(params, "group_by")))
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise PrevalenceError(
+            f"Unknown dimension '{unknown[0]}'. Available: {', '.join(DIMENSIONS)}."
+        )
+
+    filters = {}
+    for name in DIMENSIONS:
+        values = _split(params, name)
+        if not values:
+            continue
+        if name == "age_band":
+            labels = [label for label, _, _ in AGE_BANDS]
+            if not set(values) <= set(labels):
+                raise PrevalenceError(
+                    f"'age_band' must be one of: {', '.join(labels)}."
+                )
+        elif name == "birth_decade":
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                values = None
+            if not values or any(value % 10 for value in values):
+                raise PrevalenceError("'birth_decade' must be years such as 1980.")
+        filters[name] = values
+
+    percentiles = parse_percentiles(params, PrevalenceError)
+
+    return {
+        "conditions": conditions,
+        "group_by": group_by,
+        "filters": filters,
+        "percentiles": percentiles,
+    }
+
+
+def _patients(dimensions, filters):
+    """Patients matching ``filters``, annotated with the ``dimensions`` used."""
+    patients = Patient.objects.annotate(
+        **{name: _dimension(name) for name in COMPUTED_DIMENSIONS if name in dimensions}
+    )
+    for name, values in filters.items():
+        patients = patients.filter(**{f"{name}__in": values})
+    return patients
+
+
+def _has_condition(name):
+    return Exists(Condition.objects.filter(patient=OuterRef("pk"), description=name))
+
+
+def cohort_prevalence(conditions, group_by=(), filters=None, percentiles=()):
+    """
+    Frame with one row per group of ``group_by`` values: the group's values,
+    ``patients``, ``c<i>`` patients with ``conditions[i]``, and per measure
+    ``<measure>_count``, ``_mean``, ``_p<N>`` per percentile and ``_h<j>``
+    patients in histogram bin ``j``.
+    """
+    filters = filters or {}
+    group_by = list(group_by)
+    patients = _patients(set(group_by) | set(filters), filters)
+    columns = [*group_by, "patients", *(f"c{i}" for i in range(len(conditions)))]
+    for measure, edges in MEASURES.items():
+        columns += [f"{measure}_count", f"{measure}_mean"]
+        columns += [f"{measure}_p{p}" for p in percentiles]
+        columns += [f"{measure}_h{j}" for j in range(len(edges) + 1)]
+
+    if connection.vendor == "postgresql":
+        aggregates = {"patients": Count("pk")}
+        for i, name in enumerate(conditions):
+            aggregates[f"c{i}"] = Count("pk", filter=_has_condition(name))
+        for measure, edges in MEASURES.items():
+            aggregates[f"{measure}_count"] = Count(measure)
+            aggregates[f"{measure}_mean"] = Avg(measure)
+            for p in percentiles:
+                aggregates[f"{measure}_p{p}"] = PercentileCont(measure, p / 100)
+            for j, condition in enumerate(_bins(measure, edges)):
+                aggregates[f"{measure}_h{j}"] = Count("pk", filter=condition)
+        if not group_by:
+            return pd.DataFrame([patients.aggregate(**aggregates)], columns=columns)
+        rows = (
+            patients.values(*group_by)
+            .annotate(**aggregates)
+            .order_by(*group_by)
+            .values_list(*columns)
+        )
+        return pd.DataFrame.from_records(list(rows), columns=columns)
+
+    flags = {f"has{i}": _has_condition(name) for i, name in enumerate(conditions)}
+    fields = [*group_by, *MEASURES, *flags]
+    rows = patients.annotate(**flags).values_list(*fields)
+    frame = pd.DataFrame.from_records(list(rows), columns=fields)
+    for measure in MEASURES:
+        frame[measure] = frame[measure].astype("float64")
+    for measure, edges in MEASURES.items():
+        bins = pd.cut(
+            frame[measure], [-np.inf, *edges, np.inf], right=False, labels=False
+        )
+        for j in range(len(edges) + 1):
+            frame[f"{measure}_h{j}"] = bins == j
+
+    keys = group_by or np.zeros(len(frame), dtype=int)
+    grouped = frame.groupby(keys, dropna=False, sort=True)
+    summary = pd.DataFrame({"patients": grouped.size()})
+    for i in range(len(conditions)):
+        summary[f"c{i}"] = grouped[f"has{i}"].sum()
+    for measure, edges in MEASURES.items():
+        summary[f"{measure}_count"] = grouped[measure].count()
+        summary[f"{measure}_mean"] = grouped[measure].mean()
+        for p in percentiles:
+            summary[f"{measure}_p{p}"] = grouped[measure].quantile(p / 100)
+        for j in range(len(edges) + 1):
+            summary[f"{measure}_h{j}"] = grouped[f"{measure}_h{j}"].sum()
+    if not group_by:
+        # Like the SQL aggregate, one row even without patients
+        summary = summary.reindex([0]).fillna({"patients": 0})
+        return summary.reset_index(drop=True).reindex(columns=columns)
+    return summary.reset_index().reindex(columns=columns)
+
+
+def _missing(value):
+    return value is None or pd.isna(value)
+
+
+def _key(value):
+    """JSON-ready group value; pandas turns integer keys with gaps into floats."""
+    if _missing(value):
+        return None
+    if isinstance(value, (float, np.floating)):
+        return int(value)
+    return value
+
+
+def _count(value):
+    return 0 if _missing(value) else int(value)
+
+
+def _float(value):
+    return None if _missing(value) else float(value)
+
+
+def to_groups(frame, conditions, group_by, percentiles):
+    """JSON-ready dicts of the groups of a ``cohort_prevalence`` frame."""
+    groups = []
+    for row in frame.to_dict("records"):
+        patients = _count(row["patients"])
+        group = {name: _key(row[name]) for name in group_by}
+        group["patients"] = patients
+        group["conditions"] = []
+        for i, name in enumerate(conditions):
+            count = _count(row[f"c{i}"])
+            group["conditions"].append(
+                {
+                    "condition": name,
+                    "count": count,
+                    "rate_per_1000": (
+                        round(count * 1000 / patients, 2) if patients else None
+                    ),
+                }
+            )
+        group["measures"] = {
+            measure: {
+                "count": _count(row[f"{measure}_count"]),
+                "mean": _float(row[f"{measure}_mean"]),
+                "percentiles": {
+                    f"p{p}": _float(row[f"{measure}_p{p}"]) for p in percentiles
+                },
+                "histogram": [
+                    {"bin": label, "count": _count(row[f"{measure}_h{j}"])}
+                    for j, label in enumerate(bin_labels(edges))
+                ],
+            }
+            for measure, edges in MEASURES.items()
+        }
+        groups.append(group)
+    return groups
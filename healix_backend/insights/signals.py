@@ -0,0 +1,112 @@
+"""
+Keep the insight aggregates in sync with the raw tables.
+
+Bulk uploads report each written chunk through ``datasets.signals.rows_written``
+and vitals derived from observations through ``vitals_derived``; single-row
+changes made through the API arrive as model save/delete signals.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from datasets.models import Condition, Patient
+from datasets.signals import rows_written, vitals_derived
+
+from . import aggregates, cooccurrence
+
+
+@receiver(rows_written)
+def add_written_rows(sender, kind, mode, frame, previous=None, **kwargs):
+    if kind == "conditions":
+        # Written conditions are always new rows: upserts only drop or keep
+        # them, as conditions have no updatable fields
+        aggregates.add_condition_counts(frame)
+        cooccurrence.add_conditions(frame)
+    elif kind == "patients" and mode == "insert":
+        aggregates.add_new_patients(frame)
+    elif kind == "patients":
+        # Updated patients may have changed gender, which moves their
+        # conditions between prevalence rows
+        aggregates.apply_patient_upserts(frame, previous)
+
+
+@receiver(vitals_derived)
+def move_rederived_patients(sender, before, after, **kwargs):
+    aggregates.apply_vitals_changes(before, after)
+
+
+PATIENT_AGGREGATE_FIELDS = ("gender", "bmi", "bp_category")
+
+
+@receiver(pre_save, sender=Patient)
+@receiver(pre_delete, sender=Patient)
+def remember_stored_patient(sender, instance, **kwargs):
+    instance._stored_values = (
+        Patient.objects.filter(pk=instance.pk).values(*PATIENT_AGGREGATE_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def apply_patient_change(sender, instance, **kwargs):
+    before = getattr(instance, "_stored_values", None)
+    after = None
+    if kwargs.get("signal") is post_save:
+        after = {name: getattr(instance, name) for name in PATIENT_AGGREGATE_FIELDS}
+        update_fields = kwargs.get("update_fields")
+        if before is not None and update_fields is not None:
+            # Fields left out of the save keep their stored values
+            after.update(
+                (name, value)
+                for name, value in before.items()
+                if name not in update_fields
+            )
+    aggregates.apply_patient_change(instance.pk, before, after)
+
+
+@receiver(pre_save, sender=Condition)
+def remember_previous_description(sender, instance, **kwargs):
+    instance._previous_description = (
+        Condition.objects.filter(pk=instance.pk)
+        .values_list("description", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+# pk -> (patient_id, description) of conditions being deleted. A delete query
+# removes all of its rows before the first post_delete, so co-occurrence
+# updates count a patient's other pending rows as still present.
+_pending_deletes = {}
+
+
+@receiver(pre_delete, sender=Condition)
+def remember_deleted_condition(sender, instance, **kwargs):
+    _pending_deletes[instance.pk] = (instance.patient_id, instance.description)
+
+
+@receiver(post_save, sender=Condition)
+@receiver(post_delete, sender=Condition)
+def refresh_after_condition_change(sender, instance, **kwargs):
+    descriptions = {instance.description}
+    if getattr(instance, "_previous_description", None) is not None:
+        descriptions.add(instance._previous_description)
+    aggregates.refresh_condition_prevalence(descriptions)
+    if kwargs.get("signal") is post_delete:
+        _pending_deletes.pop(instance.pk, None)
+        cooccurrence.update_patient(
+            instance.patient_id,
+            removed=instance.description,
+            pending=[
+                description
+                for patient_id, description in list(_pending_deletes.values())
+                if patient_id == instance.patient_id
+            ],
+        )
+    else:
+        cooccurrence.update_patient(
+            instance.patient_id,
+            added=instance.description,
+            removed=getattr(instance, "_previous_description", None),
+        )
@@ -1,3 +1,760 @@
-from django.test import TestCase
+import datetime
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Avg
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from datasets.models import Condition, Observation, Patient
+from datasets.snapshot import build_snapshot
+from datasets.versioning import bump_dataset_version, get_dataset_version
+
+from . import aggregates, cooccurrence, trends
+from .caching import get_cache
+from .models import (
+    BPCategoryCount,
+    ConditionCooccurrence,
+    ConditionPrevalence,
+    GenderBMIStats,
+)
+
+PATIENTS_CSV = """Id,BIRTHDATE,GENDER
+p1,1980-05-01,M
+p2,1992-11-20,F
+p3,1975-02-11,F
+"""
+
+CONDITIONS_CSV = """START,PATIENT,DESCRIPTION
+2015-03-02,p1,Hypertension
+2018-07-19,p2,Hypertension
+2019-07-19,p3,Hypertension
+2018-07-19,p2,Prediabetes
+"""
+
+TRENDS_CSV = """DATE,PATIENT,DESCRIPTION,VALUE,UNITS
+2020-01-06T09:00:00Z,p1,Body Mass Index,30.0,kg/m2
+2020-01-07T09:00:00Z,p2,Body Mass Index,20.0,kg/m2
+2020-01-08T09:00:00Z,p3,Body Mass Index,25.0,kg/m2
+2020-01-14T09:00:00Z,p1,Body Mass Index,31.0,kg/m2
+2020-01-15T09:00:00Z,p2,Body Mass Index,21.0,kg/m2
+2020-02-03T09:00:00Z,p1,Body Mass Index,29.0,kg/m2
+2020-01-06T09:00:00Z,p1,Heart rate,70,/min
+"""
+
+
+def upload(client, kind, content, **params):
+    query = "&".join(
+        f"{key}={value}" for key, value in {"wait": "true", **params}.items()
+    )
+    return client.post(
+        f"/api/datasets/upload/{kind}/?{query}",
+        {"file": SimpleUploadedFile(f"{kind}.csv", content.encode())},
+        format="multipart",
+    )
+
+
+class InsightAggregateTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "conditions", CONDITIONS_CSV)
+
+    def prevalence(self, description):
+        response = self.client.get(
+            "/api/insights/condition-prevalence/", {"condition_name": description}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {row["location"]: row["prevalence_count"] for row in response.data}
+
+    def test_uploads_refresh_prevalence(self):
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 2, "M": 1})
+        self.assertEqual(self.prevalence("Prediabetes"), {"F": 1})
+
+        upload(
+            self.client,
+            "conditions",
+            "START,PATIENT,DESCRIPTION\n2020-01-01,p1,Prediabetes\n",
+        )
+        self.assertEqual(self.prevalence("Prediabetes"), {"F": 1, "M": 1})
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 2, "M": 1})
+
+    def test_upload_only_touches_written_descriptions(self):
+        ConditionPrevalence.objects.filter(description="Hypertension").update(count=99)
+        upload(
+            self.client,
+            "conditions",
+            "START,PATIENT,DESCRIPTION\n2020-01-01,p1,Prediabetes\n",
+        )
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 99, "M": 99})
+
+    def test_patient_upsert_moves_conditions_between_genders(self):
+        upload(
+            self.client,
+            "patients",
+            "Id,BIRTHDATE,GENDER\np1,1980-05-01,F\n",
+            mode="upsert",
+        )
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 3})
+
+    def test_patient_upsert_matches_rebuild_without_running_it(self):
+        Patient.objects.filter(id="p1").update(bmi=30.0)
+        Patient.objects.filter(id="p2").update(bmi=20.0)
+        aggregates.refresh_patient_stats()
+
+        def snapshot():
+            return (
+                set(
+                    ConditionPrevalence.objects.values_list(
+                        "description", "gender", "count"
+                    )
+                ),
+                {
+                    row.gender: (row.patients, row.bmi_count, row.average_bmi)
+                    for row in GenderBMIStats.objects.all()
+                },
+                dict(BPCategoryCount.objects.values_list("bp_category", "count")),
+            )
+
+        with mock.patch.object(aggregates, "rebuild", side_effect=AssertionError):
+            response = upload(
+                self.client,
+                "patients",
+                "Id,BIRTHDATE,GENDER\n"
+                "p1,1980-05-01,F\n"
+                "p2,1992-11-20,M\n"
+                "p3,1975-02-11,F\n"
+                "p4,2001-01-01,\n",
+                mode="upsert",
+            )
+        self.assertEqual(response.status_code, 201)
+        incremental = snapshot()
+        self.assertEqual(incremental[1]["F"], (2, 1, 30.0))
+        self.assertEqual(incremental[1][None], (1, 0, None))
+        aggregates.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+    def test_endpoints_match_raw_aggregates(self):
+        Patient.objects.filter(id="p1").update(bmi=31.0, bp_category="severe")
+        Patient.objects.filter(id="p2").update(bmi=22.0, bp_category="normal")
+        aggregates.refresh_patient_stats()
+
+        response = self.client.get("/api/insights/avg-bmi-by-location/")
+        expected = Patient.objects.values("gender").annotate(avg=Avg("bmi"))
+        self.assertEqual(
+            {row["location"]: row["average_bmi"] for row in response.data},
+            {row["gender"]: row["avg"] for row in expected},
+        )
+
+        response = self.client.get("/api/insights/bp-distribution/")
+        self.assertEqual(
+            {row["bp_category"]: row["percentage"] for row in response.data},
+            {"severe": "33.33%", "normal": "33.33%"},
+        )
+
+    def test_api_edits_refresh_aggregates(self):
+        patient = Patient.objects.get(id="p3")
+        patient.gender = "M"
+        patient.save()
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 1, "M": 2})
+
+        condition = Condition.objects.get(patient_id="p3")
+        condition.description = "Prediabetes"
+        condition.save()
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 1, "M": 1})
+        self.assertEqual(self.prevalence("Prediabetes"), {"F": 1, "M": 1})
+
+        Patient.objects.get(id="p2").delete()
+        self.assertEqual(self.prevalence("Prediabetes"), {"M": 1})
+        self.assertEqual(GenderBMIStats.objects.get(gender="M").patients, 2)
+
+    def test_patient_edits_apply_deltas_without_rebuilding(self):
+        def snapshot():
+            return (
+                set(
+                    ConditionPrevalence.objects.values_list(
+                        "description", "gender", "count"
+                    )
+                ),
+                {
+                    row.gender: (row.patients, row.bmi_count, row.average_bmi)
+                    for row in GenderBMIStats.objects.all()
+                },
+                dict(BPCategoryCount.objects.values_list("bp_category", "count")),
+            )
+
+        with mock.patch.object(
+            aggregates, "refresh_patient_stats", side_effect=AssertionError
+        ), mock.patch.object(
+            aggregates, "refresh_condition_prevalence", side_effect=AssertionError
+        ):
+            patient = Patient.objects.get(id="p1")
+            patient.bmi, patient.bp_category = 30.0, "severe"
+            patient.save()
+            patient.gender = "F"
+            patient.bmi = 50.0  # Not saved
+            patient.save(update_fields=["gender"])
+            Patient.objects.create(id="p4", gender="M", bmi=20.0, bp_category="normal")
+        self.assertEqual(self.prevalence("Hypertension"), {"F": 3})
+
+        incremental = snapshot()
+        self.assertEqual(incremental[1]["F"], (3, 1, 30.0))
+        self.assertEqual(incremental[1]["M"], (1, 1, 20.0))
+        aggregates.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+        Patient.objects.get(id="p4").delete()
+        incremental = snapshot()
+        self.assertNotIn("M", incremental[1])
+        self.assertNotIn("normal", incremental[2])
+        aggregates.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+    def test_rebuild_matches_incremental_state(self):
+        incremental = set(
+            ConditionPrevalence.objects.values_list("description", "gender", "count")
+        )
+        aggregates.rebuild()
+        self.assertEqual(
+            set(
+                ConditionPrevalence.objects.values_list(
+                    "description", "gender", "count"
+                )
+            ),
+            incremental,
+        )
+        self.assertEqual(
+            sum(BPCategoryCount.objects.values_list("count", flat=True)),
+            Patient.objects.count(),
+        )
+
+    def test_increments_keep_one_row_per_group(self):
+        for batch in range(2):
+            upload(
+                self.client,
+                "patients",
+                "Id,BIRTHDATE,GENDER\n"
+                + "".join(f"x{i}-{batch},1990-01-01,\n" for i in range(2)),
+            )
+        self.assertEqual(GenderBMIStats.objects.get(gender__isnull=True).patients, 4)
+        self.assertEqual(BPCategoryCount.objects.get(bp_category__isnull=True).count, 7)
+
+        aggregates.add_condition_counts(
+            pd.DataFrame({"patient_id": ["x0-0", "x1-0"], "description": [None, None]})
+        )
+        aggregates.add_condition_counts(
+            pd.DataFrame({"patient_id": ["x0-1"], "description": [None]})
+        )
+        self.assertEqual(
+            list(
+                ConditionPrevalence.objects.filter(
+                    description__isnull=True
+                ).values_list("gender", "count")
+            ),
+            [(None, 3)],
+        )
+
+    def test_derived_vitals_update_patient_aggregates(self):
+        upload(
+            self.client,
+            "observations",
+            "DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n"
+            "2020-01-01T10:00:00Z,p1,Body Mass Index,30.0,kg/m2\n"
+            "2020-01-01T10:00:00Z,p1,Systolic Blood Pressure,150,mm[Hg]\n"
+            "2020-01-01T10:00:00Z,p2,Body Mass Index,22.0,kg/m2\n",
+        )
+        upload(
+            self.client,
+            "observations",
+            "DATE,PATIENT,DESCRIPTION,VALUE,UNITS\n"
+            "2021-01-01T10:00:00Z,p1,Systolic Blood Pressure,110,mm[Hg]\n"
+            "2021-01-01T10:00:00Z,p2,Body Mass Index,24.0,kg/m2\n",
+        )
+
+        def snapshot():
+            return (
+                {
+                    row.gender: (row.patients, row.bmi_count, row.average_bmi)
+                    for row in GenderBMIStats.objects.all()
+                },
+                dict(BPCategoryCount.objects.values_list("bp_category", "count")),
+            )
+
+        incremental = snapshot()
+        self.assertEqual(incremental[0]["F"], (2, 1, 24.0))
+        self.assertEqual(incremental[1], {None: 2, "normal": 1})
+        aggregates.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+    def test_endpoints_read_one_aggregate_query(self):
+        for url, params in (
+            ("/api/insights/condition-prevalence/", {"condition_name": "Hypertension"}),
+            ("/api/insights/avg-bmi-by-location/", {}),
+            ("/api/insights/bp-distribution/", {}),
+        ):
+            # Dataset version plus the aggregate table, then the version only
+            with self.assertNumQueries(2):
+                first = self.client.get(url, params)
+            with self.assertNumQueries(1):
+                second = self.client.get(url, params)
+            self.assertEqual(first.data, second.data)
+
+
+class InsightCacheTests(TestCase):
+    url = "/api/insights/condition-prevalence/"
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "conditions", CONDITIONS_CSV)
+
+    def get(self, **headers):
+        return self.client.get(self.url, {"condition_name": "Hypertension"}, **headers)
+
+    def test_responses_carry_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_conditional_requests_get_304(self):
+        response = self.get()
+        with self.assertNumQueries(1):
+            revalidated = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+        self.assertEqual(revalidated["ETag"], response["ETag"])
+
+        # Only the ETag identifies the version; dates are never trusted
+        revalidated = self.get(HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(revalidated.status_code, 200)
+
+    def test_upload_invalidates(self):
+        response = self.get()
+        version = get_dataset_version()[0]
+        upload(
+            self.client,
+            "conditions",
+            "START,PATIENT,DESCRIPTION\n2020-01-01,p1,Hypertension\n",
+        )
+        self.assertGreater(get_dataset_version()[0], version)
+
+        revalidated = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertNotEqual(revalidated["ETag"], response["ETag"])
+        self.assertEqual(
+            {row["location"]: row["prevalence_count"] for row in revalidated.data},
+            {"F": 2, "M": 2},
+        )
+
+    def test_model_saves_invalidate(self):
+        etag = self.get()["ETag"]
+        Condition.objects.filter(patient_id="p1").first().delete()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row["location"]: row["prevalence_count"] for row in response.data},
+            {"F": 2},
+        )
+
+    def test_query_params_are_part_of_the_key(self):
+        hypertension = self.get()
+        prediabetes = self.client.get(self.url, {"condition_name": "Prediabetes"})
+        self.assertNotEqual(hypertension["ETag"], prediabetes["ETag"])
+        self.assertEqual([row["prevalence_count"] for row in prediabetes.data], [1])
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        bump_dataset_version()
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(len(get_cache()._cache), 0)
+
+
+class ObservationTrendTests(TestCase):
+    url = "/api/insights/trends/"
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "observations", TRENDS_CSV)
+
+    def get(self, url=None, **params):
+        response = self.client.get(
+            url or self.url, {"description": "Body Mass Index", **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_weekly_cohort_statistics(self):
+        data = self.get(interval="week")
+        self.assertFalse(data["downsampled"])
+        self.assertEqual(
+            data["points"],
+            [
+                {
+                    "period": "2020-01-06",
+                    "count": 3,
+                    "mean": 25.0,
+                    "min": 20.0,
+                    "max": 30.0,
+                    "p25": 22.5,
+                    "p50": 25.0,
+                    "p75": 27.5,
+                },
+                {
+                    "period": "2020-01-13",
+                    "count": 2,
+                    "mean": 26.0,
+                    "min": 21.0,
+                    "max": 31.0,
+                    "p25": 23.5,
+                    "p50": 26.0,
+                    "p75": 28.5,
+                },
+                {
+                    "period": "2020-02-03",
+                    "count": 1,
+                    "mean": 29.0,
+                    "min": 29.0,
+                    "max": 29.0,
+                    "p25": 29.0,
+                    "p50": 29.0,
+                    "p75": 29.0,
+                },
+            ],
+        )
+
+    def test_monthly_buckets_and_date_range(self):
+        points = self.get(interval="month", percentiles="50")["points"]
+        self.assertEqual(
+            [(p["period"], p["count"], p["mean"]) for p in points],
+            [("2020-01-01", 5, 25.4), ("2020-02-01", 1, 29.0)],
+        )
+        self.assertNotIn("p25", points[0])
+
+        points = self.get(interval="day", start="2020-01-07", end="2020-01-14")
+        self.assertEqual(
+            [p["period"] for p in points["points"]],
+            ["2020-01-07", "2020-01-08", "2020-01-14"],
+        )
+
+    def test_patient_series(self):
+        url = "/api/insights/trends/patients/p1/"
+        data = self.get(url)
+        self.assertIsNone(data["interval"])
+        self.assertEqual(
+            data["points"],
+            [
+                {"date": "2020-01-06", "value": 30.0},
+                {"date": "2020-01-14", "value": 31.0},
+                {"date": "2020-02-03", "value": 29.0},
+            ],
+        )
+        self.assertEqual(
+            self.get(url, interval="month")["points"],
+            [
+                {"period": "2020-01-01", "count": 2, "mean": 30.5},
+                {"period": "2020-02-01", "count": 1, "mean": 29.0},
+            ],
+        )
+
+    def test_long_series_are_downsampled(self):
+        start = datetime.date(2021, 1, 1)
+        Observation.objects.bulk_create(
+            Observation(
+                patient_id="p2",
+                description="Heart rate",
+                value=150.0 if day == 123 else 60.0 + day % 7,
+                date=start + datetime.timedelta(days=day),
+            )
+            for day in range(365)
+        )
+        url = "/api/insights/trends/patients/p2/"
+        data = self.get(url, description="Heart rate", max_points=20)
+        dates = [point["date"] for point in data["points"]]
+        self.assertTrue(data["downsampled"])
+        self.assertEqual(len(dates), 20)
+        self.assertEqual(dates[0], "2021-01-01")
+        self.assertEqual(dates[-1], "2021-12-31")
+        self.assertIn(str(start + datetime.timedelta(days=123)), dates)
+        self.assertEqual(dates, sorted(dates))
+
+        data = self.get(description="Heart rate", interval="day", max_points=20)
+        self.assertTrue(data["downsampled"])
+        self.assertEqual(len(data["points"]), 20)
+
+    def test_lttb_keeps_extremes(self):
+        y = [0.0] * 50 + [10.0] + [0.0] * 49
+        kept = trends.lttb(range(100), y, 10)
+        self.assertEqual(len(kept), 10)
+        self.assertEqual((kept[0], kept[-1]), (0, 99))
+        self.assertIn(50, kept)
+        self.assertEqual(list(trends.lttb(range(5), range(5), 10)), list(range(5)))
+
+    def test_invalid_parameters(self):
+        for params in (
+            {},
+            {"description": "Body Mass Index", "interval": "year"},
+            {"description": "Body Mass Index", "percentiles": "50,101"},
+            {"description": "Body Mass Index", "max_points": "2"},
+            {"description": "Body Mass Index", "start": "2020-02-30"},
+            {"description": "Body Mass Index", "start": "2021-01-01", "end": "2020"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.data)
+
+        response = self.client.get(
+            "/api/insights/trends/patients/nobody/", {"description": "Heart rate"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class SnapshotBackendTests(TestCase):
+    endpoints = [
+        ("/api/insights/condition-prevalence/", {"condition_name": "Hypertension"}),
+        ("/api/insights/avg-bmi-by-location/", {}),
+        ("/api/insights/bp-distribution/", {}),
+    ]
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        overrides = override_settings(HEALIX_SNAPSHOT_DIR=snapshot_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "conditions", CONDITIONS_CSV)
+        Patient.objects.filter(id="p1").update(bmi=31.0, bp_category="hypertensive")
+        Patient.objects.filter(id="p2").update(bmi=22.0, bp_category="normal")
+        aggregates.rebuild()
+        bump_dataset_version()
+
+    def get(self, url, params, backend):
+        response = self.client.get(url, {**params, "backend": backend})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_snapshot_matches_orm(self):
+        build_snapshot()
+        for url, params in self.endpoints:
+            with self.subTest(url):
+                orm = self.get(url, params, "orm")
+                with self.assertNumQueries(2):  # Dataset version, twice
+                    snapshot = self.get(url, params, "snapshot")
+                self.assertCountEqual(snapshot, orm)
+
+    def test_stale_snapshot_falls_back_to_orm(self):
+        build_snapshot()
+        Condition.objects.create(patient_id="p1", description="Prediabetes")
+        url = "/api/insights/condition-prevalence/"
+        data = self.get(url, {"condition_name": "Prediabetes"}, "snapshot")
+        self.assertEqual(
+            {row["location"]: row["prevalence_count"] for row in data},
+            {"F": 1, "M": 1},
+        )
+
+    def test_backend_setting_and_validation(self):
+        url, params = self.endpoints[1]
+        with override_settings(HEALIX_INSIGHTS_BACKEND="snapshot"):
+            # No snapshot built yet
+            self.assertEqual(self.get(url, params, ""), self.get(url, params, "orm"))
+        response = self.client.get(url, {"backend": "duckdb"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+
+class ConditionCooccurrenceTests(TestCase):
+    url = "/api/insights/condition-cooccurrence/"
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "conditions", CONDITIONS_CSV)
+        upload(
+            self.client,
+            "conditions",
+            "START,PATIENT,DESCRIPTION\n"
+            "2016-01-01,p1,Hyperlipidemia\n"
+            "2020-01-01,p1,Hypertension\n"
+            "2019-01-01,p2,Hyperlipidemia\n"
+            "2019-02-01,p3,Prediabetes\n",
+        )
+
+    def stored(self):
+        return set(
+            ConditionCooccurrence.objects.values_list(
+                "description_a", "description_b", "patients"
+            )
+        )
+
+    def brute_force(self):
+        conditions = {}
+        for patient_id, description in Condition.objects.values_list(
+            "patient_id", "description"
+        ):
+            conditions.setdefault(patient_id, set()).add(description)
+        counts = {}
+        for descriptions in conditions.values():
+            for a in descriptions:
+                for b in descriptions:
+                    if a <= b:
+                        counts[a, b] = counts.get((a, b), 0) + 1
+        return {(a, b, n) for (a, b), n in counts.items()}
+
+    def test_incremental_uploads_match_brute_force_and_rebuild(self):
+        self.assertEqual(self.stored(), self.brute_force())
+        self.assertIn(("Hyperlipidemia", "Hypertension", 2), self.stored())
+        self.assertIn(("Hypertension", "Hypertension", 3), self.stored())
+        incremental = self.stored()
+        cooccurrence.rebuild()
+        self.assertEqual(self.stored(), incremental)
+
+    def test_single_row_changes(self):
+        condition = Condition.objects.get(patient_id="p2", description="Prediabetes")
+        condition.description = "Hyperlipidemia"  # p2 already has it
+        condition.save()
+        self.assertEqual(self.stored(), self.brute_force())
+        Condition.objects.create(patient_id="p3", description="Asthma")
+        self.assertEqual(self.stored(), self.brute_force())
+        Condition.objects.filter(
+            patient_id="p1", description="Hypertension"
+        ).first().delete()
+        # p1 still has a second Hypertension row
+        self.assertEqual(self.stored(), self.brute_force())
+        Patient.objects.get(id="p2").delete()
+        self.assertEqual(self.stored(), self.brute_force())
+        self.assertFalse(ConditionCooccurrence.objects.filter(patients__lte=0).exists())
+
+    def test_metrics(self):
+        response = self.client.get(
+            self.url, {"condition_name": "Hypertension", "metric": "patients"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_patients"], 3)
+        first = response.data["results"][0]
+        self.assertEqual(
+            (first["condition"], first["other"], first["patients"]),
+            ("Hypertension", "Hyperlipidemia", 2),
+        )
+        # 2 of 3 patients have both; 3 have Hypertension, 2 Hyperlipidemia
+        self.assertAlmostEqual(first["lift"], 2 * 3 / (3 * 2))
+        self.assertAlmostEqual(first["jaccard"], 2 / (3 + 2 - 2))
+        self.assertEqual(
+            [row["other"] for row in response.data["results"]],
+            ["Hyperlipidemia", "Prediabetes"],
+        )
+
+        response = self.client.get(self.url, {"min_patients": 2, "limit": 1})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["patients"], 2)
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"metric": "support"},
+            {"limit": "many"},
+            {"limit": 0},
+            {"limit": 1001},
+            {"min_patients": 0},
+        ):
+            with self.subTest(params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.data)
+
+
+class CohortPrevalenceTests(TestCase):
+    url = "/api/insights/prevalence/"
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        upload(self.client, "patients", PATIENTS_CSV)
+        upload(self.client, "conditions", CONDITIONS_CSV)
+        Patient.objects.filter(id="p1").update(age=46, bmi=31.0, sys_bp=145, dia_bp=92)
+        Patient.objects.filter(id="p2").update(age=33, bmi=22.0, sys_bp=118, dia_bp=76)
+        Patient.objects.filter(id="p3").update(age=51, sys_bp=132, dia_bp=85)
+        bump_dataset_version()
+
+    def get(self, **params):
+        response = self.client.get(
+            self.url, {"conditions": "Hypertension,Prediabetes", **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts_and_rates_by_gender(self):
+        data = self.get(group_by="gender")
+        groups = {group["gender"]: group for group in data["groups"]}
+        self.assertEqual(set(groups), {"F", "M"})
+        self.assertEqual(groups["F"]["patients"], 2)
+        self.assertEqual(
+            groups["F"]["conditions"],
+            [
+                {"condition": "Hypertension", "count": 2, "rate_per_1000": 1000.0},
+                {"condition": "Prediabetes", "count": 1, "rate_per_1000": 500.0},
+            ],
+        )
+        self.assertEqual(groups["M"]["conditions"][1]["count"], 0)
+        bmi = groups["F"]["measures"]["bmi"]
+        self.assertEqual((bmi["count"], bmi["mean"]), (1, 22.0))
+        self.assertEqual(bmi["percentiles"]["p50"], 22.0)
+        self.assertEqual(
+            {row["bin"]: row["count"] for row in bmi["histogram"]}["18.5-25"], 1
+        )
+
+    def test_several_dimensions_and_filters(self):
+        data = self.get(group_by="age_band,birth_decade", gender="F")
+        self.assertEqual(
+            [
+                (group["age_band"], group["birth_decade"], group["patients"])
+                for group in data["groups"]
+            ],
+            [("30-39", 1990, 1), ("50-59", 1970, 1)],
+        )
+        data = self.get(bp_category="crisis")
+        self.assertEqual(data["groups"][0]["patients"], 0)
+        self.assertIsNone(data["groups"][0]["conditions"][0]["rate_per_1000"])
+
+    def test_whole_cohort_distributions(self):
+        data = self.get(percentiles="50")
+        (group,) = data["groups"]
+        self.assertEqual(group["patients"], 3)
+        sys_bp = group["measures"]["sys_bp"]
+        self.assertEqual(sys_bp["percentiles"], {"p50": 132.0})
+        self.assertEqual(
+            {row["bin"]: row["count"] for row in sys_bp["histogram"] if row["count"]},
+            {"90-120": 1, "130-140": 1, "140-160": 1},
+        )
+
+    def test_one_query_per_request(self):
+        with self.assertNumQueries(2):  # Dataset version, then the cohort
+            self.get(group_by="gender,age_band")
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"conditions": ""},
+            {"group_by": "location"},
+            {"age_band": "20-29"},
+            {"birth_decade": "1985"},
+            {"percentiles": "101"},
+        ):
+            with self.subTest(params):
+                response = self.client.get(
+                    self.url, {"conditions": "Hypertension", **params}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.data)
+        with override_settings(HEALIX_PREVALENCE_MAX_CONDITIONS=1):
+            response = self.client.get(self.url, {"conditions": "A,B"})
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,252 @@
+"""
+Observation trends for the insights time-series endpoints.
+
+``cohort_trend`` buckets every observation of one description by day, week or
+month in SQL (``date_trunc`` on PostgreSQL) and summarises each bucket with its
+count, mean, range and percentiles. PostgreSQL computes the percentiles with
+``percentile_cont`` in the same query; other backends return the bucketed
+values and pandas computes the same (linearly interpolated) quantiles.
+``patient_series`` returns one patient's values, raw or bucketed the same way.
+
+Both stay under a point budget however long the history is: series longer
+than ``max_points`` are downsampled with Largest-Triangle-Three-Buckets, which
+keeps the first and last points and the points that best preserve the shape of
+the curve, rather than averaging peaks away.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils.dateparse import parse_date
+
+from datasets.models import Observation
+from healix_backend.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+INTERVALS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+DEFAULT_PERCENTILES = (25, 50, 75)
+DEFAULT_MAX_POINTS = 1000
+# LTTB always keeps the first and last points, plus one per bucket between
+MIN_POINTS = 3
+
+
+class TrendError(ValueError):
+    """Raised for missing or invalid trend parameters."""
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL's ``percentile_cont(fraction) WITHIN GROUP (ORDER BY ...)``."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def get_max_points():
+    return getattr(settings, "HEALIX_TRENDS_MAX_POINTS", DEFAULT_MAX_POINTS)
+
+
+def _parse_date(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:  # Well-formed but invalid, e.g. 2020-02-30
+        parsed = None
+    if parsed is None:
+        raise TrendError(f"'{name}' must be a date (YYYY-MM-DD).")
+    return parsed
+
+
+def parse_percentiles(params, error_cls):
+    """
+    The sorted, distinct ``percentiles`` of query ``params`` (comma-separated
+    integers from 0 to 100), ``DEFAULT_PERCENTILES`` when absent. Raises
+    ``error_cls`` for invalid values.
+    """
+    if not params.get("percentiles"):
+        return DEFAULT_PERCENTILES
+    try:
+        percentiles = sorted(
+            {int(p) for p in params["percentiles"].split(",") if p.strip()}
+        )
+    except ValueError:
+        percentiles = None
+    if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+        raise error_cls("'percentiles' must be comma-separated integers from 0 to 100.")
+    return percentiles
+
+
+def parse_trend_params(params, default_interval="week"):
+    """
+    Trend options from query ``params``: ``description`` (required),
+    ``interval``, ``start``/``end`` dates, ``percentiles`` and ``max_points``.
+    """
+    description = params.get("description")
+    if not description:
+        raise TrendError("Observation description is required.")
+
+    interval = params.get("interval") or default_interval
+    if interval is not None and interval not in INTERVALS:
+        raise TrendError(
+            f"Unknown interval '{interval}'. Available: {', '.join(INTERVALS)}."
+        )
+
+    start, end = _parse_date(params, "start"), _parse_date(params, "end")
+    if start and end and start > end:
+        raise TrendError("'start' must not be after 'end'.")
+
+    percentiles = parse_percentiles(params, TrendError)
+
+    max_points = get_max_points()
+    if params.get("max_points"):
+        try:
+            requested = int(params["max_points"])
+        except ValueError:
+            requested = 0
+        if requested < MIN_POINTS:
+            raise TrendError(
+                f"'max_points' must be an integer of at least {MIN_POINTS}."
+            )
+        max_points = min(requested, max_points)
+
+    return {
+        "description": description,
+        "interval": interval,
+        "start": start,
+        "end": end,
+        "percentiles": percentiles,
+        "max_points": max_points,
+    }
+
+
+def _observations(description, start, end, **filters):
+    observations = Observation.objects.filter(
+        description=description, value__isnull=False, date__isnull=False, **filters
+    )
+    if start:
+        observations = observations.filter(date__gte=start)
+    if end:
+        observations = observations.filter(date__lte=end)
+    return observations
+
+
+def _bucketed(observations, interval):
+    return observations.annotate(period=INTERVALS[interval]("date")).values("period")
+
+
+def cohort_trend(description, interval, start=None, end=None, percentiles=()):
+    """
+    Frame with one row per ``interval`` bucket of ``description`` values:
+    ``period``, ``count``, ``mean``, ``min``, ``max`` and ``p<N>`` per percentile.
+    """
+    observations = _observations(description, start, end)
+    columns = ["period", "count", "mean", "min", "max"]
+    columns += [f"p{p}" for p in percentiles]
+
+    if connection.vendor == "postgresql":
+        rows = (
+            _bucketed(observations, interval)
+            .annotate(
+                count=Count("value"),
+                mean=Avg("value"),
+                min=Min("value"),
+                max=Max("value"),
+                **{f"p{p}": PercentileCont("value", p / 100) for p in percentiles},
+            )
+            .order_by("period")
+            .values_list(*columns)
+        )
+        return pd.DataFrame.from_records(list(rows), columns=columns)
+
+    values = pd.DataFrame.from_records(
+        list(_bucketed(observations, interval).values_list("period", "value")),
+        columns=["period", "value"],
+    )
+    grouped = values.groupby("period", sort=True)["value"]
+    trend = grouped.agg(["count", "mean", "min", "max"])
+    if len(values):
+        quantiles = grouped.quantile([p / 100 for p in percentiles]).unstack()
+        quantiles.columns = [f"p{p}" for p in percentiles]
+        trend = trend.join(quantiles)
+    return trend.reset_index().reindex(columns=columns)
+
+
+def patient_series(patient_id, description, interval=None, start=None, end=None):
+    """
+    One patient's ``description`` values by ``date``, or per ``interval``
+    bucket as ``period``, ``count`` and ``mean`` when an interval is given.
+    """
+    observations = _observations(description, start, end, patient_id=patient_id)
+    if interval is None:
+        columns = ["date", "value"]
+        rows = observations.order_by("date", "id").values_list(*columns)
+    else:
+        columns = ["period", "count", "mean"]
+        rows = (
+            _bucketed(observations, interval)
+            .annotate(count=Count("value"), mean=Avg("value"))
+            .order_by("period")
+            .values_list(*columns)
+        )
+    return pd.DataFrame.from_records(list(rows), columns=columns)
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps when reducing
+    the series ``(x, y)``, sorted by ``x``, to ``threshold`` points.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the interior points; every bucket holds at
+    # least one point because n > threshold
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_lo, next_hi = hi, edges[bucket + 2]
+            next_x, next_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangle formed with the previous selection
+        # and the next bucket's average, for every candidate at once
+        areas = np.abs(
+            (x[selected] - next_x) * (y[lo:hi] - y[selected])
+            - (x[selected] - x[lo:hi]) * (next_y - y[selected])
+        )
+        selected = lo + int(areas.argmax())
+        kept[bucket + 1] = selected
+    return kept
+
+
+def downsample(frame, x_column, y_column, max_points):
+    """
+    ``(frame, downsampled)``: ``frame`` reduced to at most ``max_points`` rows
+    with LTTB over ``y_column`` against the dates in ``x_column``.
+    """
+    if len(frame) <= max_points:
+        return frame, False
+    days = pd.to_datetime(frame[x_column]).to_numpy("datetime64[D]").astype("int64")
+    kept = lttb(days, frame[y_column].to_numpy(), max_points)
+    return frame.iloc[kept].reset_index(drop=True), True
+
+
+def to_points(frame):
+    """JSON-ready dicts of ``frame`` rows, with NaN as ``None``."""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
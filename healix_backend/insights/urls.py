@@ -3,6 +3,10 @@ from .views import (
     ConditionPrevalenceByLocation,
     AvgBMIByLocation,
     BloodPressureDistribution,
+    ObservationTrend,
+    PatientObservationTrend,
+    ConditionCooccurrenceView,
+    CohortPrevalence,
 )
 
 urlpatterns = [
@@ -17,4 +21,16 @@ urlpatterns = [
     path(
         "bp-distribution/", BloodPressureDistribution.as_view(), name="bp-distribution"
     ),
+    path("trends/", ObservationTrend.as_view(), name="observation-trend"),
+    path(
+        "trends/patients/<str:patient_id>/",
+        PatientObservationTrend.as_view(),
+        name="patient-observation-trend",
+    ),
+    path(
+        "condition-cooccurrence/",
+        ConditionCooccurrenceView.as_view(),
+        name="condition-cooccurrence",
+    ),
+    path("prevalence/", CohortPrevalence.as_view(), name="cohort-prevalence"),
 ]
@@ -1,11 +1,15 @@
 from django.shortcuts import render
 
 # Create your views here.
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from datasets.models import Patient, Condition, Observation
-from django.db.models import Count, Avg
-import pandas as pd
+
+from datasets.models import Patient
+
+from . import analytics, cooccurrence, prevalence, trends
+from .caching import versioned_cache
+from .models import BPCategoryCount, ConditionPrevalence, GenderBMIStats
 
 
 class ConditionPrevalenceByLocation(APIView):
@@ -13,26 +17,32 @@ class ConditionPrevalenceByLocation(APIView):
     API endpoint to get condition prevalence by location (using patient's gender as location for example).
     """
 
+    @versioned_cache
     def get(self, request):
         condition_name = request.query_params.get("condition_name", None)
         if not condition_name:
             return Response({"error": "Condition name is required."}, status=400)
+        try:
+            snapshot = analytics.get_snapshot(request.query_params)
+        except analytics.AnalyticsError as e:
+            return Response({"error": str(e)}, status=400)
 
-        # Aggregate conditions by patient gender (using gender as a proxy for location)
-        prevalence_data = (
-            Condition.objects.filter(description=condition_name)
-            .values("patient__gender")
-            .annotate(count=Count("patient"))
-            .order_by("-count")
-        )
+        # Condition counts by patient gender (using gender as a proxy for
+        # location), precomputed by insights.aggregates
+        if snapshot is not None:
+            prevalence_data = analytics.condition_prevalence(snapshot, condition_name)
+        else:
+            prevalence_data = (
+                ConditionPrevalence.objects.filter(description=condition_name)
+                .values("gender", "count")
+                .order_by("-count")
+            )
 
         results = []
         for item in prevalence_data:
             results.append(
                 {
-                    "location": item[
-                        "patient__gender"
-                    ],  # Using gender as location proxy
+                    "location": item["gender"],  # Using gender as location proxy
                     "prevalence_count": item["count"],
                 }
             )
@@ -45,20 +55,28 @@ class AvgBMIByLocation(APIView):
     API endpoint to get average BMI by location (using patient's gender as location for example).
     """
 
+    @versioned_cache
     def get(self, request):
-        # Aggregate average BMI by patient gender (using gender as a proxy for location)
-        avg_bmi_data = (
-            Patient.objects.values("gender")
-            .annotate(avg_bmi=Avg("bmi"))
-            .order_by("gender")
-        )
+        try:
+            snapshot = analytics.get_snapshot(request.query_params)
+        except analytics.AnalyticsError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Average BMI by patient gender (using gender as a proxy for location)
+        if snapshot is not None:
+            avg_bmi_data = analytics.average_bmi(snapshot)
+        else:
+            avg_bmi_data = [
+                {"gender": stats.gender, "average_bmi": stats.average_bmi}
+                for stats in GenderBMIStats.objects.order_by("gender")
+            ]
 
         results = []
         for item in avg_bmi_data:
             results.append(
                 {
                     "location": item["gender"],  # Using gender as location proxy
-                    "average_bmi": item["avg_bmi"],
+                    "average_bmi": item["average_bmi"],
                 }
             )
         return Response(results)
@@ -69,14 +87,24 @@ class BloodPressureDistribution(APIView):
     API endpoint to get blood pressure distribution.
     """
 
+    @versioned_cache
     def get(self, request):
+        try:
+            snapshot = analytics.get_snapshot(request.query_params)
+        except analytics.AnalyticsError as e:
+            return Response({"error": str(e)}, status=400)
+
         bp_categories = ["normal", "hypertensive", "severe", "crisis"]
-        distribution_data = Patient.objects.values("bp_category").annotate(
-            count=Count("id")
-        )
+        if snapshot is not None:
+            distribution_data = analytics.bp_category_counts(snapshot)
+        else:
+            distribution_data = list(
+                BPCategoryCount.objects.values("bp_category", "count")
+            )
 
         results = []
-        total_patients = Patient.objects.count()
+        # Counts cover every patient, including uncategorized ones
+        total_patients = sum(item["count"] for item in distribution_data)
         for item in distribution_data:
             category = item["bp_category"]
             if category in bp_categories:  # Ensure only valid categories are included
@@ -91,3 +119,166 @@ class BloodPressureDistribution(APIView):
                     }
                 )
         return Response(results)
+
+
+class ObservationTrend(APIView):
+    """
+    API endpoint to get the cohort trend of one observation over time: count,
+    mean, range and percentiles per day, week or month.
+    """
+
+    @versioned_cache
+    def get(self, request):
+        try:
+            params = trends.parse_trend_params(request.query_params)
+        except trends.TrendError as e:
+            return Response({"error": str(e)}, status=400)
+
+        trend = trends.cohort_trend(
+            params["description"],
+            params["interval"],
+            start=params["start"],
+            end=params["end"],
+            percentiles=params["percentiles"],
+        )
+        # Keep the buckets that best preserve the shape of the mean curve
+        trend, downsampled = trends.downsample(
+            trend, "period", "mean", params["max_points"]
+        )
+        return Response(
+            {
+                "description": params["description"],
+                "interval": params["interval"],
+                "downsampled": downsampled,
+                "points": trends.to_points(trend),
+            }
+        )
+
+
+class PatientObservationTrend(APIView):
+    """
+    API endpoint to get one patient's series of an observation, raw or
+    averaged per day, week or month.
+    """
+
+    @versioned_cache
+    def get(self, request, patient_id):
+        try:
+            params = trends.parse_trend_params(
+                request.query_params, default_interval=None
+            )
+        except trends.TrendError as e:
+            return Response({"error": str(e)}, status=400)
+        if not Patient.objects.filter(pk=patient_id).exists():
+            return Response({"error": "Patient not found."}, status=404)
+
+        series = trends.patient_series(
+            patient_id,
+            params["description"],
+            interval=params["interval"],
+            start=params["start"],
+            end=params["end"],
+        )
+        if params["interval"] is None:
+            series, downsampled = trends.downsample(
+                series, "date", "value", params["max_points"]
+            )
+        else:
+            series, downsampled = trends.downsample(
+                series, "period", "mean", params["max_points"]
+            )
+        return Response(
+            {
+                "patient": patient_id,
+                "description": params["description"],
+                "interval": params["interval"],
+                "downsampled": downsampled,
+                "points": trends.to_points(series),
+            }
+        )
+
+
+class ConditionCooccurrenceView(APIView):
+    """
+    API endpoint to get the condition pairs patients most often have together,
+    ranked by lift, Jaccard similarity or patient count; only pairs including
+    ``condition_name`` if given.
+    """
+
+    @versioned_cache
+    def get(self, request):
+        condition_name = request.query_params.get("condition_name") or None
+        metric = request.query_params.get("metric", "lift")
+        if metric not in cooccurrence.METRICS:
+            return Response(
+                {
+                    "error": f"Unknown metric '{metric}'. "
+                    f"Available: {', '.join(cooccurrence.METRICS)}."
+                },
+                status=400,
+            )
+        max_limit = getattr(settings, "HEALIX_COOCCURRENCE_MAX_LIMIT", 1000)
+        try:
+            limit = int(request.query_params.get("limit", 20))
+            min_patients = int(request.query_params.get("min_patients", 1))
+        except ValueError:
+            return Response(
+                {"error": "limit and min_patients must be integers."}, status=400
+            )
+        if not 1 <= limit <= max_limit:
+            return Response(
+                {"error": f"limit must be between 1 and {max_limit}."}, status=400
+            )
+        if min_patients < 1:
+            return Response({"error": "min_patients must be at least 1."}, status=400)
+
+        pairs, total = cooccurrence.pair_metrics(condition_name, min_patients)
+        pairs = pairs.sort_values(
+            [metric, "patients", "condition", "other"],
+            ascending=[False, False, True, True],
+        ).head(limit)
+        return Response(
+            {
+                "condition": condition_name,
+                "metric": metric,
+                "total_patients": total,
+                "results": pairs[
+                    ["condition", "other", "patients", "lift", "jaccard"]
+                ].to_dict("records"),
+            }
+        )
+
+
+class CohortPrevalence(APIView):
+    """
+    API endpoint to get the prevalence of several conditions per group of
+    patients (gender, age band, bp_category and/or birth decade), with rates
+    per 1,000 patients and BMI and blood pressure distributions per group.
+    """
+
+    @versioned_cache
+    def get(self, request):
+        try:
+            params = prevalence.parse_prevalence_params(request.query_params)
+        except prevalence.PrevalenceError as e:
+            return Response({"error": str(e)}, status=400)
+
+        frame = prevalence.cohort_prevalence(
+            params["conditions"],
+            group_by=params["group_by"],
+            filters=params["filters"],
+            percentiles=params["percentiles"],
+        )
+        return Response(
+            {
+                "conditions": params["conditions"],
+                "group_by": params["group_by"],
+                "filters": params["filters"],
+                "groups": prevalence.to_groups(
+                    frame,
+                    params["conditions"],
+                    params["group_by"],
+                    params["percentiles"],
+                ),
+            }
+        )
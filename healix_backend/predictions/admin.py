@@ -1,3 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import RiskScore, ScoringRun
+
+admin.site.register(RiskScore)
+admin.site.register(ScoringRun)
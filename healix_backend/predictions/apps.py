@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PredictionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'predictions'
+
+    def ready(self):
+        from . import scoring  # noqa: F401
+
+        # Optionally load the model at worker boot so the first request does
+        # not pay for it; off by default to keep manage.py commands light.
+        if getattr(settings, "HEALIX_PRELOAD_MODELS", False):
+            from .registry import registry
+
+            registry.get()
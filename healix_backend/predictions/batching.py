@@ -0,0 +1,179 @@
+"""
+Dynamic micro-batching of single-patient predictions.
+
+Concurrent ``predict-condition/`` requests each pay the Keras per-call
+overhead for a one-row forward pass. When ``HEALIX_MICROBATCH_ENABLED`` is set,
+requests are handed to a ``MicroBatcher`` instead: a background thread waits
+at most ``HEALIX_MICROBATCH_MAX_WAIT_MS`` after the first queued request (or
+until ``HEALIX_MICROBATCH_MAX_SIZE`` requests are queued), prepares features
+for the whole group in one vectorized pass, runs a single forward pass and
+resolves each caller's future with its own row.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from healix_backend.lazy import lazy_import
+
+from .features import prepare_features
+from .registry import registry
+
+pd = lazy_import("pandas")
+
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_SIZE = 64
+DEFAULT_TIMEOUT = 30.0
+
+
+class FeatureError(ValueError):
+    """Raised to a caller whose patient record could not be turned into features."""
+
+
+def histogram_bucket(value):
+    """Smallest power of two >= ``value``, used as the histogram bucket label."""
+    bucket = 1
+    while bucket < value:
+        bucket *= 2
+    return bucket
+
+
+class MicroBatcher:
+    """
+    Gathers patient records from many threads into one model call.
+
+    ``predict(patient_data)`` blocks until the record's batch has been scored
+    and returns ``(probabilities, artifacts)``. The worker thread starts on
+    first use and serves the process-wide ``registry``'s current model.
+    """
+
+    def __init__(self, max_wait_ms=None, max_size=None, model_registry=registry):
+        self.max_wait_ms = max_wait_ms
+        self.max_size = max_size
+        self.registry = model_registry
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def get_max_wait(self):
+        """Maximum wait in seconds after the first request of a batch."""
+        if self.max_wait_ms is not None:
+            return self.max_wait_ms / 1000
+        return (
+            getattr(settings, "HEALIX_MICROBATCH_MAX_WAIT_MS", DEFAULT_MAX_WAIT_MS)
+            / 1000
+        )
+
+    def get_max_size(self):
+        if self.max_size is not None:
+            return self.max_size
+        return getattr(settings, "HEALIX_MICROBATCH_MAX_SIZE", DEFAULT_MAX_SIZE)
+
+    def submit(self, patient_data):
+        """Queue one patient record and return a ``Future`` for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((patient_data, future))
+        return future
+
+    def predict(self, patient_data, timeout=DEFAULT_TIMEOUT):
+        return self.submit(patient_data).result(timeout=timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="healix-microbatcher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            max_size = self.get_max_size()
+            deadline = time.monotonic() + self.get_max_wait()
+            while len(batch) < max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._record(len(batch), self._queue.qsize())
+            self._process(batch)
+
+    def _process(self, batch):
+        """Score ``batch`` and resolve its futures; never raises."""
+        try:
+            artifacts = self.registry.get()
+            try:
+                features = prepare_features(
+                    pd.DataFrame([record for record, _ in batch]), artifacts.scaler
+                )
+            except Exception:
+                # One bad record must not fail its neighbours: retry them one
+                # by one and drop the ones that cannot be prepared.
+                if len(batch) > 1:
+                    for item in batch:
+                        self._process([item])
+                    return
+                raise FeatureError("Error preparing features for prediction.")
+            probabilities = artifacts.predict(features)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for row, (_, future) in zip(probabilities, batch):
+            future.set_result((row, artifacts))
+
+    def _record(self, batch_size, queue_depth):
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += batch_size
+            self._batch_sizes[histogram_bucket(batch_size)] += 1
+            self._queue_depths[histogram_bucket(queue_depth + 1)] += 1
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._batches = 0
+            self._requests = 0
+            self._batch_sizes = Counter()
+            self._queue_depths = Counter()
+
+    def stats(self):
+        """
+        Counters for the stats endpoint. Histograms map a power-of-two upper
+        bound to the number of batches; queue depth is sampled when a batch is
+        closed and counts the requests still waiting plus one.
+        """
+        with self._stats_lock:
+            return {
+                "max_wait_ms": self.get_max_wait() * 1000,
+                "max_batch_size": self.get_max_size(),
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": (
+                    self._requests / self._batches if self._batches else 0.0
+                ),
+                "batch_size_histogram": {
+                    str(bucket): count
+                    for bucket, count in sorted(self._batch_sizes.items())
+                },
+                "queue_depth_histogram": {
+                    str(bucket): count
+                    for bucket, count in sorted(self._queue_depths.items())
+                },
+            }
+
+
+batcher = MicroBatcher()
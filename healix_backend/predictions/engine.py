@@ -0,0 +1,125 @@
+"""
+Pure-NumPy inference for the condition prediction model.
+
+The model is a small stack of dense layers, so serving it needs nothing beyond
+a few matrix multiplications. ``export_model`` writes the weights of a trained
+Keras ``Sequential`` model to a compact ``.npz`` file (done once, with
+TensorFlow installed, by ``manage.py export_numpy_model``), and ``NumpyModel``
+loads that file and runs the forward pass without importing TensorFlow.
+"""
+
+from healix_backend.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def sigmoid(x):
+    # Split by sign so large negative inputs do not overflow np.exp
+    out = np.empty_like(x)
+    positive = x >= 0
+    out[positive] = 1 / (1 + np.exp(-x[positive]))
+    z = np.exp(x[~positive])
+    out[~positive] = z / (1 + z)
+    return out
+
+
+def softmax(x):
+    z = np.exp(x - x.max(axis=1, keepdims=True))
+    return z / z.sum(axis=1, keepdims=True)
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": relu,
+    "sigmoid": sigmoid,
+    "tanh": lambda x: np.tanh(x),
+    "softmax": softmax,
+}
+# Layers that are identities at inference time
+PASSTHROUGH_LAYERS = {"Dropout", "InputLayer"}
+
+
+class UnsupportedModel(ValueError):
+    """Raised when a Keras model contains layers the engine cannot run."""
+
+
+class NumpyModel:
+    """
+    Dense network as a list of ``(weights, bias, activation)`` layers.
+
+    ``predict_on_batch`` mirrors the Keras method so ``ModelArtifacts`` can
+    serve either engine.
+    """
+
+    def __init__(self, layers):
+        self.layers = [
+            (
+                np.ascontiguousarray(weights, dtype=np.float32),
+                np.asarray(bias, dtype=np.float32),
+                activation,
+            )
+            for weights, bias, activation in layers
+        ]
+        for _, _, activation in self.layers:
+            if activation not in ACTIVATIONS:
+                raise UnsupportedModel(f"Unsupported activation: {activation!r}.")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            activations = [str(name) for name in data["activations"]]
+            return cls(
+                [
+                    (data[f"weights_{i}"], data[f"bias_{i}"], activation)
+                    for i, activation in enumerate(activations)
+                ]
+            )
+
+    def save(self, path):
+        arrays = {"activations": np.array([layer[2] for layer in self.layers])}
+        for i, (weights, bias, _) in enumerate(self.layers):
+            arrays[f"weights_{i}"] = weights
+            arrays[f"bias_{i}"] = bias
+        np.savez_compressed(path, **arrays)
+
+    @property
+    def input_size(self):
+        return self.layers[0][0].shape[0]
+
+    def predict_on_batch(self, features):
+        """Return the output activations for a 2-D feature array as float32."""
+        x = np.asarray(features, dtype=np.float32)
+        for weights, bias, activation in self.layers:
+            x = ACTIVATIONS[activation](x @ weights + bias)
+        return x
+
+    predict = predict_on_batch
+
+
+def from_keras(model):
+    """Build a ``NumpyModel`` from a trained Keras model of Dense layers."""
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in PASSTHROUGH_LAYERS:
+            continue
+        if kind != "Dense":
+            raise UnsupportedModel(f"Unsupported layer type: {kind}.")
+        config = layer.get_config()
+        weights = layer.get_weights()
+        bias = weights[1] if config.get("use_bias", True) else None
+        if bias is None:
+            bias = np.zeros(weights[0].shape[1], dtype=np.float32)
+        layers.append((weights[0], bias, config["activation"]))
+    return NumpyModel(layers)
+
+
+def export_model(model, path):
+    """Write the weights of Keras ``model`` to the ``.npz`` file at ``path``."""
+    engine = from_keras(model)
+    engine.save(path)
+    return engine
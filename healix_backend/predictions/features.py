@@ -0,0 +1,50 @@
+"""
+Vectorized feature preparation for the condition prediction model.
+
+Builds the 11-column training feature matrix for any number of patients in one
+pass: numeric vitals scaled with the saved scaler, one-hot gender, and one-hot
+blood pressure category binned from systolic pressure.
+"""
+
+from datasets.vitals import BP_LABELS, bp_categories
+from healix_backend.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+REQUIRED_FIELDS = ["gender", "age", "bmi", "sys_bp", "dia_bp", "heart_rate"]
+NUMERICAL_COLUMNS = ["age", "bmi", "sys_bp", "dia_bp", "heart_rate"]
+GENDERS = ["FEMALE", "MALE"]
+# Column order the model was trained with (pd.get_dummies sorts categories)
+FEATURE_COLUMNS = NUMERICAL_COLUMNS + [
+    "gender_FEMALE",
+    "gender_MALE",
+    "bp_category_crisis",
+    "bp_category_hypertensive",
+    "bp_category_normal",
+    "bp_category_severe",
+]
+BP_FEATURE_ORDER = sorted(BP_LABELS)
+# Stored Synthea patients use single-letter genders
+GENDER_ALIASES = {"M": "MALE", "F": "FEMALE"}
+
+
+def prepare_features(frame, scaler):
+    """
+    Return a float32 array of shape ``(len(frame), 11)`` for a DataFrame with
+    the ``REQUIRED_FIELDS`` columns. Unknown genders and out-of-range blood
+    pressures leave their one-hot columns at zero, as in training.
+    """
+    numeric = frame[NUMERICAL_COLUMNS].astype("float64")
+    features = np.zeros((len(frame), len(FEATURE_COLUMNS)), dtype=np.float32)
+    features[:, : len(NUMERICAL_COLUMNS)] = scaler.transform(numeric)
+
+    offset = len(NUMERICAL_COLUMNS)
+    gender = frame["gender"].astype(str)
+    for i, value in enumerate(GENDERS):
+        features[:, offset + i] = gender.eq(value).to_numpy()
+
+    offset += len(GENDERS)
+    category = bp_categories(numeric["sys_bp"]).astype(str)
+    for i, label in enumerate(BP_FEATURE_ORDER):
+        features[:, offset + i] = category.eq(label).to_numpy()
+    return features
@@ -0,0 +1,88 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from predictions.registry import ModelRegistry
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the Keras and NumPy inference engines: cold start (import and "
+        "load in a fresh process), peak RSS, and per-batch latency."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000]
+        )
+        parser.add_argument("--rounds", type=int, default=200)
+        # Internal: run a single measurement in this process
+        parser.add_argument("--measure", choices=["keras", "numpy"])
+
+    def handle(self, *args, **options):
+        if options["measure"]:
+            return self.measure(options)
+
+        results = {engine: self.run_child(engine, options) for engine in ENGINES}
+        for engine, result in results.items():
+            self.stdout.write(
+                f"{engine:<6} cold start {result['cold_start']:7.2f} s  "
+                f"peak RSS {result['max_rss_mb']:7.1f} MB"
+            )
+        for size in options["batch_sizes"]:
+            self.stdout.write(
+                f"batch {size:>5}: "
+                + "  ".join(
+                    f"{engine} {results[engine]['latency_ms'][str(size)]:8.3f} ms"
+                    for engine in ENGINES
+                )
+            )
+
+    def run_child(self, engine, options):
+        command = [
+            sys.executable,
+            sys.argv[0],
+            "benchmark_inference_engine",
+            "--measure",
+            engine,
+            "--rounds",
+            str(options["rounds"]),
+            "--batch-sizes",
+            *map(str, options["batch_sizes"]),
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    def measure(self, options):
+        started = time.perf_counter()
+        with override_settings(HEALIX_MODEL_ENGINE=options["measure"]):
+            artifacts = ModelRegistry(check_interval=3600).get()
+        cold_start = time.perf_counter() - started
+
+        rng = np.random.default_rng(0)
+        latency = {}
+        for size in options["batch_sizes"]:
+            features = rng.normal(size=(size, 11)).astype(np.float32)
+            artifacts.predict(features)  # Warm up this batch shape
+            rounds = max(3, options["rounds"] // max(1, size // 100))
+            started = time.perf_counter()
+            for _ in range(rounds):
+                artifacts.predict(features)
+            latency[str(size)] = (time.perf_counter() - started) / rounds * 1000
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            json.dumps(
+                {"cold_start": cold_start, "max_rss_mb": max_rss, "latency_ms": latency}
+            )
+        )
+
+
+ENGINES = ("keras", "numpy")
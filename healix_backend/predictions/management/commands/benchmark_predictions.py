@@ -0,0 +1,126 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from predictions.batching import batcher
+from predictions.registry import registry
+from predictions.views import BatchConditionPredictionView, ConditionPredictionView
+
+PATIENT = {
+    "gender": "FEMALE",
+    "age": 47,
+    "bmi": 27.4,
+    "sys_bp": 132,
+    "dia_bp": 84,
+    "heart_rate": 72,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ConditionPredictionView latency when artifacts are reloaded on "
+        "every request (the old behaviour) and when served from the registry, "
+        "then batch endpoint throughput across batch sizes and concurrent "
+        "single-patient throughput with and without micro-batching."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--reload-requests", type=int, default=10)
+        parser.add_argument(
+            "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 5000]
+        )
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--concurrent-requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        view = ConditionPredictionView.as_view()
+        factory = APIRequestFactory()
+
+        def timed_request():
+            request = factory.post("/", PATIENT, format="json")
+            started = time.perf_counter()
+            response = view(request)
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.data
+            return elapsed * 1000
+
+        reload_ms = []
+        for _ in range(options["reload_requests"]):
+            registry.clear()
+            reload_ms.append(timed_request())
+
+        timed_request()  # Warm up the registry
+        warm_ms = [timed_request() for _ in range(options["requests"])]
+
+        for label, samples in (
+            ("reload per request", reload_ms),
+            ("registry", warm_ms),
+        ):
+            q = statistics.quantiles(samples, n=100)
+            self.stdout.write(
+                f"{label:<20} p50 {q[49]:8.2f} ms  p95 {q[94]:8.2f} ms "
+                f"({len(samples)} requests)"
+            )
+
+        batch_view = BatchConditionPredictionView.as_view()
+        for size in options["batch_sizes"]:
+            request = factory.post("/", [PATIENT] * size, format="json")
+            batch_view(request)  # Warm up this batch shape
+            rounds = max(3, 2000 // size)
+            started = time.perf_counter()
+            for _ in range(rounds):
+                request = factory.post("/", [PATIENT] * size, format="json")
+                response = batch_view(request)
+                assert response.status_code == 200, response.data
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"batch {size:>6}: {size * rounds / elapsed:12,.0f} patients/s "
+                f"({elapsed / rounds * 1000:8.2f} ms per request)"
+            )
+
+        for enabled in (False, True):
+            with override_settings(HEALIX_MICROBATCH_ENABLED=enabled):
+                batcher.reset_stats()
+                samples = self.run_concurrently(
+                    timed_request,
+                    options["concurrency"],
+                    options["concurrent_requests"],
+                )
+            elapsed = samples.pop()
+            q = statistics.quantiles(samples, n=100)
+            label = "micro-batched" if enabled else "unbatched"
+            self.stdout.write(
+                f"{label:<14} x{options['concurrency']}: "
+                f"{len(samples) / elapsed:8,.0f} requests/s  "
+                f"p50 {q[49]:8.2f} ms  p95 {q[94]:8.2f} ms"
+            )
+            if enabled:
+                stats = batcher.stats()
+                self.stdout.write(
+                    f"  mean batch {stats['mean_batch_size']:.1f}, "
+                    f"batch sizes {stats['batch_size_histogram']}"
+                )
+
+    def run_concurrently(self, timed_request, threads, requests_per_thread):
+        """Return per-request latencies followed by the total elapsed seconds."""
+        samples = []
+        lock = threading.Lock()
+
+        def worker():
+            mine = [timed_request() for _ in range(requests_per_thread)]
+            with lock:
+                samples.extend(mine)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        samples.append(time.perf_counter() - started)
+        return samples
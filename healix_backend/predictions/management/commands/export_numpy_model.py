@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.engine import UnsupportedModel, export_model
+from predictions.registry import MODELS_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Export a trained Keras model to the .npz format served by the NumPy "
+        "engine and check that both produce the same probabilities."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model-version",
+            help="Model version to export (default: every .keras model).",
+        )
+        parser.add_argument("--models-dir", default=MODELS_DIR)
+        parser.add_argument("--tolerance", type=float, default=1e-5)
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        models_dir = options["models_dir"]
+        if options["model_version"]:
+            names = [f"clinical_model_{options['model_version']}.keras"]
+        else:
+            names = sorted(
+                name for name in os.listdir(models_dir) if name.endswith(".keras")
+            )
+        if not names:
+            raise CommandError("No .keras models to export.")
+
+        for name in names:
+            source = os.path.join(models_dir, name)
+            if not os.path.exists(source):
+                raise CommandError(f"{source} does not exist.")
+            target = source[: -len(".keras")] + ".npz"
+            model = tf.keras.models.load_model(source)
+            try:
+                engine = export_model(model, target)
+            except UnsupportedModel as e:
+                raise CommandError(f"{name}: {e}")
+
+            sample = (
+                np.random.default_rng(0)
+                .normal(size=(256, engine.input_size))
+                .astype(np.float32)
+            )
+            difference = np.abs(
+                model.predict_on_batch(sample) - engine.predict_on_batch(sample)
+            ).max()
+            if difference > options["tolerance"]:
+                os.remove(target)
+                raise CommandError(
+                    f"{name}: NumPy output differs from Keras by {difference:.2e}."
+                )
+            self.stdout.write(
+                f"{os.path.basename(target)}: {os.path.getsize(target):,} bytes, "
+                f"max difference {difference:.2e}"
+            )
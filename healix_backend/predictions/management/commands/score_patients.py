@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from predictions.scoring import score_patients
+
+
+class Command(BaseCommand):
+    help = (
+        "Score every stored patient with the current model and store the "
+        "likelihoods; patients whose vitals are unchanged are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-score patients whose vitals have not changed.",
+        )
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"{stats.patients:,} patients read, {stats.scored:,} scored"
+                )
+
+        stats = score_patients(
+            chunk_size=options["chunk_size"],
+            force=options["force"],
+            progress=progress,
+        )
+        result = stats.as_dict()
+        self.stdout.write(
+            f"Model {result['model_version']}: {result['patients']:,} patients, "
+            f"{result['scored']:,} scored, {result['unchanged']:,} unchanged, "
+            f"{result['skipped']:,} skipped in {result['seconds']:.2f} s"
+        )
@@ -0,0 +1,95 @@
+# Generated by Django 5.1.5 on 2026-10-17 06:31
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("datasets", "0004_natural_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoringRun",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                    ),
+                ),
+                ("force", models.BooleanField(default=False)),
+                ("model_version", models.CharField(blank=True, max_length=20)),
+                ("patients", models.IntegerField(default=0)),
+                ("scored", models.IntegerField(default=0)),
+                ("unchanged", models.IntegerField(default=0)),
+                ("skipped", models.IntegerField(default=0)),
+                ("errors", models.JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RiskScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model_version", models.CharField(max_length=20)),
+                ("condition", models.CharField(max_length=255)),
+                ("likelihood", models.FloatField()),
+                ("vitals_hash", models.CharField(max_length=16)),
+                ("scored_at", models.DateTimeField()),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="risk_scores",
+                        to="datasets.patient",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["model_version", "condition", "-likelihood", "patient"],
+                        name="risk_score_top_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("patient", "model_version", "condition"),
+                        name="unique_risk_score",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-17 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("predictions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scoringrun",
+            name="owner_host",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="scoringrun",
+            name="owner_pid",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
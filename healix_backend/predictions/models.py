@@ -1,3 +1,78 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+from datasets.models import Patient
+
+
+class RiskScore(models.Model):
+    """
+    Stored likelihood of one condition for one patient under one model version.
+    """
+
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="risk_scores"
+    )
+    model_version = models.CharField(max_length=20)
+    condition = models.CharField(max_length=255)
+    likelihood = models.FloatField()
+    # Hash of the model inputs the score was computed from; a patient is only
+    # re-scored when it changes
+    vitals_hash = models.CharField(max_length=16)
+    scored_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient", "model_version", "condition"],
+                name="unique_risk_score",
+            ),
+        ]
+        indexes = [
+            # Serves "top N patients for a condition" as an index range scan
+            models.Index(
+                fields=["model_version", "condition", "-likelihood", "patient"],
+                name="risk_score_top_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.condition} risk {self.likelihood:.3f} for Patient {self.patient_id}"
+        )
+
+
+class ScoringRun(models.Model):
+    """
+    One population scoring pass triggered through the API, polled for progress.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    force = models.BooleanField(default=False)
+    model_version = models.CharField(max_length=20, blank=True)
+    patients = models.IntegerField(default=0)
+    scored = models.IntegerField(default=0)
+    unchanged = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    errors = models.JSONField(null=True, blank=True)
+    # Host and process that queued the run; its worker pool dies with them
+    owner_host = models.CharField(max_length=255, blank=True)
+    owner_pid = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Scoring run {self.id} ({self.status})"
@@ -0,0 +1,184 @@
+"""
+Process-wide registry of the trained prediction artifacts.
+
+The Keras model, the fitted scaler and the condition names are loaded once per
+process and shared by every request. The registry re-checks the artifact files
+at most every ``HEALIX_MODEL_CHECK_INTERVAL`` seconds and reloads them when a
+newer model version appears or a file's mtime changes, so retrained models can
+be dropped into ``predictions/models`` without a restart.
+
+Each version can be served by Keras (``clinical_model_<version>.keras``) or by
+the NumPy engine (``clinical_model_<version>.npz``, see ``engine.py``).
+``HEALIX_MODEL_ENGINE`` picks one; the default ``"auto"`` prefers the NumPy
+export when it exists so TensorFlow is never imported by the web workers.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from healix_backend import metrics
+from healix_backend.lazy import lazy_import
+
+from .engine import NumpyModel
+
+joblib = lazy_import("joblib")
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
+MODEL_FILE_RE = re.compile(r"^clinical_model_(\d{8}_\d{6})\.(keras|npz)$")
+SCALER_FILE = "standard_scaler.pkl"
+DEFAULT_CHECK_INTERVAL = 5.0
+ENGINES = ("auto", "numpy", "keras")
+
+
+class ArtifactNotFound(Exception):
+    """Raised when a required model artifact is missing on disk."""
+
+
+class ModelArtifacts:
+    """
+    One loaded model version: model (Keras or ``NumpyModel``), scaler and
+    ordered condition names.
+    """
+
+    def __init__(self, version, model, scaler, condition_names, signature, engine):
+        self.version = version
+        self.engine = engine
+        self.model = model
+        self.scaler = scaler
+        self.condition_names = condition_names
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def predict(self, features):
+        """Return condition probabilities for a 2-D float32 feature array."""
+        # predict_on_batch skips the dataset/callback machinery of predict(),
+        # which dominates latency for the small batches served here
+        return self.model.predict_on_batch(features)
+
+
+class ModelRegistry:
+    """
+    Thread-safe, lazily loaded holder of the current ``ModelArtifacts``.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, check_interval=None):
+        self.models_dir = models_dir
+        self.check_interval = check_interval
+        self._artifacts = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_check_interval(self):
+        if self.check_interval is not None:
+            return self.check_interval
+        return getattr(settings, "HEALIX_MODEL_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL)
+
+    def get(self):
+        """Return the loaded artifacts, loading or hot-reloading them if needed."""
+        artifacts = self._artifacts
+        if (
+            artifacts is not None
+            and time.monotonic() - self._checked_at < self.get_check_interval()
+        ):
+            return artifacts
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if (
+                self._artifacts is not None
+                and time.monotonic() - self._checked_at < self.get_check_interval()
+            ):
+                return self._artifacts
+            paths = self.artifact_paths()
+            signature = self.signature(paths)
+            if self._artifacts is None or self._artifacts.signature != signature:
+                self._artifacts = self.load(paths, signature)
+            self._checked_at = time.monotonic()
+            return self._artifacts
+
+    def clear(self):
+        """Drop the loaded artifacts so the next ``get`` loads them again."""
+        with self._lock:
+            self._artifacts = None
+            self._checked_at = 0.0
+
+    def get_engine(self):
+        engine = getattr(settings, "HEALIX_MODEL_ENGINE", "auto")
+        if engine not in ENGINES:
+            raise ValueError(f"HEALIX_MODEL_ENGINE must be one of {ENGINES}.")
+        return engine
+
+    def artifact_paths(self):
+        """
+        Locate the newest model (or ``HEALIX_MODEL_VERSION`` if set) for the
+        configured engine with its matching condition names file and the scaler.
+        """
+        if not os.path.isdir(self.models_dir):
+            raise ArtifactNotFound("Pre-trained model not found.")
+        engine = self.get_engine()
+        available = {}
+        for match in map(MODEL_FILE_RE.match, os.listdir(self.models_dir)):
+            if match:
+                available.setdefault(match.group(1), set()).add(match.group(2))
+        if engine != "auto":
+            suffix = "npz" if engine == "numpy" else "keras"
+            available = {v: s for v, s in available.items() if suffix in s}
+        versions = sorted(available)
+        version = getattr(settings, "HEALIX_MODEL_VERSION", None) or (
+            versions[-1] if versions else None
+        )
+        if version not in available:
+            raise ArtifactNotFound("Pre-trained model not found.")
+        suffix = "npz" if "npz" in available[version] and engine != "keras" else "keras"
+        paths = {
+            "version": version,
+            "engine": "numpy" if suffix == "npz" else "keras",
+            "model": os.path.join(
+                self.models_dir, f"clinical_model_{version}.{suffix}"
+            ),
+            "condition_names": os.path.join(
+                self.models_dir, f"condition_names_{version}.json"
+            ),
+            "scaler": os.path.join(self.models_dir, SCALER_FILE),
+        }
+        if not os.path.exists(paths["condition_names"]):
+            raise ArtifactNotFound("Condition names file not found.")
+        if not os.path.exists(paths["scaler"]):
+            raise ArtifactNotFound("Scaler file not found.")
+        return paths
+
+    def signature(self, paths):
+        """Version, engine and file mtimes; any change triggers a reload."""
+        return (paths["version"], paths["engine"]) + tuple(
+            os.stat(paths[name]).st_mtime_ns
+            for name in ("model", "condition_names", "scaler")
+        )
+
+    def load(self, paths, signature):
+        # Timed here rather than around get(), which is almost always a hit
+        with metrics.timed(metrics.PREDICTION_SECONDS, stage="model_load"):
+            if paths["engine"] == "numpy":
+                model = NumpyModel.load(paths["model"])
+            else:
+                # Deferred so workers serving the NumPy export never import it
+                import tensorflow as tf
+
+                model = tf.keras.models.load_model(paths["model"])
+            scaler = joblib.load(paths["scaler"])
+            with open(paths["condition_names"], "r") as f:
+                condition_names = json.load(f)
+        return ModelArtifacts(
+            paths["version"],
+            model,
+            scaler,
+            condition_names,
+            signature,
+            paths["engine"],
+        )
+
+
+registry = ModelRegistry()
@@ -0,0 +1,262 @@
+"""
+Population-wide risk scoring.
+
+``score_patients`` walks the ``Patient`` table in primary-key order, one chunk
+at a time, builds the feature matrix for the whole chunk and scores it with a
+single forward pass. Likelihoods are upserted into ``RiskScore`` (one row per
+patient, model version and condition). Each row carries a hash of the model
+inputs, so later runs skip patients whose vitals have not changed since they
+were last scored under the same model version.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from django.dispatch import receiver
+
+from datasets.models import Patient
+from datasets.signals import worker_pool_started
+from healix_backend.lazy import lazy_import
+from insights.aggregates import upsert_rows
+
+from .features import (
+    GENDER_ALIASES,
+    NUMERICAL_COLUMNS,
+    REQUIRED_FIELDS,
+    prepare_features,
+)
+from .models import RiskScore, ScoringRun
+from .registry import registry
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class ScoringStats:
+    """
+    Running totals for one scoring pass.
+    """
+
+    def __init__(self, model_version):
+        self.model_version = model_version
+        self.patients = 0
+        self.scored = 0
+        self.unchanged = 0  # Vitals identical to the stored scores
+        self.skipped = 0  # Patients missing a model input
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def seconds(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def as_dict(self):
+        return {
+            "model_version": self.model_version,
+            "patients": self.patients,
+            "scored": self.scored,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def vitals_hash(frame):
+    """Stable 16-hex-digit hash of each row's model inputs."""
+    inputs = frame[REQUIRED_FIELDS].copy()
+    # Integer and float columns hash differently; a chunk with a missing age
+    # must not change the hash of every other patient in it
+    inputs[NUMERICAL_COLUMNS] = inputs[NUMERICAL_COLUMNS].astype("float64")
+    hashes = pd.util.hash_pandas_object(inputs, index=False)
+    return hashes.map("{:016x}".format)
+
+
+def load_chunk(after, chunk_size):
+    """Next ``chunk_size`` patients with an ID greater than ``after``."""
+    queryset = Patient.objects.order_by("id").values_list("id", *REQUIRED_FIELDS)
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    frame = pd.DataFrame.from_records(
+        list(queryset[:chunk_size]), columns=["patient_id"] + REQUIRED_FIELDS
+    )
+    frame["gender"] = frame["gender"].replace(GENDER_ALIASES)
+    return frame
+
+
+def score_patients(chunk_size=None, force=False, progress=None):
+    """
+    Score every patient with the current model and store the likelihoods.
+    ``force`` re-scores patients whose vitals are unchanged; ``progress`` is
+    called with the running ``ScoringStats`` after each chunk.
+    """
+    chunk_size = chunk_size or getattr(
+        settings, "HEALIX_SCORING_CHUNK_SIZE", DEFAULT_CHUNK_SIZE
+    )
+    artifacts = registry.get()
+    names = artifacts.condition_names
+    stats = ScoringStats(artifacts.version)
+    scores = RiskScore.objects.filter(model_version=artifacts.version)
+
+    after = None
+    while True:
+        frame = load_chunk(after, chunk_size)
+        if frame.empty:
+            break
+        after = frame["patient_id"].iloc[-1]
+        stats.patients += len(frame)
+
+        incomplete = frame[REQUIRED_FIELDS].isna().any(axis=1)
+        stats.skipped += int(incomplete.sum())
+        stale = frame.loc[incomplete, "patient_id"].tolist()
+        frame = frame[~incomplete].reset_index(drop=True)
+        frame["vitals_hash"] = vitals_hash(frame) if len(frame) else []
+
+        if not force and len(frame):
+            # All conditions of a patient are written together, so one row
+            # per patient tells whether its vitals changed
+            stored = dict(
+                scores.filter(
+                    patient_id__in=frame["patient_id"].tolist(), condition=names[0]
+                ).values_list("patient_id", "vitals_hash")
+            )
+            unchanged = frame["patient_id"].map(stored).eq(frame["vitals_hash"])
+            stats.unchanged += int(unchanged.sum())
+            frame = frame[~unchanged].reset_index(drop=True)
+
+        with transaction.atomic():
+            if stale:
+                # Vitals were removed since the last run
+                scores.filter(patient_id__in=stale).delete()
+            if len(frame):
+                write_scores(frame, artifacts)
+        stats.scored += len(frame)
+        if progress is not None:
+            progress(stats)
+    return stats.finish()
+
+
+def write_scores(frame, artifacts):
+    """Upsert the likelihoods of every condition for the patients in ``frame``."""
+    probabilities = artifacts.predict(prepare_features(frame, artifacts.scaler))
+    names = artifacts.condition_names
+    now = timezone.now()
+    # One row per patient and condition, built column-wise
+    patient_ids = np.repeat(frame["patient_id"].to_numpy(), len(names)).tolist()
+    hashes = np.repeat(frame["vitals_hash"].to_numpy(), len(names)).tolist()
+    conditions = names * len(frame)
+    likelihoods = probabilities.ravel().tolist()
+
+    if connection.vendor not in ("postgresql", "sqlite"):
+        RiskScore.objects.bulk_create(
+            [
+                RiskScore(
+                    patient_id=patient_id,
+                    model_version=artifacts.version,
+                    condition=condition,
+                    likelihood=likelihood,
+                    vitals_hash=digest,
+                    scored_at=now,
+                )
+                for patient_id, condition, likelihood, digest in zip(
+                    patient_ids, conditions, likelihoods, hashes
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["patient", "model_version", "condition"],
+            update_fields=["likelihood", "vitals_hash", "scored_at"],
+        )
+        return
+
+    # Building hundreds of thousands of model instances costs far more than
+    # the insert itself, so both supported backends get a raw
+    # INSERT ... ON CONFLICT with plain tuples.
+    scored_at = connection.ops.adapt_datetimefield_value(now)
+    upsert_rows(
+        RiskScore,
+        ["patient", "model_version", "condition"],
+        ["likelihood", "vitals_hash", "scored_at"],
+        [
+            (patient_id, artifacts.version, condition, likelihood, digest, scored_at)
+            for patient_id, condition, likelihood, digest in zip(
+                patient_ids, conditions, likelihoods, hashes
+            )
+        ],
+        page_size=getattr(settings, "HEALIX_INGEST_BATCH_SIZE", 5000),
+    )
+
+
+def enqueue(force=False):
+    """
+    Record a ``ScoringRun`` and execute it on the dataset ingestion worker
+    pool (see ``datasets.jobs.get_executor``).
+    """
+    from datasets.jobs import get_executor, owner
+
+    run = ScoringRun.objects.create(force=force, **owner())
+    executor = get_executor()
+    if executor is None:
+        run_scoring(str(run.id))
+    else:
+        run_id = str(run.id)
+        transaction.on_commit(lambda: executor.submit(run_scoring, run_id))
+    return run
+
+
+@receiver(worker_pool_started)
+def fail_orphaned_runs(sender, **kwargs):
+    """
+    Mark queued or running scoring runs of this host whose owning process has
+    exited as failed, as ``datasets.jobs`` does for ingestion jobs.
+    """
+    from datasets.jobs import orphaned
+
+    runs = orphaned(
+        ScoringRun.objects.filter(status__in=[ScoringRun.QUEUED, ScoringRun.RUNNING])
+    )
+    ScoringRun.objects.filter(pk__in=[run.pk for run in runs]).update(
+        status=ScoringRun.FAILED,
+        errors={"error": "The server stopped before the run finished."},
+        finished_at=timezone.now(),
+    )
+    return len(runs)
+
+
+def run_scoring(run_id):
+    """Execute scoring run ``run_id``; runs inside a pool worker."""
+    run = ScoringRun.objects.get(pk=run_id)
+    run.status = ScoringRun.RUNNING
+    run.started_at = timezone.now()
+    run.save(update_fields=["status", "started_at"])
+
+    def progress(stats):
+        ScoringRun.objects.filter(pk=run.pk).update(
+            model_version=stats.model_version,
+            patients=stats.patients,
+            scored=stats.scored,
+            unchanged=stats.unchanged,
+            skipped=stats.skipped,
+        )
+
+    try:
+        try:
+            stats = score_patients(force=run.force, progress=progress)
+            progress(stats)
+            status, errors = ScoringRun.SUCCEEDED, None
+        except Exception as e:
+            status, errors = ScoringRun.FAILED, {"error": str(e)}
+        ScoringRun.objects.filter(pk=run.pk).update(
+            status=status, errors=errors, finished_at=timezone.now()
+        )
+    finally:
+        if getattr(settings, "HEALIX_INGEST_EXECUTOR", "process") != "inline":
+            connection.close()
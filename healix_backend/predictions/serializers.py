@@ -0,0 +1,8 @@
+from rest_framework import serializers
+from .models import ScoringRun
+
+
+class ScoringRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScoringRun
+        exclude = ["owner_host", "owner_pid"]
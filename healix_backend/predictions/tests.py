@@ -1,3 +1,535 @@
-from django.test import TestCase
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from datasets.models import Patient
+from datasets.signals import worker_pool_started
+from healix_backend import metrics
+
+try:
+    import tensorflow as tf
+except ImportError:  # The NumPy engine does not need it
+    tf = None
+from .batching import FeatureError, MicroBatcher, histogram_bucket
+from .engine import NumpyModel, UnsupportedModel, export_model, sigmoid
+from .features import FEATURE_COLUMNS, prepare_features
+from .models import RiskScore, ScoringRun
+from .scoring import score_patients
+from .registry import MODELS_DIR, ArtifactNotFound, ModelRegistry, registry
+
+PATIENT = {
+    "gender": "MALE",
+    "age": 54,
+    "bmi": 31.5,
+    "sys_bp": 150,
+    "dia_bp": 95,
+    "heart_rate": 80,
+}
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.models_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.models_dir)
+        for name in os.listdir(MODELS_DIR):
+            shutil.copy2(os.path.join(MODELS_DIR, name), self.models_dir)
+        self.registry = ModelRegistry(self.models_dir, check_interval=0)
+
+    def test_artifacts_load_once(self):
+        with mock.patch.object(ModelRegistry, "load", wraps=self.registry.load) as load:
+            first = self.registry.get()
+            second = self.registry.get()
+        self.assertIs(first, second)
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(first.version, "20250127_011852")
+        self.assertEqual(len(first.condition_names), 14)
+
+    def test_reloads_when_a_file_changes(self):
+        first = self.registry.get()
+        names = os.path.join(self.models_dir, "condition_names_20250127_011852.json")
+        stat = os.stat(names)
+        os.utime(names, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNot(self.registry.get(), first)
+
+    def test_check_interval_throttles_stat_calls(self):
+        cached = ModelRegistry(self.models_dir, check_interval=3600)
+        first = cached.get()
+        with mock.patch.object(ModelRegistry, "artifact_paths") as paths:
+            self.assertIs(cached.get(), first)
+        paths.assert_not_called()
+
+    def test_concurrent_first_requests_load_once(self):
+        results = []
+        with mock.patch.object(ModelRegistry, "load", wraps=self.registry.load) as load:
+            threads = [
+                threading.Thread(target=lambda: results.append(self.registry.get()))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(len({id(artifacts) for artifacts in results}), 1)
+
+    def test_missing_model(self):
+        for suffix in ("keras", "npz"):
+            os.remove(
+                os.path.join(
+                    self.models_dir, f"clinical_model_20250127_011852.{suffix}"
+                )
+            )
+        with self.assertRaisesMessage(ArtifactNotFound, "Pre-trained model not found."):
+            self.registry.get()
+
+
+class ConditionPredictionViewTests(SimpleTestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_predicts_all_conditions(self):
+        response = self.client.post(
+            "/api/predictions/predict-condition/", PATIENT, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        predictions = response.data["predictions"]
+        self.assertEqual(
+            [p["condition"] for p in predictions], registry.get().condition_names
+        )
+        self.assertTrue(all(0.0 <= p["likelihood"] <= 1.0 for p in predictions))
+
+    def test_missing_fields(self):
+        response = self.client.post(
+            "/api/predictions/predict-condition/", {"age": 40}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(HEALIX_METRICS_ENABLED=True)
+    def test_records_stage_timings(self):
+        metrics.reset()
+        registry.clear()
+        for _ in range(2):
+            self.client.post(
+                "/api/predictions/predict-condition/", PATIENT, format="json"
+            )
+        # Only the first request loaded the model
+        self.assertEqual(metrics.PREDICTION_SECONDS.count(stage="model_load"), 1)
+        for stage in ("features", "inference"):
+            self.assertEqual(metrics.PREDICTION_SECONDS.count(stage=stage), 2)
+
+    @override_settings(HEALIX_METRICS_ENABLED=True, HEALIX_MICROBATCH_ENABLED=True)
+    def test_micro_batches_record_model_loads(self):
+        metrics.reset()
+        registry.clear()
+        response = self.client.post(
+            "/api/predictions/predict-condition/", PATIENT, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.PREDICTION_SECONDS.count(stage="model_load"), 1)
+
+
+def reference_features(patient_data, scaler):
+    """The original single-row preprocessing, kept as the parity oracle."""
+    df = pd.DataFrame([patient_data])
+    df["bp_category"] = pd.cut(
+        df["sys_bp"],
+        bins=[0, 120, 140, 180, 300],
+        labels=["normal", "hypertensive", "severe", "crisis"],
+    ).astype(str)
+    df = pd.get_dummies(df, columns=["gender", "bp_category"])
+    for col in FEATURE_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0
+    features_df = df[FEATURE_COLUMNS].copy()
+    numerical_cols = FEATURE_COLUMNS[:5]
+    features_df[numerical_cols] = scaler.transform(features_df[numerical_cols])
+    return features_df.values.astype(np.float32)
+
+
+class PrepareFeaturesTests(SimpleTestCase):
+    def test_matches_single_row_preprocessing(self):
+        scaler = registry.get().scaler
+        rng = np.random.default_rng(3)
+        patients = [
+            {
+                "gender": gender,
+                "age": int(rng.integers(1, 95)),
+                "bmi": float(rng.uniform(15, 45)),
+                "sys_bp": sys_bp,
+                "dia_bp": float(rng.uniform(50, 120)),
+                "heart_rate": float(rng.uniform(45, 130)),
+            }
+            for gender, sys_bp in zip(
+                ["MALE", "FEMALE", "OTHER"] * 5,
+                [
+                    0,
+                    1,
+                    119.9,
+                    120,
+                    120.1,
+                    139,
+                    140,
+                    141,
+                    179,
+                    180,
+                    181,
+                    299,
+                    300,
+                    301,
+                    -5,
+                ],
+            )
+        ]
+        batch = prepare_features(pd.DataFrame(patients), scaler)
+        expected = np.vstack([reference_features(p, scaler) for p in patients])
+        np.testing.assert_allclose(batch, expected, rtol=1e-6)
+
+
+class BatchConditionPredictionViewTests(TestCase):
+    url = "/api/predictions/predict-condition/batch/"
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_json_array_matches_single_predictions(self):
+        patients = [PATIENT, {**PATIENT, "gender": "FEMALE", "sys_bp": 110, "id": "x"}]
+        response = self.client.post(self.url, patients, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        results = response.data["results"]
+        self.assertEqual([r["patient_id"] for r in results], [None, "x"])
+        for patient, result in zip(patients, results):
+            single = self.client.post(
+                "/api/predictions/predict-condition/", patient, format="json"
+            ).data["predictions"]
+            for item in single:
+                self.assertAlmostEqual(
+                    result["likelihoods"][item["condition"]],
+                    item["likelihood"],
+                    places=5,
+                )
+
+    def test_stored_patient_ids(self):
+        Patient.objects.create(
+            id="p1", gender="M", age=60, bmi=30.0, sys_bp=150, dia_bp=90, heart_rate=75
+        )
+        Patient.objects.create(id="p2", gender="F", age=30)
+        response = self.client.post(
+            self.url, {"patient_ids": ["p1", "p2", "p3"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([r["patient_id"] for r in response.data["results"]], ["p1"])
+        self.assertEqual(
+            response.data["skipped"],
+            [
+                {"patient_id": "p3", "reason": "not found"},
+                {"patient_id": "p2", "reason": "missing vitals"},
+            ],
+        )
+
+    def test_incomplete_records_rejected(self):
+        response = self.client.post(
+            self.url, {"patients": [PATIENT, {"age": 3}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["invalid_indices"], [1])
+
+    def test_non_numeric_vitals_rejected(self):
+        patients = [
+            PATIENT,
+            {**PATIENT, "bmi": None},
+            {**PATIENT, "sys_bp": "high"},
+            {**PATIENT, "age": "54"},
+        ]
+        response = self.client.post(self.url, {"patients": patients}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["invalid_indices"], [1, 2])
+
+    @override_settings(HEALIX_PREDICTION_MAX_BATCH=2)
+    def test_oversized_batch_rejected_before_querying(self):
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                self.url, {"patient_ids": ["p1", "p2", "p3"]}, format="json"
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("limited to 2", response.data["error"])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def predict_concurrently(self, batcher, patients):
+        results = [None] * len(patients)
+
+        def worker(index):
+            results[index] = batcher.predict(patients[index])
+
+        threads = [
+            threading.Thread(target=worker, args=(i,)) for i in range(len(patients))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_a_forward_pass(self):
+        artifacts = registry.get()
+        batcher = MicroBatcher(max_wait_ms=200, max_size=8)
+        patients = [{**PATIENT, "age": 30 + i} for i in range(8)]
+        with mock.patch.object(
+            artifacts, "predict", wraps=artifacts.predict
+        ) as predict:
+            results = self.predict_concurrently(batcher, patients)
+        self.assertLess(predict.call_count, len(patients))
+        stats = batcher.stats()
+        self.assertEqual(stats["requests"], 8)
+        self.assertEqual(stats["batches"], predict.call_count)
+
+        expected = artifacts.predict(
+            prepare_features(pd.DataFrame(patients), artifacts.scaler)
+        )
+        for (row, served_by), expected_row in zip(results, expected):
+            self.assertIs(served_by, artifacts)
+            np.testing.assert_allclose(row, expected_row, rtol=1e-5, atol=1e-6)
+
+    def test_full_batch_is_not_held_back(self):
+        batcher = MicroBatcher(max_wait_ms=10_000, max_size=1)
+        started = time.monotonic()
+        batcher.predict(PATIENT)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(batcher.stats()["batch_size_histogram"], {"1": 1})
+
+    def test_bad_record_fails_alone(self):
+        batcher = MicroBatcher(max_wait_ms=200, max_size=2)
+        good = batcher.submit(PATIENT)
+        bad = batcher.submit({**PATIENT, "age": "unknown"})
+        row, _ = good.result(timeout=30)
+        self.assertEqual(len(row), len(registry.get().condition_names))
+        with self.assertRaises(FeatureError):
+            bad.result(timeout=30)
+
+    def test_histogram_buckets(self):
+        self.assertEqual(
+            [histogram_bucket(n) for n in (1, 2, 3, 4, 5, 64, 65)],
+            [1, 2, 4, 4, 8, 64, 128],
+        )
+
+    @override_settings(HEALIX_MICROBATCH_ENABLED=True)
+    def test_view_uses_batcher(self):
+        client = APIClient()
+        direct = registry.get().predict(
+            prepare_features(pd.DataFrame([PATIENT]), registry.get().scaler)
+        )[0]
+        response = client.post(
+            "/api/predictions/predict-condition/", PATIENT, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        np.testing.assert_allclose(
+            [p["likelihood"] for p in response.data["predictions"]],
+            direct,
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+        response = client.post(
+            "/api/predictions/predict-condition/",
+            {**PATIENT, "bmi": "n/a"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        stats = client.get("/api/predictions/predict-condition/batching-stats/")
+        self.assertEqual(stats.status_code, 200)
+        self.assertTrue(stats.data["enabled"])
+        self.assertGreaterEqual(stats.data["requests"], 2)
+
+
+class NumpyEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.models_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.models_dir)
+        for name in os.listdir(MODELS_DIR):
+            shutil.copy2(os.path.join(MODELS_DIR, name), self.models_dir)
+
+    def test_auto_prefers_numpy_export(self):
+        artifacts = ModelRegistry(self.models_dir, check_interval=0).get()
+        self.assertEqual(artifacts.engine, "numpy")
+        self.assertIsInstance(artifacts.model, NumpyModel)
+
+    def test_engine_setting(self):
+        with override_settings(HEALIX_MODEL_ENGINE="keras"):
+            os.remove(
+                os.path.join(self.models_dir, "clinical_model_20250127_011852.keras")
+            )
+            with self.assertRaises(ArtifactNotFound):
+                ModelRegistry(self.models_dir, check_interval=0).get()
+
+    def test_save_load_round_trip(self):
+        rng = np.random.default_rng(1)
+        model = NumpyModel(
+            [
+                (rng.normal(size=(11, 4)), rng.normal(size=4), "relu"),
+                (rng.normal(size=(4, 3)), rng.normal(size=3), "sigmoid"),
+            ]
+        )
+        path = os.path.join(self.models_dir, "round_trip.npz")
+        model.save(path)
+        features = rng.normal(size=(5, 11)).astype(np.float32)
+        np.testing.assert_array_equal(
+            NumpyModel.load(path).predict_on_batch(features),
+            model.predict_on_batch(features),
+        )
+
+    def test_sigmoid_is_stable(self):
+        with np.errstate(over="raise"):
+            values = sigmoid(np.array([-1000.0, 0.0, 1000.0], dtype=np.float32))
+        np.testing.assert_allclose(values, [0.0, 0.5, 1.0])
+
+    def test_unsupported_activation(self):
+        with self.assertRaises(UnsupportedModel):
+            NumpyModel([(np.zeros((11, 2)), np.zeros(2), "gelu")])
+
+    @unittest.skipIf(tf is None, "TensorFlow is not installed")
+    def test_matches_keras(self):
+        keras_model = tf.keras.models.load_model(
+            os.path.join(MODELS_DIR, "clinical_model_20250127_011852.keras")
+        )
+        engine = export_model(
+            keras_model, os.path.join(self.models_dir, "exported.npz")
+        )
+        shipped = NumpyModel.load(
+            os.path.join(MODELS_DIR, "clinical_model_20250127_011852.npz")
+        )
+        features = np.random.default_rng(2).normal(scale=2, size=(500, 11))
+        features = features.astype(np.float32)
+        expected = keras_model.predict_on_batch(features)
+        np.testing.assert_allclose(
+            engine.predict_on_batch(features), expected, rtol=1e-5, atol=1e-6
+        )
+        np.testing.assert_allclose(
+            shipped.predict_on_batch(features), expected, rtol=1e-5, atol=1e-6
+        )
+
+
+class RiskScoringTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(5):
+            Patient.objects.create(
+                id=f"p{i}",
+                gender="M" if i % 2 else "F",
+                age=40 + i * 8,
+                bmi=24.0 + i * 3,
+                sys_bp=115 + i * 15,
+                dia_bp=75 + i * 5,
+                heart_rate=70 + i,
+            )
+        Patient.objects.create(id="p9", gender="F", age=30)  # No vitals
+        self.artifacts = registry.get()
+
+    def test_scores_every_complete_patient(self):
+        stats = score_patients(chunk_size=2).as_dict()
+        self.assertEqual(
+            (stats["patients"], stats["scored"], stats["skipped"]), (6, 5, 1)
+        )
+        names = self.artifacts.condition_names
+        self.assertEqual(RiskScore.objects.count(), 5 * len(names))
+
+        patient = Patient.objects.get(id="p3")
+        expected = self.artifacts.predict(
+            prepare_features(
+                pd.DataFrame(
+                    [
+                        {
+                            "gender": "MALE",
+                            "age": patient.age,
+                            "bmi": patient.bmi,
+                            "sys_bp": patient.sys_bp,
+                            "dia_bp": patient.dia_bp,
+                            "heart_rate": patient.heart_rate,
+                        }
+                    ]
+                ),
+                self.artifacts.scaler,
+            )
+        )[0]
+        stored = dict(
+            RiskScore.objects.filter(patient_id="p3").values_list(
+                "condition", "likelihood"
+            )
+        )
+        np.testing.assert_allclose(
+            [stored[name] for name in names], expected, rtol=1e-5
+        )
+
+    def test_rescores_only_changed_vitals(self):
+        score_patients()
+        Patient.objects.filter(id="p1").update(sys_bp=185)
+        Patient.objects.filter(id="p2").update(bmi=None)
+        stats = score_patients().as_dict()
+        self.assertEqual((stats["scored"], stats["unchanged"]), (1, 3))
+        self.assertFalse(RiskScore.objects.filter(patient_id="p2").exists())
+
+        self.assertEqual(score_patients(force=True).as_dict()["scored"], 4)
+
+    def test_top_patients(self):
+        score_patients()
+        condition = self.artifacts.condition_names[0]
+        response = self.client.get(
+            "/api/predictions/risk-scores/top/", {"condition": condition, "limit": 3}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        likelihoods = [r["likelihood"] for r in response.data["results"]]
+        self.assertEqual(len(likelihoods), 3)
+        self.assertEqual(likelihoods, sorted(likelihoods, reverse=True))
+        self.assertEqual(
+            likelihoods[0],
+            max(
+                RiskScore.objects.filter(condition=condition).values_list(
+                    "likelihood", flat=True
+                )
+            ),
+        )
+
+        response = self.client.get("/api/predictions/risk-scores/top/")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(HEALIX_INGEST_EXECUTOR="inline")
+    def test_api_trigger(self):
+        response = self.client.post("/api/predictions/risk-scores/runs/")
+        self.assertEqual(response.status_code, 202, response.data)
+        run = ScoringRun.objects.get(pk=response.data["run_id"])
+        self.assertEqual(run.status, ScoringRun.SUCCEEDED, run.errors)
+        self.assertEqual((run.patients, run.scored, run.skipped), (6, 5, 1))
+
+        detail = self.client.get(response.data["status_url"])
+        self.assertEqual(detail.data["status"], ScoringRun.SUCCEEDED)
+
+        response = self.client.post("/api/predictions/risk-scores/runs/?wait=true")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["unchanged"], 5)
+
+    def test_orphaned_runs_are_failed_when_a_pool_starts(self):
+        host = socket.gethostname()
+        # Far above any real PID (pid_max is at most 2**22)
+        exited = ScoringRun.objects.create(
+            status=ScoringRun.RUNNING, owner_host=host, owner_pid=2**30
+        )
+        live = ScoringRun.objects.create(owner_host=host, owner_pid=os.getpid())
+        other_host = ScoringRun.objects.create(owner_host="another-host", owner_pid=1)
+
+        worker_pool_started.send(sender=None)
+        exited.refresh_from_db()
+        self.assertEqual(exited.status, ScoringRun.FAILED)
+        self.assertIsNotNone(exited.errors)
+        for run in (live, other_host):
+            run.refresh_from_db()
+            self.assertEqual(run.status, ScoringRun.QUEUED)
@@ -1,5 +1,12 @@
 from django.urls import path
-from .views import ConditionPredictionView
+from .views import (
+    ConditionPredictionView,
+    BatchConditionPredictionView,
+    MicroBatchStatsView,
+    ScoringRunView,
+    ScoringRunDetailView,
+    TopRiskPatientsView,
+)
 
 urlpatterns = [
     path(
@@ -7,4 +14,21 @@ urlpatterns = [
         ConditionPredictionView.as_view(),
         name="predict-condition",
     ),
+    path(
+        "predict-condition/batch/",
+        BatchConditionPredictionView.as_view(),
+        name="predict-condition-batch",
+    ),
+    path(
+        "predict-condition/batching-stats/",
+        MicroBatchStatsView.as_view(),
+        name="predict-condition-batching-stats",
+    ),
+    path("risk-scores/runs/", ScoringRunView.as_view(), name="risk-score-run"),
+    path(
+        "risk-scores/runs/<uuid:pk>/",
+        ScoringRunDetailView.as_view(),
+        name="risk-score-run-detail",
+    ),
+    path("risk-scores/top/", TopRiskPatientsView.as_view(), name="risk-score-top"),
 ]
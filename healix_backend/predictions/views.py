@@ -2,12 +2,38 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import tensorflow as tf
-import numpy as np
-import pandas as pd
-import os
-import joblib
-import json
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from rest_framework.reverse import reverse
+from datasets.ingestion import parse_bool
+from datasets.models import Patient
+from healix_backend import metrics
+from healix_backend.lazy import lazy_import
+from .batching import FeatureError, batcher
+from .features import (
+    GENDER_ALIASES,
+    NUMERICAL_COLUMNS,
+    REQUIRED_FIELDS,
+    prepare_features,
+)
+from .models import RiskScore, ScoringRun
+from .registry import ArtifactNotFound, registry
+from .serializers import ScoringRunSerializer
+from . import scoring
+
+# Deferred so loading the URLconf does not import them
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+def _number(value):
+    """``value`` as a float, or NaN for nulls and non-numeric values."""
+    if isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
 
 
 class ConditionPredictionView(APIView):
@@ -17,53 +43,57 @@ class ConditionPredictionView(APIView):
 
     def post(self, request):
         patient_data = request.data
-        required_fields = [
-            "gender",
-            "age",
-            "bmi",
-            "sys_bp",
-            "dia_bp",
-            "heart_rate",
-        ]  # Example fields
-        if not all(field in patient_data for field in required_fields):
+        if not all(field in patient_data for field in REQUIRED_FIELDS):
             return Response(
                 {"error": "Missing required patient data fields."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         try:
-            # Load the pre-trained model
-            model_path = os.path.join(
-                os.path.dirname(__file__),
-                "models",
-                "clinical_model_20250127_011852.keras",
-            )
-            if not os.path.exists(model_path):
-                return Response(
-                    {"error": "Pre-trained model not found."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-            model = tf.keras.models.load_model(model_path)
+            if getattr(settings, "HEALIX_MICROBATCH_ENABLED", False):
+                # Concurrent requests share one forward pass; timed including
+                # the wait for the batch
+                try:
+                    with metrics.timed(metrics.PREDICTION_SECONDS, stage="inference"):
+                        row, artifacts = batcher.predict(
+                            {field: patient_data[field] for field in REQUIRED_FIELDS}
+                        )
+                except FeatureError as e:
+                    return Response(
+                        {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+                    )
+                except ArtifactNotFound as e:
+                    return Response(
+                        {"error": str(e)},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    )
+                prediction = [row]
+            else:
+                # Model, scaler and condition names are loaded once per process;
+                # the registry times actual loads as the model_load stage
+                try:
+                    artifacts = registry.get()
+                except ArtifactNotFound as e:
+                    return Response(
+                        {"error": str(e)},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    )
 
-            # Prepare patient features for prediction
-            features = self.prepare_features(patient_data)
-            if features is None:
-                return Response(
-                    {"error": "Error preparing features for prediction."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+                # Prepare patient features for prediction
+                with metrics.timed(metrics.PREDICTION_SECONDS, stage="features"):
+                    features = self.prepare_features(patient_data, artifacts.scaler)
+                if features is None:
+                    return Response(
+                        {"error": "Error preparing features for prediction."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
 
-            # Make prediction
-            prediction = model.predict(features)
+                # Make prediction
+                with metrics.timed(metrics.PREDICTION_SECONDS, stage="inference"):
+                    prediction = artifacts.predict(features)
 
             # Interpret predictions (assuming model outputs probabilities for conditions)
-            condition_names = self.get_condition_names()
-            if condition_names is None:
-                return Response(
-                    {"error": "Condition names file not found."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-
+            condition_names = artifacts.condition_names
             predicted_conditions = [
                 {
                     "condition": condition_names[i],
@@ -72,82 +102,280 @@ class ConditionPredictionView(APIView):
                 for i, prob in enumerate(prediction[0])
             ]
 
-            return Response({"predictions": predicted_conditions})
+            return Response(
+                {
+                    "predictions": predicted_conditions,
+                    "model_version": artifacts.version,
+                }
+            )
 
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def prepare_features(self, patient_data):
+    def prepare_features(self, patient_data, scaler):
         """
         Preprocess and prepare patient data into feature array for model prediction.
         This mirrors the preprocessing done during model training.
         """
         try:
-            # Load the saved scaler
-            scaler_path = os.path.join(
-                os.path.dirname(__file__), "models", "standard_scaler.pkl"
-            )
-            if not os.path.exists(scaler_path):
-                raise FileNotFoundError("Scaler file not found.")
-            scaler = joblib.load(scaler_path)
-
-            # Convert input data to DataFrame
-            df = pd.DataFrame([patient_data])
-
-            # Blood Pressure Category (same logic as training script)
-            df["bp_category"] = pd.cut(
-                df["sys_bp"],
-                bins=[0, 120, 140, 180, 300],
-                labels=["normal", "hypertensive", "severe", "crisis"],
-            ).astype(
-                str
-            )  # Ensure string type for one-hot encoding
-
-            # One-hot encode categorical features
-            df = pd.get_dummies(df, columns=["gender", "bp_category"])
-
-            # Ensure all expected columns are present (match training features)
-            expected_columns = [
-                "age",
-                "bmi",
-                "sys_bp",
-                "dia_bp",
-                "heart_rate",
-                "gender_FEMALE",
-                "gender_MALE",
-                "bp_category_crisis",
-                "bp_category_hypertensive",
-                "bp_category_normal",
-                "bp_category_severe",
-            ]
-            for col in expected_columns:
-                if col not in df.columns:
-                    df[col] = 0  # Add missing columns with 0
+            return prepare_features(pd.DataFrame([patient_data]), scaler)
+        except Exception as e:
+            print(f"Error preparing features: {e}")
+            return None
+
+
+class BatchConditionPredictionView(APIView):
+    """
+    API endpoint to predict condition likelihoods for many patients at once.
 
-            # Select and order features to match model input order
-            feature_cols = expected_columns
-            features_df = df[feature_cols]
+    Accepts a JSON array of patient records, ``{"patients": [...]}``, or
+    ``{"patient_ids": [...]}`` to score stored patients. Features for the whole
+    batch are built in one vectorized pass and scored with a single forward pass.
+    """
 
-            # Scale numerical features using the saved scaler
-            numerical_cols = ["age", "bmi", "sys_bp", "dia_bp", "heart_rate"]
-            features_df[numerical_cols] = scaler.transform(features_df[numerical_cols])
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            data = {"patients": data}
+        max_batch = getattr(settings, "HEALIX_PREDICTION_MAX_BATCH", 10000)
 
-            return features_df.values.astype(np.float32)  # Convert to numpy array
+        if "patient_ids" in data:
+            records, build_frame = data["patient_ids"], self.load_patients
+        elif "patients" in data and isinstance(data["patients"], list):
+            records, build_frame = data["patients"], self.parse_patients
+        else:
+            return Response(
+                {"error": "Provide a list of patients or patient_ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Before any query or parsing
+        if isinstance(records, list) and len(records) > max_batch:
+            return Response(
+                {"error": f"Batch size is limited to {max_batch} patients."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        frame, skipped = build_frame(records)
+        if frame is None:
+            return Response(skipped, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            try:
+                artifacts = registry.get()
+            except ArtifactNotFound as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+            if frame.empty:
+                probabilities = np.empty((0, len(artifacts.condition_names)))
+            else:
+                try:
+                    features = prepare_features(frame, artifacts.scaler)
+                except (TypeError, ValueError) as e:
+                    return Response(
+                        {"error": f"Error preparing features for prediction: {e}"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                probabilities = artifacts.predict(features)
 
+            names = artifacts.condition_names
+            results = [
+                {
+                    "patient_id": patient_id,
+                    "likelihoods": dict(zip(names, row)),
+                }
+                for patient_id, row in zip(
+                    frame["patient_id"].tolist(), probabilities.tolist()
+                )
+            ]
+            return Response(
+                {
+                    "model_version": artifacts.version,
+                    "conditions": names,
+                    "results": results,
+                    "skipped": skipped,
+                }
+            )
         except Exception as e:
-            print(f"Error preparing features: {e}")
-            return None
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-    def get_condition_names(self):
+    def parse_patients(self, patients):
+        """
+        Build the input frame from posted records; all must be complete, with
+        finite numeric vitals.
         """
-        Load condition names from the saved JSON file (condition_names.json) from training.
+        invalid = [
+            index
+            for index, patient in enumerate(patients)
+            if not isinstance(patient, dict)
+            or not all(field in patient for field in REQUIRED_FIELDS)
+        ]
+        if invalid:
+            return None, {
+                "error": "Missing required patient data fields.",
+                "invalid_indices": invalid[:100],
+            }
+        frame = pd.DataFrame.from_records(
+            patients, columns=REQUIRED_FIELDS + ["id"]
+        ).rename(columns={"id": "patient_id"})
+        numeric = frame[NUMERICAL_COLUMNS].map(_number)
+        invalid = np.flatnonzero(~np.isfinite(numeric.to_numpy()).all(axis=1))
+        if len(invalid):
+            return None, {
+                "error": "Patient vitals must be numbers.",
+                "invalid_indices": invalid[:100].tolist(),
+            }
+        frame[NUMERICAL_COLUMNS] = numeric
+        frame["patient_id"] = frame["patient_id"].astype(object)
+        frame["patient_id"] = frame["patient_id"].where(
+            frame["patient_id"].notna(), None
+        )
+        return frame, []
+
+    def load_patients(self, patient_ids):
         """
-        condition_names_path = os.path.join(
-            os.path.dirname(__file__), "models", "condition_names_20250127_011852.json"
+        Build the input frame from stored patients with one query. Patients
+        that do not exist or lack vitals are returned in ``skipped``.
+        """
+        if not isinstance(patient_ids, list):
+            return None, {"error": "patient_ids must be a list."}
+        ids = list(dict.fromkeys(str(patient_id) for patient_id in patient_ids))
+        frame = pd.DataFrame.from_records(
+            Patient.objects.filter(id__in=ids).values_list("id", *REQUIRED_FIELDS),
+            columns=["patient_id"] + REQUIRED_FIELDS,
+        )
+        frame["gender"] = frame["gender"].replace(GENDER_ALIASES)
+        incomplete = frame[REQUIRED_FIELDS].isna().any(axis=1)
+        found = set(frame["patient_id"])
+        skipped = [
+            {"patient_id": patient_id, "reason": "not found"}
+            for patient_id in ids
+            if patient_id not in found
+        ] + [
+            {"patient_id": patient_id, "reason": "missing vitals"}
+            for patient_id in frame.loc[incomplete, "patient_id"]
+        ]
+        return frame[~incomplete].reset_index(drop=True), skipped
+
+
+class MicroBatchStatsView(APIView):
+    """
+    Queue depth and batch-size histograms of the single-prediction micro-batcher.
+    """
+
+    def get(self, request):
+        return Response(
+            {
+                "enabled": getattr(settings, "HEALIX_MICROBATCH_ENABLED", False),
+                **batcher.stats(),
+            }
+        )
+
+
+class ScoringRunView(APIView):
+    """
+    Trigger a population scoring pass over every stored patient.
+
+    Runs are queued on the background worker pool and answered with 202 and a
+    run ID; pass ``?wait=true`` to score within the request instead, and
+    ``?force=true`` to re-score patients whose vitals have not changed.
+    """
+
+    def post(self, request):
+        params = request.query_params
+        force = parse_bool(params.get("force"), default=False)
+        wait = parse_bool(
+            params.get("wait"),
+            default=not getattr(settings, "HEALIX_SCORING_ASYNC", True),
+        )
+        try:
+            if wait:
+                stats = scoring.score_patients(force=force)
+                return Response(stats.as_dict(), status=status.HTTP_201_CREATED)
+            run = scoring.enqueue(force=force)
+        except ArtifactNotFound as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(
+            {
+                "status": "Scoring queued.",
+                "run_id": str(run.id),
+                "status_url": reverse(
+                    "risk-score-run-detail", args=[run.id], request=request
+                ),
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class ScoringRunDetailView(APIView):
+    """
+    Status and counters of a scoring run.
+    """
+
+    def get(self, request, pk):
+        run = get_object_or_404(ScoringRun, pk=pk)
+        return Response(ScoringRunSerializer(run).data)
+
+
+class TopRiskPatientsView(APIView):
+    """
+    The ``limit`` patients most at risk of ``condition`` under the current
+    model version (or ``model_version``), read from the stored risk scores.
+    """
+
+    def get(self, request):
+        condition = request.query_params.get("condition")
+        if not condition:
+            return Response(
+                {"error": "Condition is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_limit = getattr(settings, "HEALIX_TOP_RISK_MAX_LIMIT", 1000)
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            return Response(
+                {"error": "limit must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= limit <= max_limit:
+            return Response(
+                {"error": f"limit must be between 1 and {max_limit}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        model_version = request.query_params.get("model_version")
+        if not model_version:
+            try:
+                model_version = registry.get().version
+            except ArtifactNotFound as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+
+        # Ordered range scan of risk_score_top_idx
+        scores = RiskScore.objects.filter(
+            model_version=model_version, condition=condition
+        ).order_by("-likelihood", "patient_id")[:limit]
+        return Response(
+            {
+                "model_version": model_version,
+                "condition": condition,
+                "results": list(
+                    scores.values(
+                        "patient_id",
+                        "likelihood",
+                        "scored_at",
+                        "patient__gender",
+                        "patient__age",
+                    )
+                ),
+            }
         )
-        if os.path.exists(condition_names_path):
-            with open(condition_names_path, "r") as f:
-                return json.load(f)
-        return None